@@ -6,9 +6,8 @@ Budget API 路由
 from flask import Blueprint, request, jsonify
 from app.database import db
 from app.models.budget import Budget
-from app.models.transaction import Transaction
+from app.services.budget_service import budget_spend
 from datetime import datetime
-from sqlalchemy import func
 
 # 建立 Blueprint
 budget_bp = Blueprint('budgets', __name__, url_prefix='/api/budgets')
@@ -31,16 +30,7 @@ def get_budget(id):
     budget = Budget.query.get_or_404(id)
     
     # 計算此預算的已使用金額
-    spent = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.category_id == budget.category_id,
-        Transaction.type == 'expense',
-        Transaction.date >= budget.start_date
-    )
-    
-    if budget.end_date:
-        spent = spent.filter(Transaction.date <= budget.end_date)
-    
-    spent_amount = spent.scalar() or 0
+    spent_amount = budget_spend(db, [budget.id]).get(budget.id, 0)
     
     result = budget.to_dict()
     result['spent'] = float(spent_amount)
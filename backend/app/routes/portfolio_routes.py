@@ -2,10 +2,15 @@
 投資組合 API 路由
 """
 
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from sqlalchemy import text
 from datetime import datetime, date
 import json
+import time
+
+from app.services.cache_service import conditional_get
+from app.services.quote_feed import quote_feed
+from app.services.quote_poller import quote_poller
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
@@ -23,6 +28,7 @@ def init_portfolio_routes(database):
 # ============================================
 
 @portfolio_bp.route('/api/investment-accounts', methods=['GET'])
+@conditional_get('investment_accounts')
 def get_investment_accounts():
     """取得所有投資帳戶"""
     try:
@@ -79,6 +85,7 @@ def create_investment_account():
 # ============================================
 
 @portfolio_bp.route('/api/holdings', methods=['GET'])
+@conditional_get('holdings', 'investment_accounts')
 def get_holdings():
     """取得所有持倉"""
     try:
@@ -130,13 +137,20 @@ def get_holdings():
 
 @portfolio_bp.route('/api/holdings', methods=['POST'])
 def create_holding():
-    """新增持倉"""
+    """新增持倉（買入）"""
     try:
+        from app.services.lot_service import COST_METHODS, record_buy
+        
         data = request.get_json()
+        quantity = float(data.get('quantity', 0))
+        price = float(data.get('price', 0))
+        cost_method = data.get('cost_method', 'average')
+        if cost_method not in COST_METHODS:
+            return jsonify({'error': f'不支援的成本計算方式: {cost_method}'}), 400
         
         # 檢查是否已存在
         result = db.session.execute(text('''
-            SELECT id, quantity, average_cost FROM holdings
+            SELECT id FROM holdings
             WHERE account_id = :account_id AND symbol = :symbol
         '''), {
             'account_id': data.get('account_id'),
@@ -145,63 +159,60 @@ def create_holding():
         existing = result.fetchone()
         
         if existing:
-            # 更新現有持倉（計算新的平均成本）
-            old_id, old_qty, old_cost = existing
-            new_qty = float(data.get('quantity', 0))
-            new_price = float(data.get('price', 0))
-            
-            total_qty = float(old_qty) + new_qty
-            new_avg_cost = ((float(old_qty) * float(old_cost)) + (new_qty * new_price)) / total_qty
-            
-            db.session.execute(text('''
-                UPDATE holdings
-                SET quantity = :quantity, average_cost = :avg_cost, updated_at = CURRENT_TIMESTAMP
-                WHERE id = :id
-            '''), {'quantity': total_qty, 'avg_cost': new_avg_cost, 'id': old_id})
-            
-            holding_id = old_id
+            holding_id = existing[0]
         else:
-            # 建立新持倉
+            # 建立新持倉（持股與成本由批次帳本更新）
             result = db.session.execute(text('''
-                INSERT INTO holdings (account_id, symbol, name, quantity, average_cost, asset_type, market)
-                VALUES (:account_id, :symbol, :name, :quantity, :price, :asset_type, :market)
+                INSERT INTO holdings (account_id, symbol, name, quantity, average_cost, asset_type, market, cost_method)
+                VALUES (:account_id, :symbol, :name, 0, 0, :asset_type, :market, :cost_method)
                 RETURNING id
             '''), {
                 'account_id': data.get('account_id'),
                 'symbol': data.get('symbol'),
                 'name': data.get('name'),
-                'quantity': data.get('quantity'),
-                'price': data.get('price'),
                 'asset_type': data.get('asset_type', 'stock'),
-                'market': data.get('market', 'TWSE')
+                'market': data.get('market', 'TWSE'),
+                'cost_method': cost_method
             })
             holding_id = result.fetchone()[0]
         
         # 記錄交易
-        db.session.execute(text('''
+        transaction_date = data.get('transaction_date', date.today())
+        transaction_id = db.session.execute(text('''
             INSERT INTO investment_transactions 
             (holding_id, transaction_type, quantity, price, fee, tax, transaction_date)
             VALUES (:holding_id, :type, :quantity, :price, :fee, :tax, :date)
+            RETURNING id
         '''), {
             'holding_id': holding_id,
             'type': 'buy',
-            'quantity': data.get('quantity'),
-            'price': data.get('price'),
+            'quantity': quantity,
+            'price': price,
             'fee': data.get('fee', 0),
             'tax': data.get('tax', 0),
-            'date': data.get('transaction_date', date.today())
-        })
+            'date': transaction_date
+        }).scalar()
+        
+        position = record_buy(db, holding_id, quantity, price, data.get('fee', 0),
+                              transaction_date, transaction_id)
         
         db.session.commit()
-        return jsonify({'id': holding_id, 'message': '持倉新增成功'}), 201
+        quote_poller.request_symbols([data.get('symbol')])
+        return jsonify({'id': holding_id, 'message': '持倉新增成功', **position}), 201
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
 @portfolio_bp.route('/api/holdings/<int:holding_id>/sell', methods=['POST'])
 def sell_holding(holding_id):
-    """賣出持倉"""
+    """賣出持倉（依批次計算已實現損益）"""
     try:
+        from app.services.lot_service import record_sell
+        
         data = request.get_json()
         sell_qty = float(data.get('quantity', 0))
         sell_price = float(data.get('price', 0))
@@ -214,21 +225,14 @@ def sell_holding(holding_id):
         if not row:
             return jsonify({'error': '持倉不存在'}), 404
         
-        current_qty = float(row[0])
-        
-        if sell_qty > current_qty:
+        if sell_qty > float(row[0]):
             return jsonify({'error': '賣出數量超過持有數量'}), 400
         
-        new_qty = current_qty - sell_qty
-        
-        db.session.execute(text('''
-            UPDATE holdings SET quantity = :qty, updated_at = CURRENT_TIMESTAMP WHERE id = :id
-        '''), {'qty': new_qty, 'id': holding_id})
-        
-        db.session.execute(text('''
+        transaction_id = db.session.execute(text('''
             INSERT INTO investment_transactions 
             (holding_id, transaction_type, quantity, price, fee, tax, transaction_date)
             VALUES (:holding_id, :type, :quantity, :price, :fee, :tax, :date)
+            RETURNING id
         '''), {
             'holding_id': holding_id,
             'type': 'sell',
@@ -237,11 +241,18 @@ def sell_holding(holding_id):
             'fee': data.get('fee', 0),
             'tax': data.get('tax', 0),
             'date': data.get('transaction_date', date.today())
-        })
+        }).scalar()
+        
+        sale = record_sell(db, holding_id, sell_qty, sell_price,
+                           data.get('fee', 0), data.get('tax', 0), transaction_id)
         
         db.session.commit()
-        return jsonify({'message': '賣出成功', 'remaining_quantity': new_qty})
+        return jsonify({'message': '賣出成功', **sale})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
@@ -251,42 +262,57 @@ def sell_holding(holding_id):
 
 @portfolio_bp.route('/api/portfolio/summary', methods=['GET'])
 def get_portfolio_summary():
-    """取得投資組合摘要"""
+    """
+    取得投資組合摘要
+    報價只讀取背景輪詢維護的快取（記憶體查詢，不在請求中呼叫上游）；
+    快取沒有的股票以平均成本計算並通知輪詢更新；timings 回傳各階段耗時（ms）
+    """
     try:
         from app.services.stock_service import stock_service, PerformanceCalculator
         
+        started = time.perf_counter()
+        
+        # 已實現損益由批次帳本在買賣時累計，已出清的持倉也計入總額
         result = db.session.execute(text('''
-            SELECT h.id, h.symbol, h.name, h.quantity, h.average_cost, h.asset_type, h.market
+            SELECT h.id, h.symbol, h.name, h.quantity, h.average_cost, h.asset_type, h.market,
+                   h.realized_pnl
             FROM holdings h
             JOIN investment_accounts ia ON h.account_id = ia.id
-            WHERE h.quantity > 0 AND ia.is_active = TRUE
+            WHERE ia.is_active = TRUE
         '''))
         
         holdings = []
+        total_realized = 0
         for row in result:
+            realized = float(row[7]) if row[7] else 0
+            total_realized += realized
+            if not row[3] or float(row[3]) <= 0:
+                continue
             holdings.append({
                 'id': row[0],
                 'symbol': row[1],
                 'name': row[2],
-                'quantity': float(row[3]) if row[3] else 0,
+                'quantity': float(row[3]),
                 'average_cost': float(row[4]) if row[4] else 0,
                 'asset_type': row[5],
-                'market': row[6]
+                'market': row[6],
+                'realized_pnl': round(realized, 2)
             })
+        db_done = time.perf_counter()
         
         total_cost = 0
         total_value = 0
         holdings_with_value = []
         
-        # 取得即時股價
-        symbols = [h['symbol'] for h in holdings if h['asset_type'] != 'cash']
-        prices = {}
-        
-        if symbols:
-            price_data = stock_service.get_realtime_prices(symbols)
-            for p in price_data:
-                if p.get('success'):
-                    prices[p['symbol']] = p['price']
+        # 取得即時股價（快取沒有的股票不在請求中呼叫 TWSE，改由背景輪詢補上）
+        symbols = list(dict.fromkeys(h['symbol'] for h in holdings if h['asset_type'] != 'cash'))
+        quotes = stock_service.quote_cache.snapshot(symbols)
+        prices = {symbol: quotes[symbol]['price'] for symbol in symbols
+                  if symbol in quotes and quotes[symbol].get('success') and quotes[symbol].get('price')}
+        missing = [symbol for symbol in symbols if symbol not in prices]
+        if missing:
+            quote_poller.request_symbols(missing)
+        quotes_done = time.perf_counter()
         
         for h in holdings:
             qty = h['quantity']
@@ -311,12 +337,31 @@ def get_portfolio_summary():
                 'market_value': round(market_value, 2),
                 'cost_basis': round(cost_basis, 2),
                 'profit': round(profit, 2),
+                'unrealized_pnl': round(profit, 2),
                 'profit_rate': profit_rate
             })
         
         total_profit = total_value - total_cost
         total_profit_rate = PerformanceCalculator.calculate_roi(total_value, total_cost)
         
+        # 資金加權（XIRR）與時間加權（TWR）報酬率
+        performance = None
+        performance_started = time.perf_counter()
+        try:
+            from app.services.performance_service import portfolio_performance
+            
+            performance = portfolio_performance(
+                db, {h['id']: h['market_value'] for h in holdings_with_value}
+            )
+            for h in holdings_with_value:
+                metrics = performance['holdings'].get(h['id'], {})
+                h['xirr'] = metrics.get('xirr')
+                h['twr'] = metrics.get('twr')
+        except Exception as e:
+            db.session.rollback()
+            print(f'計算投資績效錯誤: {e}')
+        performance_ms = (time.perf_counter() - performance_started) * 1000
+        
         # 資產配置
         allocation = {}
         for h in holdings_with_value:
@@ -331,20 +376,59 @@ def get_portfolio_summary():
                 allocation[asset_type]['value'] / total_value * 100, 2
             ) if total_value > 0 else 0
         
+        finished = time.perf_counter()
         return jsonify({
             'total_value': round(total_value, 2),
             'total_cost': round(total_cost, 2),
             'total_profit': round(total_profit, 2),
             'total_profit_rate': total_profit_rate,
+            'total_realized_pnl': round(total_realized, 2),
+            'total_unrealized_pnl': round(total_profit, 2),
             'holdings_count': len(holdings_with_value),
             'allocation': allocation,
             'holdings': holdings_with_value,
-            'updated_at': datetime.now().isoformat()
+            'performance': {
+                'portfolio': performance['portfolio'],
+                'accounts': performance['accounts']
+            } if performance else None,
+            'updated_at': datetime.now().isoformat(),
+            'prices_as_of': quote_poller.last_run.isoformat() if quote_poller.last_run else None,
+            'stale_prices': sorted(symbol for symbol in prices if quotes[symbol].get('stale')),
+            'timings': {
+                'db_ms': round((db_done - started) * 1000, 1),
+                'quotes_ms': round((quotes_done - db_done) * 1000, 1),
+                'compute_ms': round((finished - quotes_done) * 1000 - performance_ms, 1),
+                'performance_ms': round(performance_ms, 1),
+                'total_ms': round((finished - started) * 1000, 1),
+                'quotes_missing': len(missing)
+            }
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@portfolio_bp.route('/api/portfolio/history', methods=['GET'])
+@conditional_get('investment_transactions', 'holdings', 'investment_accounts', 'price_history', daily=True)
+def get_portfolio_history():
+    """取得投資組合每日市值、成本與損益"""
+    try:
+        from app.services.portfolio_history import portfolio_history
+        
+        start = request.args.get('start')
+        end = request.args.get('end')
+        result = portfolio_history(
+            db,
+            datetime.strptime(start, '%Y-%m-%d').date() if start else None,
+            datetime.strptime(end, '%Y-%m-%d').date() if end else None,
+            request.args.get('account_id', type=int)
+        )
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================
 # 關注清單 API
 # ============================================
@@ -372,11 +456,11 @@ def get_watchlist():
                 'note': row[6]
             })
         
-        # 取得即時股價
+        # 取得即時股價（讀取報價快取）
         if watchlist:
             symbols = [w['symbol'] for w in watchlist]
-            prices = stock_service.get_realtime_prices(symbols)
-            price_map = {p['symbol']: p for p in prices if p.get('success')}
+            price_map = stock_service.get_cached_quotes(symbols)
+            quote_poller.request_symbols(symbol for symbol in symbols if symbol not in price_map)
             
             for w in watchlist:
                 if w['symbol'] in price_map:
@@ -395,16 +479,18 @@ def add_to_watchlist():
         data = request.get_json()
         
         db.session.execute(text('''
-            INSERT INTO watchlist (symbol, name, alert_price_high, alert_price_low, note)
-            VALUES (:symbol, :name, :high, :low, :note)
+            INSERT INTO watchlist (symbol, name, alert_price_high, alert_price_low, alert_change_percent, note)
+            VALUES (:symbol, :name, :high, :low, :change_percent, :note)
         '''), {
             'symbol': data.get('symbol'),
             'name': data.get('name'),
             'high': data.get('alert_price_high'),
             'low': data.get('alert_price_low'),
+            'change_percent': data.get('alert_change_percent'),
             'note': data.get('note')
         })
         db.session.commit()
+        quote_poller.request_symbols([data.get('symbol')])
         
         return jsonify({'message': '已加入關注清單'}), 201
     except Exception as e:
@@ -422,6 +508,57 @@ def remove_from_watchlist(watchlist_id):
         return jsonify({'error': str(e)}), 500
 
 
+# ============================================
+# 價格提醒 API
+# ============================================
+
+@portfolio_bp.route('/api/alerts', methods=['GET'])
+@conditional_get('price_alerts')
+def get_price_alerts():
+    """取得價格提醒（預設最近 50 筆，?unread=true 只取未讀）"""
+    try:
+        limit = min(request.args.get('limit', 50, type=int), 200)
+        query = '''
+            SELECT a.id, a.watchlist_id, a.symbol, w.name, a.alert_type, a.threshold,
+                   a.price, a.change_percent, a.is_read, a.triggered_at
+            FROM price_alerts a
+            LEFT JOIN watchlist w ON a.watchlist_id = w.id
+        '''
+        if request.args.get('unread', '').lower() == 'true':
+            query += ' WHERE a.is_read = FALSE'
+        query += ' ORDER BY a.triggered_at DESC, a.id DESC LIMIT :limit'
+        
+        alerts = []
+        for row in db.session.execute(text(query), {'limit': limit}):
+            alerts.append({
+                'id': row[0],
+                'watchlist_id': row[1],
+                'symbol': row[2],
+                'name': row[3],
+                'alert_type': row[4],
+                'threshold': float(row[5]),
+                'price': float(row[6]),
+                'change_percent': float(row[7]) if row[7] is not None else None,
+                'is_read': row[8],
+                'triggered_at': row[9].isoformat() if row[9] else None
+            })
+        
+        return jsonify(alerts)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@portfolio_bp.route('/api/alerts/<int:alert_id>/read', methods=['POST'])
+def mark_price_alert_read(alert_id):
+    """將價格提醒標記為已讀"""
+    try:
+        db.session.execute(text('UPDATE price_alerts SET is_read = TRUE WHERE id = :id'), {'id': alert_id})
+        db.session.commit()
+        return jsonify({'message': '已標記為已讀'})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 # ============================================
 # 股票搜尋 API
 # ============================================
@@ -456,6 +593,131 @@ def get_stock_quote(symbol):
         return jsonify({'error': str(e)}), 500
 
 
+@portfolio_bp.route('/api/stocks/history/<symbol>', methods=['GET'])
+@conditional_get('price_history')
+def get_stock_history(symbol):
+    """取得歷史日線（讀取欄式快取）"""
+    try:
+        from app.services.price_history import price_history
+        
+        columns = price_history.history(symbol, request.args.get('start'), request.args.get('end'))
+        if columns is None:
+            return jsonify({'error': '尚無歷史股價，請先回補'}), 404
+        
+        return jsonify({'symbol': symbol, 'bars': price_history.to_bars(columns)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@portfolio_bp.route('/api/stocks/history/<symbol>/backfill', methods=['POST'])
+def backfill_stock_history(symbol):
+    """回補歷史日線（排入背景工作，以 GET 同一路徑查詢進度）"""
+    try:
+        from app.services.price_history import history_backfill
+        
+        data = request.get_json(silent=True) or {}
+        try:
+            job = history_backfill.request_backfill(symbol, data.get('start'), data.get('end'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(job), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@portfolio_bp.route('/api/stocks/history/<symbol>/backfill', methods=['GET'])
+def get_backfill_status(symbol):
+    """查詢歷史日線回補進度"""
+    from app.services.price_history import history_backfill
+    
+    job = history_backfill.status(symbol)
+    if job is None:
+        return jsonify({'error': '沒有回補紀錄'}), 404
+    return jsonify(job)
+
+
+@portfolio_bp.route('/api/stocks/poller', methods=['GET'])
+def get_quote_poller_status():
+    """取得報價輪詢與報價快取狀態"""
+    try:
+        from app.services.alert_service import alert_engine
+        from app.services.market_data import market_data, market_http
+        from app.services.stock_service import stock_service
+        
+        return jsonify({
+            'poller': quote_poller.status(),
+            'cache': stock_service.quote_cache.stats(),
+            'breaker': stock_service.breaker.status(),
+            'alerts': alert_engine.stats(),
+            'stream': quote_feed.stats(),
+            'market_data': (market_data or market_http).stats()
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+STREAM_FIELDS = ('price', 'change', 'volume', 'time', 'stale')
+STREAM_MAX_SYMBOLS = 100
+STREAM_HEARTBEAT = 15
+
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@portfolio_bp.route('/api/stream/quotes', methods=['GET'])
+def stream_quotes():
+    """
+    即時報價推播（Server-Sent Events），?symbols=2330,0050
+    連線時先送出 snapshot（快取中的報價），之後每批新報價只送出有變動的欄位（quotes 事件）
+    """
+    from app.services.stock_service import stock_service
+    
+    symbols = []
+    for symbol in request.args.get('symbols', '').split(','):
+        symbol = symbol.strip().upper()
+        if symbol and symbol not in symbols:
+            symbols.append(symbol)
+    if not symbols:
+        return jsonify({'error': '請指定 symbols'}), 400
+    if len(symbols) > STREAM_MAX_SYMBOLS:
+        return jsonify({'error': f'最多訂閱 {STREAM_MAX_SYMBOLS} 檔股票'}), 400
+    
+    snapshot = stock_service.get_cached_quotes(symbols)
+    
+    def generate():
+        subscription = quote_feed.subscribe(symbols)
+        quote_poller.request_symbols(symbol for symbol in symbols if symbol not in snapshot)
+        # 每個連線記錄已送出的欄位值，只推送差異
+        sent = {symbol: {field: quote.get(field) for field in STREAM_FIELDS}
+                for symbol, quote in snapshot.items()}
+        try:
+            yield 'retry: 5000\n\n'
+            yield _sse('snapshot', sent)
+            while True:
+                quotes = subscription.get(timeout=STREAM_HEARTBEAT)
+                if quotes is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                deltas = {}
+                for symbol, quote in quotes.items():
+                    previous = sent.setdefault(symbol, {})
+                    changed = {field: quote.get(field) for field in STREAM_FIELDS
+                               if quote.get(field) != previous.get(field)}
+                    if changed:
+                        previous.update(changed)
+                        deltas[symbol] = changed
+                if deltas:
+                    yield _sse('quotes', deltas)
+        finally:
+            quote_feed.unsubscribe(subscription)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+
 # ============================================
 # 風險評估 API
 # ============================================
@@ -511,6 +773,7 @@ def create_risk_assessment():
 
 
 @portfolio_bp.route('/api/portfolio/monthly-stats', methods=['GET'])
+@conditional_get('investment_transactions', 'holdings', daily=True)
 
 def get_portfolio_monthly_stats():
     """取得本月投資統計"""
@@ -544,6 +807,14 @@ def get_portfolio_monthly_stats():
         '''), {'start': start_of_month})
         monthly_dividend = float(dividend_result.scalar() or 0)
         
+        # 本月已實現損益（賣出時由批次帳本計算）
+        realized_result = db.session.execute(text('''
+            SELECT COALESCE(SUM(realized_pnl), 0)
+            FROM investment_transactions
+            WHERE transaction_type = 'sell' AND transaction_date >= :start
+        '''), {'start': start_of_month})
+        monthly_realized = float(realized_result.scalar() or 0)
+        
         # 本月交易次數
         trade_count_result = db.session.execute(text('''
             SELECT COUNT(*)
@@ -579,6 +850,7 @@ def get_portfolio_monthly_stats():
             'monthly_sell': round(monthly_sell, 0),
             'monthly_dividend': round(monthly_dividend, 0),
             'monthly_profit': round(monthly_sell + monthly_dividend - monthly_investment, 0),
+            'monthly_realized_pnl': round(monthly_realized, 0),
             'trade_count': trade_count,
             'recent_transactions': recent_transactions
         })
@@ -0,0 +1,151 @@
+"""
+關注清單價格提醒
+- 將所有提醒條件依股票整理成排序後的門檻陣列，
+  每筆報價只需二分搜尋即可找出所有觸發的條件（O(log n + 觸發數)）
+- 由報價背景輪詢在每批新報價後呼叫，不佔用 API 請求
+- 同一條件在冷卻時間內只記錄一次（記憶體與資料庫雙重檢查，多程序部署也不會重複）
+"""
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Tuple
+
+from sqlalchemy import text
+
+from app.services.cache_service import get_table_versions
+
+
+ALERT_TYPES = ('price_high', 'price_low', 'change_percent')
+
+
+class AlertEngine:
+    """價格提醒評估引擎"""
+
+    def __init__(self, cooldown_seconds: float = 3600):
+        self.cooldown_seconds = cooldown_seconds
+        self._rules: Dict[str, Dict[str, Tuple[List[float], List[int]]]] = {}
+        self._version = None
+        self._last_fired: Dict[Tuple[int, str], float] = {}
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.triggered = 0
+
+    @staticmethod
+    def _sorted(pairs: List[Tuple[float, int]]) -> Tuple[List[float], List[int]]:
+        pairs.sort()
+        return [threshold for threshold, _ in pairs], [rule_id for _, rule_id in pairs]
+
+    def load(self, db):
+        """由 watchlist 重建各股票的門檻陣列"""
+        grouped: Dict[str, Dict[str, List[Tuple[float, int]]]] = {}
+        result = db.session.execute(text('''
+            SELECT id, symbol, alert_price_high, alert_price_low, alert_change_percent
+            FROM watchlist
+            WHERE alert_price_high IS NOT NULL
+               OR alert_price_low IS NOT NULL
+               OR alert_change_percent IS NOT NULL
+        '''))
+        for rule_id, symbol, high, low, change in result:
+            rules = grouped.setdefault(symbol, {alert_type: [] for alert_type in ALERT_TYPES})
+            if high is not None:
+                rules['price_high'].append((float(high), rule_id))
+            if low is not None:
+                rules['price_low'].append((float(low), rule_id))
+            if change is not None:
+                rules['change_percent'].append((abs(float(change)), rule_id))
+
+        compiled = {
+            symbol: {alert_type: self._sorted(pairs) for alert_type, pairs in rules.items()}
+            for symbol, rules in grouped.items()
+        }
+        with self._lock:
+            self._rules = compiled
+
+    def _ensure_rules(self, db):
+        # watchlist 的版本號由觸發器維護，其他程序的修改也會被偵測到
+        version = get_table_versions(db, ('watchlist',)).get('watchlist')
+        if self._version is None or version != self._version:
+            self.load(db)
+            self._version = version
+
+    def match(self, symbol: str, price: float, change_percent: float) -> List[Tuple[int, str, float]]:
+        """回傳此報價觸發的 (watchlist_id, 類型, 門檻)"""
+        rules = self._rules.get(symbol)
+        if not rules:
+            return []
+
+        hits = []
+        thresholds, ids = rules['price_high']
+        # 門檻 <= 價格 的條件都觸發（前綴）
+        for index in range(bisect_right(thresholds, price)):
+            hits.append((ids[index], 'price_high', thresholds[index]))
+        thresholds, ids = rules['price_low']
+        # 門檻 >= 價格 的條件都觸發（後綴）
+        for index in range(bisect_left(thresholds, price), len(thresholds)):
+            hits.append((ids[index], 'price_low', thresholds[index]))
+        thresholds, ids = rules['change_percent']
+        for index in range(bisect_right(thresholds, abs(change_percent))):
+            hits.append((ids[index], 'change_percent', thresholds[index]))
+        return hits
+
+    def evaluate(self, db, quotes: Dict[str, Dict]) -> int:
+        """評估一批報價，寫入觸發的提醒，回傳新增筆數（會 commit）"""
+        self._ensure_rules(db)
+        now = time.monotonic()
+        pending = []
+        for symbol, quote in quotes.items():
+            if not quote.get('success') or quote.get('stale') or not quote.get('price'):
+                continue
+            price = float(quote['price'])
+            change = float(quote.get('change') or 0)
+            previous = price - change
+            change_percent = change / previous * 100 if previous else 0
+            self.evaluated += 1
+
+            for rule_id, alert_type, threshold in self.match(symbol, price, change_percent):
+                key = (rule_id, alert_type)
+                if now - self._last_fired.get(key, float('-inf')) < self.cooldown_seconds:
+                    continue
+                self._last_fired[key] = now
+                pending.append({
+                    'watchlist_id': rule_id,
+                    'symbol': symbol,
+                    'alert_type': alert_type,
+                    'threshold': threshold,
+                    'price': price,
+                    'change_percent': round(change_percent, 2),
+                    'cooldown': self.cooldown_seconds
+                })
+
+        if not pending:
+            return 0
+
+        inserted = 0
+        for params in pending:
+            result = db.session.execute(text('''
+                INSERT INTO price_alerts (watchlist_id, symbol, alert_type, threshold, price, change_percent)
+                SELECT :watchlist_id, :symbol, :alert_type, :threshold, :price, :change_percent
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM price_alerts
+                    WHERE watchlist_id = :watchlist_id AND alert_type = :alert_type
+                      AND triggered_at > CURRENT_TIMESTAMP - make_interval(secs => :cooldown)
+                )
+            '''), params)
+            inserted += result.rowcount
+        db.session.commit()
+        self.triggered += inserted
+        return inserted
+
+    def stats(self) -> Dict:
+        return {
+            'symbols': len(self._rules),
+            'rules': sum(len(rules[alert_type][0]) for rules in self._rules.values() for alert_type in ALERT_TYPES),
+            'evaluated': self.evaluated,
+            'triggered': self.triggered,
+            'cooldown_seconds': self.cooldown_seconds
+        }
+
+
+# 建立提醒引擎實例
+alert_engine = AlertEngine(cooldown_seconds=float(os.getenv('ALERT_COOLDOWN', 3600)))
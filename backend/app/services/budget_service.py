@@ -0,0 +1,201 @@
+"""
+預算評估服務
+- 所有預算的已使用金額以單一分組範圍聯結（budgets × daily_category_totals）計算，
+  不再對每一筆預算執行相關子查詢
+- 預算生命週期（過期未達標刪除、達標標記完成）由背景工作處理，讀取 API 不寫入資料庫
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+
+from app.services.cache_service import response_cache
+
+
+BUDGET_SPEND_JOIN = '''
+    LEFT JOIN daily_category_totals d
+        ON d.category_id = b.category_id
+       AND d.type = 'expense'
+       AND d.date >= b.start_date
+       AND (b.end_date IS NULL OR d.date <= b.end_date)
+'''
+
+
+def load_budgets(db, category_ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """載入 active 預算及已使用金額（一次查詢），category_ids 指定時只載入這些分類的預算"""
+    query = f'''
+        SELECT b.id, b.category_id, b.name, b.amount, b.period,
+               b.start_date, b.end_date, b.status,
+               c.name as category_name, c.icon as category_icon,
+               COALESCE(SUM(d.total), 0) as spent
+        FROM budgets b
+        JOIN categories c ON b.category_id = c.id
+        {BUDGET_SPEND_JOIN}
+        WHERE b.is_active = true
+    '''
+    params = {}
+    if category_ids is not None:
+        category_ids = tuple(category_ids)
+        if not category_ids:
+            return []
+        query += ' AND b.category_id IN :category_ids'
+        params['category_ids'] = category_ids
+    query += '''
+        GROUP BY b.id, c.id
+        ORDER BY
+            CASE WHEN b.end_date IS NULL THEN 1 ELSE 0 END,
+            b.end_date ASC
+    '''
+    result = db.session.execute(text(query), params)
+
+    return [{
+        'id': row[0],
+        'category_id': row[1],
+        'name': row[2],
+        'amount': float(row[3]) if row[3] else 0,
+        'period': row[4],
+        'start_date': row[5],
+        'end_date': row[6],
+        'status': row[7],
+        'category_name': row[8],
+        'category_icon': row[9],
+        'spent': float(row[10]) if row[10] else 0
+    } for row in result]
+
+
+def budget_spend(db, budget_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """
+    計算預算已使用金額，回傳 {budget_id: spent}
+    budget_ids 為 None 時計算所有 active 預算
+    """
+    query = f'''
+        SELECT b.id, COALESCE(SUM(d.total), 0)
+        FROM budgets b
+        {BUDGET_SPEND_JOIN}
+    '''
+    params = {}
+    if budget_ids is None:
+        query += ' WHERE b.is_active = true'
+    else:
+        budget_ids = tuple(budget_ids)
+        if not budget_ids:
+            return {}
+        query += ' WHERE b.id IN :ids'
+        params['ids'] = budget_ids
+    query += ' GROUP BY b.id'
+
+    return {row[0]: float(row[1]) for row in db.session.execute(text(query), params)}
+
+
+def sweep_budget_lifecycle(db, today=None) -> Dict[str, List[int]]:
+    """
+    處理預算生命週期（單一交易）
+    - 過期且未達標 → 刪除
+    - 已使用金額達到預算 → 標記為 completed
+    """
+    today = today or datetime.now().date()
+    spend_cte = f'''
+        WITH spend AS (
+            SELECT b.id, b.amount, b.end_date, b.status, COALESCE(SUM(d.total), 0) AS spent
+            FROM budgets b
+            {BUDGET_SPEND_JOIN}
+            WHERE b.is_active = true
+            GROUP BY b.id
+        )
+    '''
+    try:
+        deleted = db.session.execute(text(spend_cte + '''
+            DELETE FROM budgets
+            WHERE id IN (SELECT id FROM spend WHERE end_date < :today AND spent < amount)
+            RETURNING id
+        '''), {'today': today}).fetchall()
+
+        completed = db.session.execute(text(spend_cte + '''
+            UPDATE budgets SET status = 'completed'
+            WHERE id IN (
+                SELECT id FROM spend
+                WHERE spent >= amount AND status IS DISTINCT FROM 'completed'
+            )
+            RETURNING id
+        ''')).fetchall()
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'deleted': [row[0] for row in deleted],
+        'completed': [row[0] for row in completed]
+    }
+
+
+class BudgetLifecycleSweeper:
+    """
+    預算生命週期背景工作
+    啟動時執行一次，之後於每日午夜、以及交易或預算寫入後（request_sweep）執行
+    """
+
+    def __init__(self, debounce_seconds: float = 2.0):
+        self.debounce_seconds = debounce_seconds
+        self.last_run = None
+        self.last_result = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._app = None
+        self._db = None
+
+    def start(self, app, db):
+        """啟動背景執行緒（重複呼叫不會重複啟動）"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._db = db
+            self._thread = threading.Thread(target=self._run, name='budget-lifecycle', daemon=True)
+            self._thread.start()
+
+    def request_sweep(self):
+        """通知背景工作盡快執行一次（短時間內的多次通知會合併）"""
+        self._wake.set()
+
+    def sweep(self):
+        """立即執行一次生命週期處理"""
+        with self._app.app_context():
+            try:
+                self.last_result = sweep_budget_lifecycle(self._db)
+                self.last_run = datetime.now()
+                if self.last_result['deleted'] or self.last_result['completed']:
+                    response_cache.invalidate('budgets')
+                if self.last_result['deleted']:
+                    from app.services.ledger_events import ledger_events
+                    ledger_events.publish_changes(
+                        self._db, 'budgets_expired', deleted_budgets=self.last_result['deleted']
+                    )
+            except Exception as e:
+                print(f'預算生命週期處理錯誤: {e}')
+
+    @staticmethod
+    def _seconds_until_midnight() -> float:
+        now = datetime.now()
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=5, microsecond=0)
+        return (midnight - now).total_seconds()
+
+    def _run(self):
+        self.sweep()
+        while True:
+            if self._wake.wait(self._seconds_until_midnight()):
+                # 合併短時間內連續的寫入通知
+                self._wake.clear()
+                time.sleep(self.debounce_seconds)
+                self._wake.clear()
+            self.sweep()
+
+
+# 建立背景工作實例
+budget_sweeper = BudgetLifecycleSweeper()
@@ -0,0 +1,177 @@
+"""
+HTTP 快取服務
+- conditional_get：以 table_versions（各資料表的寫入版本號）產生強 ETag，
+  If-None-Match 相符時在執行任何查詢前直接回傳 304
+- ResponseCache：伺服器端回應快取，由寫入 API 依資料表標籤精準失效
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from typing import Dict, Iterable
+
+from flask import Response, current_app, g, make_response, request
+from sqlalchemy import text
+
+
+def get_table_versions(db, tables: Iterable[str]) -> Dict[str, int]:
+    """一次查詢取得多張資料表的版本號（尚未寫入過的資料表為 0）"""
+    tables = tuple(tables)
+    result = db.session.execute(text(
+        'SELECT table_name, version FROM table_versions WHERE table_name IN :tables'
+    ), {'tables': tables})
+    versions = {table: 0 for table in tables}
+    versions.update({row[0]: int(row[1]) for row in result})
+    return versions
+
+
+def make_etag(versions: Dict[str, int], *parts) -> str:
+    """由版本號與請求內容組成 ETag 值（不含引號）"""
+    raw = '|'.join([f'{table}:{versions[table]}' for table in sorted(versions)] + [str(p) for p in parts])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def conditional_get(*tables: str, daily: bool = False):
+    """
+    條件式 GET 裝飾器
+    tables: 回應內容所依賴的資料表；daily=True 表示內容與今日日期有關（如剩餘天數）
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            db = current_app.extensions['sqlalchemy']
+            try:
+                versions = get_table_versions(db, tables)
+            except Exception:
+                # 版本表不存在或查詢失敗時，退回一般回應
+                db.session.rollback()
+                return view(*args, **kwargs)
+
+            # 同一請求中的 ResponseCache 沿用這次查到的版本號
+            g.table_versions = {**getattr(g, 'table_versions', {}), **versions}
+            etag = make_etag(versions, request.full_path, date.today() if daily else '')
+            if request.if_none_match.contains(etag):
+                response = make_response('', 304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+class ResponseCache:
+    """
+    伺服器端回應快取
+    以「endpoint + 查詢參數 + 今日日期」為鍵，保存序列化後的回應內容；
+    寫入 API 呼叫 invalidate(資料表) 使相關項目失效，另有 TTL 作為日期相關內容的保底。
+    項目另記錄建立時的 table_versions，命令列、其他程序或直接寫入資料庫的變動也會讓快取失效
+    （與 conditional_get 並用時沿用同一請求查到的版本號，不另外查詢）。
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def snapshot(self, tags) -> tuple:
+        """目前各標籤的失效世代（在計算回應之前取得，避免存入計算期間已失效的內容）"""
+        return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def get(self, key: tuple, tags, versions=None):
+        """取得有效的快取項目，沒有時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if (entry is None
+                    or entry['expires_at'] < time.monotonic()
+                    or entry['generations'] != self.snapshot(tags)
+                    or entry['versions'] != versions):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key: tuple, generations: tuple, body: bytes, mimetype: str, versions=None):
+        with self._lock:
+            self._entries[key] = {
+                'body': body,
+                'mimetype': mimetype,
+                'generations': generations,
+                'versions': versions,
+                'expires_at': time.monotonic() + self.ttl_seconds
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, *tags: str):
+        """使依賴指定資料表的快取項目失效"""
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total * 100, 1) if total else 0,
+                'invalidations': self.invalidations,
+                'ttl_seconds': self.ttl_seconds
+            }
+
+    def cached(self, *tags: str):
+        """快取 GET 回應的裝飾器；tags 為回應內容所依賴的資料表"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                known = getattr(g, 'table_versions', {})
+                if all(tag in known for tag in tags):
+                    versions = tuple((tag, known[tag]) for tag in sorted(tags))
+                else:
+                    db = current_app.extensions['sqlalchemy']
+                    try:
+                        versions = tuple(sorted(get_table_versions(db, tags).items()))
+                    except Exception:
+                        db.session.rollback()
+                        return view(*args, **kwargs)
+
+                key = (request.endpoint, request.full_path, date.today())
+                entry = self.get(key, tags, versions)
+                if entry is not None:
+                    response = Response(entry['body'], mimetype=entry['mimetype'])
+                    response.headers['X-Cache'] = 'HIT'
+                    return response
+
+                generations = self.snapshot(tags)
+                response = make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed:
+                    self.set(key, generations, response.get_data(), response.mimetype, versions)
+                response.headers['X-Cache'] = 'MISS'
+                return response
+            return wrapper
+        return decorator
+
+
+# 建立快取實例
+response_cache = ResponseCache(ttl_seconds=int(os.getenv('RESPONSE_CACHE_TTL', 300)))
@@ -0,0 +1,205 @@
+"""
+交易自動分類服務
+- KeywordMatcher：以 Aho–Corasick 自動機一次掃描描述文字，找出所有命中的關鍵字
+- MerchantMemory：記住各商家過去使用的分類（歷史紀錄分類）
+"""
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+
+# 可作為商家記憶學習來源的分類來源（transactions.category_source）：使用者指定或關鍵字規則命中；
+# 商家記憶本身（memory）、金額區間的猜測（amount）與預設分類（default）不列入
+LEARNABLE_SOURCES = ('user', 'keyword')
+
+
+class KeywordMatcher:
+    """
+    多關鍵字比對器 (Aho–Corasick)
+    建立一次後，每筆描述的比對成本只與文字長度有關，與關鍵字數量無關；
+    多個關鍵字同時命中時取最長者（例如「書籍」優先於「書」、ubereats 優先於 uber）
+    """
+
+    def __init__(self, keyword_map: Optional[Dict[str, int]] = None):
+        self._automaton = ([{}], [0], [None], [None])
+        self.build(keyword_map or {})
+
+    def build(self, keyword_map: Dict[str, int]):
+        """依關鍵字對照表重建自動機（關鍵字變更時呼叫）"""
+        goto: List[Dict[str, int]] = [{}]
+        fail: List[int] = [0]
+        keyword_at: List[Optional[Tuple[str, int]]] = [None]
+
+        # 1. 建立 trie
+        for keyword, value in keyword_map.items():
+            keyword = keyword.lower()
+            if not keyword:
+                continue
+            node = 0
+            for char in keyword:
+                next_node = goto[node].get(char)
+                if next_node is None:
+                    next_node = len(goto)
+                    goto[node][char] = next_node
+                    goto.append({})
+                    fail.append(0)
+                    keyword_at.append(None)
+                node = next_node
+            keyword_at[node] = (keyword, value)
+
+        # 2. BFS 建立失敗連結；best[node] 為在此節點結束的最長關鍵字
+        best: List[Optional[Tuple[str, int]]] = list(keyword_at)
+        queue = deque(goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                queue.append(child)
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                if best[child] is None:
+                    best[child] = best[fail[child]]
+
+        # 一次替換，讀取端不會看到建到一半的狀態
+        self._automaton = (goto, fail, keyword_at, best)
+
+    def _walk(self, text: str):
+        """逐字走訪自動機，產生 (結束位置, 節點)"""
+        goto, fail, _, _ = self._automaton
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            yield index, node
+
+    def find_all(self, text: str) -> List[Tuple[int, str, int]]:
+        """回傳所有命中的 (起始位置, 關鍵字, 對應值)"""
+        _, fail, keyword_at, _ = self._automaton
+        matches = []
+        for index, node in self._walk(text.lower()):
+            state = node
+            while state:
+                if keyword_at[state]:
+                    keyword, value = keyword_at[state]
+                    matches.append((index - len(keyword) + 1, keyword, value))
+                state = fail[state]
+        return matches
+
+    def match(self, text: str) -> Optional[int]:
+        """回傳最長命中關鍵字的對應值；長度相同時取較早出現者"""
+        best = self._automaton[3]
+        found = None
+        found_key = None
+        for index, node in self._walk(text.lower()):
+            candidate = best[node]
+            if candidate:
+                keyword, value = candidate
+                key = (len(keyword), -(index - len(keyword) + 1))
+                if found_key is None or key > found_key:
+                    found, found_key = value, key
+        return found
+
+
+class MerchantMemory:
+    """
+    商家記憶 (歷史紀錄分類)
+    將描述正規化（小寫、去除數字、合併空白）後，記錄每個商家各分類的使用次數，
+    查詢時回傳最常使用的分類（次數相同取最近一次使用者）；以 LRU 限制記憶體用量
+    """
+
+    DIGITS = re.compile(r'[0-9０-９]+')
+    WHITESPACE = re.compile(r'\s+')
+
+    def __init__(self, capacity: int = 20000, ignore_categories: Iterable[int] = ()):
+        self.capacity = capacity
+        self.ignore_categories = set(ignore_categories)
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def normalize(cls, description: str) -> str:
+        """正規化商家描述"""
+        if not description:
+            return ''
+        normalized = cls.DIGITS.sub(' ', description.lower())
+        return cls.WHITESPACE.sub(' ', normalized).strip()
+
+    def lookup(self, description: str) -> Optional[int]:
+        """查詢商家慣用分類，沒有紀錄時回傳 None"""
+        key = self.normalize(description)
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            counts = entry['counts']
+            return max(counts, key=lambda category_id: (counts[category_id], category_id == entry['last']))
+
+    def learn(self, description: str, category_id: Optional[int], count: int = 1):
+        """記錄一筆（或 count 筆）商家分類使用紀錄"""
+        key = self.normalize(description)
+        if not key or not category_id or category_id in self.ignore_categories:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {'counts': {}, 'last': None}
+                self._entries[key] = entry
+            else:
+                self._entries.move_to_end(key)
+            entry['counts'][category_id] = entry['counts'].get(category_id, 0) + count
+            entry['last'] = category_id
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def forget(self, description: str, category_id: Optional[int], count: int = 1):
+        """撤銷使用紀錄（交易刪除時），次數歸零的分類與商家一併移除"""
+        key = self.normalize(description)
+        if not key or not category_id:
+            return
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or category_id not in entry['counts']:
+                return
+            entry['counts'][category_id] -= count
+            if entry['counts'][category_id] <= 0:
+                del entry['counts'][category_id]
+                if entry['last'] == category_id:
+                    entry['last'] = None
+            if not entry['counts']:
+                del self._entries[key]
+
+    def learn_many(self, rows: Iterable[Dict]):
+        """由交易列（含 description、category_id）批次學習"""
+        for row in rows:
+            self.learn(row.get('description'), row.get('category_id'))
+
+    def warm(self, db) -> int:
+        """
+        啟動時以單一彙總查詢從 transactions 載入商家記憶，回傳載入的商家數
+        只載入分類來源可學習（LEARNABLE_SOURCES）的交易，自動猜測的分類不會在重啟後回到記憶中
+        """
+        result = db.session.execute(text(r'''
+            SELECT regexp_replace(lower(description), '[0-9]+', ' ', 'g') AS merchant,
+                   category_id, COUNT(*) AS uses, MAX(date) AS last_used
+            FROM transactions
+            WHERE category_id IS NOT NULL AND category_source IN :sources
+            GROUP BY 1, category_id
+            ORDER BY last_used DESC
+            LIMIT :limit
+        '''), {'limit': self.capacity * 2, 'sources': LEARNABLE_SOURCES})
+
+        # 由舊到新寫入，讓最近使用的商家留在 LRU 尾端
+        for merchant, category_id, uses, _ in reversed(result.fetchall()):
+            self.learn(merchant, category_id, int(uses))
+        return len(self)
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,85 @@
+"""
+斷路器
+上游連續失敗 failure_threshold 次後開啟，reset_timeout 秒內直接拒絕請求（不等待逾時）；
+之後放行一次試探請求（half_open），成功即關閉，失敗則重新開啟
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，未呼叫上游"""
+
+
+class CircuitBreaker:
+    """上游呼叫的斷路器（執行緒安全）"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_count = 0
+        self.rejected = 0
+        self.last_error: Optional[str] = None
+        self._opened_at = 0.0
+        self._opened_time: Optional[datetime] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否可以呼叫上游；開啟超過 reset_timeout 後只放行一個試探請求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """不允許呼叫時拋出 CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(f'{self.name} 暫停呼叫（連續失敗 {self.failures} 次）')
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self, error: Optional[str] = None):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self._trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened_count += 1
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._opened_time = datetime.now()
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'failures': self.failures,
+                'failure_threshold': self.failure_threshold,
+                'reset_timeout_seconds': self.reset_timeout,
+                'opened_count': self.opened_count,
+                'opened_at': self._opened_time.isoformat() if self.state != self.CLOSED and self._opened_time else None,
+                'rejected': self.rejected,
+                'last_error': self.last_error
+            }
@@ -0,0 +1,523 @@
+"""
+財務總覽服務
+交易摘要、預算、財務目標與智慧建議共用同一份輸入資料：
+先一次載入（彙總列、預算、目標），再分別組出各區塊的回應內容。
+/api/dashboard 一次回傳全部區塊，各區塊的獨立 API 只是同一套計算的薄包裝。
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import text
+
+from app.services.budget_service import load_budgets
+from app.services.report_service import category_rows, ledger_rows, sum_rows
+
+
+def _as_date(value) -> Optional[date]:
+    """將 'YYYY-MM-DD' 字串或 datetime 轉成 date"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+# ========================================
+# 共用輸入資料
+# ========================================
+
+def load_goals(db, status: Optional[str] = None, ids: Optional[Iterable[int]] = None) -> List[Dict]:
+    """載入財務目標（依優先順序），ids 指定時只載入這些目標"""
+    query = '''
+        SELECT id, name, target_amount, current_amount, deadline, priority,
+               status, description, created_at
+        FROM financial_goals
+        WHERE TRUE
+    '''
+    params = {}
+    if status:
+        query += ' AND status = :status'
+        params['status'] = status
+    if ids is not None:
+        ids = tuple(ids)
+        if not ids:
+            return []
+        query += ' AND id IN :ids'
+        params['ids'] = ids
+    query += ' ORDER BY priority DESC'
+
+    return [{
+        'id': row[0],
+        'name': row[1],
+        'target_amount': float(row[2]) if row[2] else 0,
+        'current_amount': float(row[3]) if row[3] else 0,
+        'deadline': _as_date(row[4]),
+        'priority': row[5],
+        'status': row[6],
+        'description': row[7],
+        'created_at': _as_date(row[8])
+    } for row in db.session.execute(text(query), params)]
+
+
+# ========================================
+# 交易摘要
+# ========================================
+
+def build_budget_status(budgets: List[Dict]) -> List[Dict]:
+    """交易摘要中的預算使用狀況"""
+    budget_status = []
+    for budget in budgets:
+        budget_amount = budget['amount']
+        spent = budget['spent']
+        remaining = budget_amount - spent
+        usage_percent = (spent / budget_amount * 100) if budget_amount > 0 else 0
+
+        budget_status.append({
+            'budget_id': budget['id'],
+            'name': budget['name'],
+            'category_name': budget['category_name'],
+            'icon': budget['category_icon'],
+            'budget_amount': budget_amount,
+            'spent': spent,
+            'remaining': remaining,
+            'usage_percent': round(usage_percent, 1),
+            'status': 'over' if remaining < 0 else 'warning' if usage_percent > 80 else 'ok'
+        })
+    return budget_status
+
+
+def build_summary(rows: List[Dict], budgets: List[Dict], today: date, start, end) -> Dict:
+    """
+    交易摘要
+    rows 需涵蓋 start ~ end 與今日
+    """
+    start, end = _as_date(start), _as_date(end)
+
+    # === 今日統計 ===
+    today_income = sum_rows(rows, 'income', today, today)
+    today_expense = sum_rows(rows, 'expense', today, today)
+
+    # === 期間統計 ===
+    total_income = sum_rows(rows, 'income', start, end)
+    total_expense = sum_rows(rows, 'expense', start, end)
+
+    # === 各類別支出統計 + 占比 ===
+    categories_breakdown = []
+    for item in category_rows(rows, 'expense', start, end):
+        amount = item['amount']
+        percentage = (amount / total_expense * 100) if total_expense > 0 else 0
+        categories_breakdown.append({
+            'category_id': item['category_id'],
+            'category': item['name'],
+            'icon': item['icon'],
+            'color': item['color'],
+            'amount': amount,
+            'percentage': round(percentage, 1)
+        })
+
+    return {
+        'today': {
+            'date': today.strftime('%Y-%m-%d'),
+            'income': today_income,
+            'expense': today_expense,
+            'net': today_income - today_expense
+        },
+        'period': {
+            'start': start.strftime('%Y-%m-%d'),
+            'end': end.strftime('%Y-%m-%d')
+        },
+        'total_income': total_income,
+        'total_expense': total_expense,
+        'net': total_income - total_expense,
+        'savings_rate': round((total_income - total_expense) / total_income * 100, 1) if total_income > 0 else 0,
+        'categories_breakdown': categories_breakdown,
+        'budget_status': build_budget_status(budgets)
+    }
+
+
+# ========================================
+# 預算
+# ========================================
+
+def build_budgets(budgets: List[Dict], today: date) -> List[Dict]:
+    """
+    預算列表及使用狀態（唯讀）
+    過期未達標的預算不列出；實際的刪除與達標標記由 budget_sweeper 背景工作處理
+    """
+    payload = []
+
+    for budget in budgets:
+        budget_id = budget['id']
+        budget_amount = budget['amount']
+        spent = budget['spent']
+        remaining = budget_amount - spent
+        usage_percent = (spent / budget_amount * 100) if budget_amount > 0 else 0
+        end_date = _as_date(budget['end_date'])
+
+        # 計算剩餘天數
+        days_remaining = None
+        is_expired = False
+        if end_date:
+            days_remaining = (end_date - today).days
+            is_expired = days_remaining < 0
+
+        # 判斷狀態
+        is_completed = usage_percent >= 100 or spent >= budget_amount
+
+        if is_expired and not is_completed:
+            # 過期未達標 → 等待背景工作刪除
+            continue  # 不加入回傳列表
+
+        if is_completed:
+            status = 'completed'
+        elif is_expired:
+            status = 'expired'
+        elif usage_percent > 80:
+            status = 'warning'
+        else:
+            status = 'ok'
+
+        payload.append({
+            'id': budget_id,
+            'category_id': budget['category_id'],
+            'name': budget['name'],
+            'amount': budget_amount,
+            'period': budget['period'],
+            'start_date': str(budget['start_date']) if budget['start_date'] else None,
+            'end_date': str(budget['end_date']) if budget['end_date'] else None,
+            'category_name': budget['category_name'],
+            'category_icon': budget['category_icon'],
+            'spent': spent,
+            'remaining': remaining,
+            'usage_percent': round(usage_percent, 2),
+            'days_remaining': days_remaining,
+            'status': status
+        })
+
+    return payload
+
+
+# ========================================
+# 財務目標
+# ========================================
+
+def build_goals(goals: List[Dict], today: date) -> List[Dict]:
+    """財務目標列表，含落後/如期/超前判斷與每日/每週/每月需存金額"""
+    payload = []
+
+    for goal in goals:
+        target = goal['target_amount']
+        current = goal['current_amount']
+        progress = (current / target * 100) if target > 0 else 0
+
+        # 計算剩餘天數與預期進度
+        days_remaining = None
+        expected_progress = 0
+        progress_status = 'on_track'  # 預設如期
+
+        if goal['deadline'] and goal['status'] == 'in_progress':
+            deadline = goal['deadline']
+
+            # 如果沒有建立日期，假設從目標開始到現在的一半時間
+            created_at = goal['created_at'] or today - timedelta(days=30)
+
+            days_remaining = (deadline - today).days
+            total_days = (deadline - created_at).days
+            days_passed = (today - created_at).days
+
+            # 計算預期進度（根據時間比例）
+            if total_days > 0:
+                expected_progress = (days_passed / total_days) * 100
+
+            # 判斷進度狀態
+            if progress > 0 and expected_progress > 0:
+                ratio = progress / expected_progress
+                if ratio < 0.8:
+                    progress_status = 'behind'  # 落後
+                elif ratio > 1.2:
+                    progress_status = 'ahead'   # 超前
+                else:
+                    progress_status = 'on_track'  # 如期
+            elif days_remaining < 0:
+                progress_status = 'overdue'  # 已過期
+
+        # 計算每日/每週/每月需存金額
+        remaining_amount = target - current
+        daily_needed = 0
+        weekly_needed = 0
+        monthly_needed = 0
+
+        if days_remaining and days_remaining > 0 and remaining_amount > 0:
+            daily_needed = remaining_amount / days_remaining
+            weekly_needed = daily_needed * 7
+            monthly_needed = daily_needed * 30
+
+        payload.append({
+            'id': goal['id'],
+            'name': goal['name'],
+            'target_amount': target,
+            'current_amount': current,
+            'deadline': str(goal['deadline']) if goal['deadline'] else None,
+            'priority': goal['priority'],
+            'status': goal['status'],
+            'description': goal['description'],
+            'progress': round(progress, 2),
+            'expected_progress': round(expected_progress, 2),
+            'remaining_amount': remaining_amount,
+            'days_remaining': days_remaining,
+            'progress_status': progress_status,
+            'recommendations': {
+                'daily_saving_needed': round(daily_needed, 0),
+                'weekly_saving_needed': round(weekly_needed, 0),
+                'monthly_saving_needed': round(monthly_needed, 0)
+            }
+        })
+
+    return payload
+
+
+# ========================================
+# 智慧建議
+# ========================================
+
+def build_suggestions(rows: List[Dict], budgets: List[Dict], goals: List[Dict], today: date) -> Dict:
+    """
+    財務建議
+    根據使用者可支配金額與消費習慣生成可行策略，並提供動態調整建議（落後/如期/超前）
+    rows 需涵蓋本月 1 日之後的彙總列
+    """
+    suggestions = []
+    adjustment_plans = []
+
+    # 1. 分析本月支出
+    start_of_month = today.replace(day=1)
+    monthly_expense = sum_rows(rows, 'expense', start_of_month)
+    monthly_income = sum_rows(rows, 'income', start_of_month)
+
+    # 計算可支配金額
+    disposable = monthly_income - monthly_expense
+    days_passed = today.day
+    days_in_month = 30
+    days_remaining = days_in_month - days_passed
+    daily_available = disposable / days_remaining if days_remaining > 0 else 0
+    weekly_available = daily_available * 7
+
+    # 2. 分析各類別支出（找出最高支出類別）
+    top_categories = [{
+        'name': item['name'],
+        'amount': item['amount']
+    } for item in category_rows(rows, 'expense', start_of_month)[:3]]
+
+    # 3. 分析預算狀態
+    for budget in budgets:
+        budget_amount = budget['amount']
+        spent = budget['spent']
+        category_name = budget['category_name']
+        usage = (spent / budget_amount * 100) if budget_amount > 0 else 0
+        remaining_budget = budget_amount - spent
+
+        if usage > 100:
+            over_amount = spent - budget_amount
+            suggestions.append({
+                'type': 'warning',
+                'category': '預算超支',
+                'message': f'「{category_name}」預算已超支 ${over_amount:.0f}，建議本月減少此類支出',
+                'action': f'建議每週減少 ${over_amount/4:.0f} 的{category_name}支出'
+            })
+        elif usage > 80:
+            suggestions.append({
+                'type': 'caution',
+                'category': '預算警告',
+                'message': f'「{category_name}」預算已使用 {usage:.0f}%，剩餘 ${remaining_budget:.0f}',
+                'action': f'建議每日{category_name}支出控制在 ${remaining_budget/max(days_remaining, 1):.0f} 以內'
+            })
+
+    # 4. 分析儲蓄目標（含落後/如期/超前判斷）
+    for goal in goals:
+        if goal['status'] != 'in_progress' or not goal['deadline']:
+            continue
+
+        goal_id = goal['id']
+        goal_name = goal['name']
+        target = goal['target_amount']
+        current = goal['current_amount']
+        remaining = target - current
+        progress = (current / target * 100) if target > 0 else 0
+
+        deadline = goal['deadline']
+        created_at = goal['created_at'] or today - timedelta(days=30)
+
+        days_to_deadline = (deadline - today).days
+        total_days = (deadline - created_at).days
+        days_passed_goal = (today - created_at).days
+
+        # 計算預期進度
+        expected_progress = (days_passed_goal / total_days * 100) if total_days > 0 else 0
+
+        # 計算每日/每週/每月需存金額
+        daily_needed = remaining / days_to_deadline if days_to_deadline > 0 else 0
+        weekly_needed = daily_needed * 7
+        monthly_needed = daily_needed * 30
+
+        # 判斷進度狀態並生成建議
+        if progress > 0 and expected_progress > 0:
+            ratio = progress / expected_progress
+
+            if ratio < 0.8:
+                # === 落後 ===
+                shortfall = (expected_progress - progress) / 100 * target
+                extra_weekly = shortfall / (days_to_deadline / 7) if days_to_deadline > 7 else shortfall
+
+                # 建議延長期限
+                if daily_needed > daily_available and daily_available > 0:
+                    new_days_needed = int(remaining / daily_available)
+                    new_deadline = today + timedelta(days=new_days_needed)
+                    new_deadline_str = new_deadline.strftime('%Y-%m-%d')
+                else:
+                    new_deadline_str = None
+
+                suggestions.append({
+                    'type': 'warning',
+                    'category': '目標進度落後',
+                    'message': f'「{goal_name}」進度落後！目前 {progress:.0f}%，預期應達 {expected_progress:.0f}%',
+                    'action': f'建議每週增加儲蓄 ${extra_weekly:.0f}'
+                })
+
+                adjustment_plans.append({
+                    'goal_id': goal_id,
+                    'goal_name': goal_name,
+                    'status': 'behind',
+                    'current_progress': round(progress, 1),
+                    'expected_progress': round(expected_progress, 1),
+                    'adjusted_weekly_saving': round(weekly_needed + extra_weekly, 0),
+                    'adjusted_monthly_saving': round((weekly_needed + extra_weekly) * 4, 0),
+                    'reduce_category': top_categories[0]['name'] if top_categories else None,
+                    'reduce_amount': round(extra_weekly, 0),
+                    'new_deadline': new_deadline_str,
+                    'message': f'需加速儲蓄或延長期限至 {new_deadline_str}' if new_deadline_str else '需加速儲蓄'
+                })
+
+            elif ratio > 1.2:
+                # === 超前 ===
+                surplus = (progress - expected_progress) / 100 * target
+                days_ahead = int((progress - expected_progress) / 100 * total_days)
+                early_finish = deadline - timedelta(days=days_ahead)
+
+                suggestions.append({
+                    'type': 'success',
+                    'category': '目標進度超前',
+                    'message': f'🎉「{goal_name}」進度超前！目前 {progress:.0f}%，預期 {expected_progress:.0f}%',
+                    'action': f'可提前於 {early_finish.strftime("%Y-%m-%d")} 完成，或將多餘 ${surplus:.0f} 分配到其他目標'
+                })
+
+                adjustment_plans.append({
+                    'goal_id': goal_id,
+                    'goal_name': goal_name,
+                    'status': 'ahead',
+                    'current_progress': round(progress, 1),
+                    'expected_progress': round(expected_progress, 1),
+                    'early_finish_date': early_finish.strftime('%Y-%m-%d'),
+                    'surplus_amount': round(surplus, 0),
+                    'options': [
+                        f'提前完成：預計 {early_finish.strftime("%Y-%m-%d")}',
+                        f'分配多餘儲蓄 ${surplus:.0f} 到其他目標',
+                        f'本月可增加娛樂預算 ${surplus/4:.0f} 作為獎勵'
+                    ],
+                    'message': '表現優異！可選擇提前完成或獎勵自己'
+                })
+
+            else:
+                # === 如期 ===
+                suggestions.append({
+                    'type': 'info',
+                    'category': '目標進度正常',
+                    'message': f'「{goal_name}」進度正常，目前 {progress:.0f}%',
+                    'action': f'繼續保持每週存 ${weekly_needed:.0f} 即可達成'
+                })
+
+                adjustment_plans.append({
+                    'goal_id': goal_id,
+                    'goal_name': goal_name,
+                    'status': 'on_track',
+                    'current_progress': round(progress, 1),
+                    'expected_progress': round(expected_progress, 1),
+                    'weekly_saving': round(weekly_needed, 0),
+                    'monthly_saving': round(monthly_needed, 0),
+                    'message': '保持現有儲蓄策略即可'
+                })
+
+    # 5. 儲蓄率建議
+    if monthly_income > 0:
+        savings_rate = (disposable / monthly_income * 100) if disposable > 0 else 0
+
+        if savings_rate < 10:
+            suggestions.append({
+                'type': 'warning',
+                'category': '儲蓄率偏低',
+                'message': f'本月儲蓄率僅 {savings_rate:.1f}%',
+                'action': '建議目標至少 20%，可從減少最高支出類別開始'
+            })
+        elif savings_rate >= 30:
+            suggestions.append({
+                'type': 'success',
+                'category': '儲蓄表現優異',
+                'message': f'本月儲蓄率達 {savings_rate:.1f}%，表現優異！',
+                'action': '可考慮增加投資或提高儲蓄目標'
+            })
+
+    return {
+        'summary': {
+            'monthly_income': monthly_income,
+            'monthly_expense': monthly_expense,
+            'disposable': disposable,
+            'daily_available': round(daily_available, 0),
+            'weekly_available': round(weekly_available, 0),
+            'days_remaining': days_remaining,
+            'top_expense_categories': top_categories
+        },
+        'suggestions': suggestions,
+        'adjustment_plans': adjustment_plans
+    }
+
+
+# ========================================
+# 各區塊的進入點
+# ========================================
+
+def get_transaction_summary(db, start=None, end=None, today: Optional[date] = None) -> Dict:
+    """交易摘要（預設本月 1 日至今日）"""
+    today = today or datetime.now().date()
+    start = _as_date(start) or today.replace(day=1)
+    end = _as_date(end) or today
+    rows = ledger_rows(db, min(start, today), max(end, today))
+    return build_summary(rows, load_budgets(db), today, start, end)
+
+
+def get_suggestions(db, today: Optional[date] = None) -> Dict:
+    """智慧建議"""
+    today = today or datetime.now().date()
+    rows = ledger_rows(db, today.replace(day=1))
+    return build_suggestions(rows, load_budgets(db), load_goals(db), today)
+
+
+def get_dashboard(db, today: Optional[date] = None) -> Dict:
+    """
+    財務總覽：一次載入共用資料，回傳交易摘要、預算、目標與建議
+    共 3 次查詢（本月彙總列、預算、目標）
+    """
+    today = today or datetime.now().date()
+    start_of_month = today.replace(day=1)
+
+    rows = ledger_rows(db, start_of_month)
+    budgets = load_budgets(db)
+    goals = load_goals(db)
+
+    return {
+        'summary': build_summary(rows, budgets, today, start_of_month, today),
+        'budgets': build_budgets(budgets, today),
+        'goals': build_goals(goals, today),
+        'suggestions': build_suggestions(rows, budgets, goals, today),
+        'generated_at': datetime.now().isoformat()
+    }
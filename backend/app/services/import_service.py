@@ -0,0 +1,295 @@
+"""
+交易批次匯入服務
+解析銀行 CSV / OFX 對帳單，以 PostgreSQL COPY 寫入暫存表後一次併入 transactions
+"""
+import csv
+import io
+import re
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import text
+
+
+IMPORT_BATCH_SIZE = 5000
+MAX_REPORTED_ERRORS = 20
+
+# CSV 欄位別名（小寫比對）
+CSV_COLUMN_ALIASES = {
+    'date': ['date', '日期', '交易日期', '記帳日'],
+    'description': ['description', '說明', '摘要', '備註說明', '交易說明', 'memo', 'payee'],
+    'amount': ['amount', '金額', '交易金額'],
+    'withdrawal': ['withdrawal', 'debit', '支出', '提款', '支出金額'],
+    'deposit': ['deposit', 'credit', '存入', '收入', '存入金額'],
+    'type': ['type', '類型', '收支'],
+    'category_id': ['category_id', '分類'],
+    'account_id': ['account_id'],
+    'notes': ['notes', '備註'],
+}
+
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%Y%m%d', '%Y.%m.%d']
+
+
+class StatementFormatError(ValueError):
+    """匯入檔案格式錯誤"""
+
+
+class ImportAccountError(ValueError):
+    """匯入的帳戶不存在或已停用"""
+
+
+def parse_date(value: str):
+    """解析日期，支援民國年（例如 113/01/05）"""
+    value = value.strip()
+    parts = re.split(r'[/\-.]', value)
+    if len(parts) == 3 and len(parts[0]) <= 3 and parts[0].isdigit():
+        value = f'{int(parts[0]) + 1911}-{parts[1]}-{parts[2]}'
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f'無法解析日期: {value}')
+
+
+def parse_amount(value: str) -> float:
+    """解析金額，去除千分位與貨幣符號；括號視為負數"""
+    value = value.strip().replace(',', '').replace('NT$', '').replace('$', '')
+    negative = value.startswith('(') and value.endswith(')')
+    if negative:
+        value = value[1:-1]
+    amount = float(value)
+    return -amount if negative else amount
+
+
+def _resolve_columns(fieldnames: List[str]) -> Dict[str, str]:
+    """將 CSV 標頭對應到標準欄位名稱"""
+    lowered = {name.strip().lower(): name for name in fieldnames if name}
+    columns = {}
+    for field, aliases in CSV_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in lowered:
+                columns[field] = lowered[alias]
+                break
+    return columns
+
+
+def _csv_field(record: Dict, columns: Dict[str, str], name: str) -> str:
+    column = columns.get(name)
+    return (record.get(column) or '').strip() if column else ''
+
+
+def parse_csv(content: str) -> Tuple[List[Dict], List[Dict]]:
+    """解析 CSV 對帳單，回傳 (rows, errors)"""
+    reader = csv.DictReader(io.StringIO(content.lstrip('\ufeff')))
+    columns = _resolve_columns(reader.fieldnames or [])
+
+    if 'date' not in columns or 'description' not in columns:
+        raise StatementFormatError('CSV 需包含日期與說明欄位')
+    if 'amount' not in columns and 'withdrawal' not in columns and 'deposit' not in columns:
+        raise StatementFormatError('CSV 需包含金額欄位')
+
+    rows, errors = [], []
+    for line_no, record in enumerate(reader, start=2):
+        def field(name):
+            return _csv_field(record, columns, name)
+
+        try:
+            if field('amount'):
+                amount = parse_amount(field('amount'))
+            else:
+                withdrawal = parse_amount(field('withdrawal')) if field('withdrawal') else 0
+                deposit = parse_amount(field('deposit')) if field('deposit') else 0
+                amount = deposit - withdrawal
+
+            tx_type = field('type').lower()
+            if tx_type in ('支出', 'expense'):
+                tx_type = 'expense'
+            elif tx_type in ('收入', 'income'):
+                tx_type = 'income'
+            else:
+                tx_type = 'expense' if amount < 0 else 'income'
+
+            rows.append({
+                'date': parse_date(field('date')),
+                'description': field('description'),
+                'amount': abs(amount),
+                'type': tx_type,
+                'category_id': int(field('category_id')) if field('category_id').isdigit() else None,
+                'account_id': int(field('account_id')) if field('account_id').isdigit() else None,
+                'notes': field('notes')
+            })
+        except ValueError as e:
+            errors.append({'line': line_no, 'error': str(e)})
+
+    return rows, errors
+
+
+OFX_TRANSACTION_PATTERN = re.compile(r'<STMTTRN>(.*?)(?:</STMTTRN>|(?=<STMTTRN>)|(?=</BANKTRANLIST>))',
+                                     re.IGNORECASE | re.DOTALL)
+
+
+def _ofx_tag(block: str, tag: str) -> str:
+    match = re.search(rf'<{tag}>([^<\r\n]*)', block, re.IGNORECASE)
+    return match.group(1).strip() if match else ''
+
+
+def parse_ofx(content: str) -> Tuple[List[Dict], List[Dict]]:
+    """解析 OFX（SGML 或 XML）對帳單，回傳 (rows, errors)"""
+    rows, errors = [], []
+    for index, match in enumerate(OFX_TRANSACTION_PATTERN.finditer(content), start=1):
+        block = match.group(1)
+        try:
+            amount = parse_amount(_ofx_tag(block, 'TRNAMT'))
+            description = _ofx_tag(block, 'NAME') or _ofx_tag(block, 'MEMO')
+            rows.append({
+                'date': datetime.strptime(_ofx_tag(block, 'DTPOSTED')[:8], '%Y%m%d').date(),
+                'description': description,
+                'amount': abs(amount),
+                'type': 'expense' if amount < 0 else 'income',
+                'category_id': None,
+                'account_id': None,
+                'notes': _ofx_tag(block, 'MEMO') if _ofx_tag(block, 'NAME') else ''
+            })
+        except ValueError as e:
+            errors.append({'line': index, 'error': str(e)})
+
+    if not rows and not errors:
+        raise StatementFormatError('OFX 檔案中找不到交易記錄')
+    return rows, errors
+
+
+def parse_statement(content: str, fmt: Optional[str] = None, filename: str = '') -> Tuple[List[Dict], List[Dict]]:
+    """依格式（csv / ofx）解析對帳單；未指定時依副檔名或內容判斷"""
+    if not fmt:
+        lowered = filename.lower()
+        if lowered.endswith(('.ofx', '.qfx')) or '<OFX>' in content[:4096].upper():
+            fmt = 'ofx'
+        else:
+            fmt = 'csv'
+
+    fmt = fmt.lower()
+    if fmt == 'csv':
+        return parse_csv(content)
+    if fmt in ('ofx', 'qfx'):
+        return parse_ofx(content)
+    raise StatementFormatError(f'不支援的格式: {fmt}')
+
+
+def check_import_accounts(db, rows: List[Dict], account_id: int):
+    """
+    確認匯入帳戶與 CSV account_id 欄位指定的帳戶都存在且啟用中（寫入暫存表之前呼叫）
+    有任何帳戶無效時拋出 ImportAccountError
+    """
+    account_ids = {account_id} | {row['account_id'] for row in rows if row.get('account_id')}
+    active = {row[0] for row in db.session.execute(text(
+        'SELECT id FROM accounts WHERE id IN :ids AND is_active = true'
+    ), {'ids': tuple(account_ids)})}
+    invalid = sorted(account_ids - active)
+    if invalid:
+        raise ImportAccountError(f"帳戶不存在或已停用: {', '.join(str(i) for i in invalid)}")
+
+
+def _batches(rows: List[Dict], size: int) -> Iterator[List[Dict]]:
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+def iter_import_transactions(db, rows: List[Dict], account_id: int,
+                             categorize_many: Callable[[List[Tuple[str, float]]], List[Tuple[Optional[int], Optional[str]]]],
+                             batch_size: int = IMPORT_BATCH_SIZE) -> Iterator[Dict]:
+    """
+    批次匯入交易，逐步回傳進度
+    1. 分批自動分類（categorize_many 回傳 (分類 ID, 分類來源)，來源記錄在 row['category_source']）
+    2. COPY 寫入暫存表
+    3. 單一交易內併入 transactions，並依帳戶彙總一次更新餘額
+    最後一筆回傳 {'stage': 'done', ...} 摘要
+    """
+    total = len(rows)
+    yield {'stage': 'parsed', 'processed': 0, 'total': total}
+
+    try:
+        db.session.execute(text('''
+            CREATE TEMP TABLE IF NOT EXISTS transactions_import_staging (
+                account_id INTEGER NOT NULL,
+                category_id INTEGER,
+                date DATE NOT NULL,
+                description VARCHAR(500) NOT NULL,
+                amount NUMERIC(15, 2) NOT NULL,
+                type VARCHAR(50) NOT NULL,
+                notes TEXT,
+                category_source VARCHAR(20)
+            ) ON COMMIT DROP
+        '''))
+        cursor = db.session.connection().connection.cursor()
+
+        processed = 0
+        for batch in _batches(rows, batch_size):
+            # 分批分類，未指定分類者才套用自動分類
+            pending = []
+            for row in batch:
+                if row.get('category_id'):
+                    row['category_source'] = 'user'
+                else:
+                    pending.append(row)
+            categories = categorize_many([(row['description'], row['amount']) for row in pending])
+            for row, (category_id, source) in zip(pending, categories):
+                row['category_id'] = category_id or (8 if row['type'] == 'expense' else 12)
+                row['category_source'] = source if category_id else 'default'
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in batch:
+                writer.writerow([
+                    row.get('account_id') or account_id,
+                    row['category_id'],
+                    row['date'].isoformat(),
+                    row['description'][:500],
+                    f"{row['amount']:.2f}",
+                    row['type'],
+                    row.get('notes') or '',
+                    row['category_source']
+                ])
+            buffer.seek(0)
+            cursor.copy_expert(
+                'COPY transactions_import_staging '
+                '(account_id, category_id, date, description, amount, type, notes, category_source) '
+                'FROM STDIN WITH (FORMAT csv)',
+                buffer
+            )
+
+            processed += len(batch)
+            yield {'stage': 'staged', 'processed': processed, 'total': total}
+
+        db.session.execute(text('''
+            INSERT INTO transactions (account_id, category_id, date, description, amount, type, notes, category_source)
+            SELECT account_id, category_id, date, description, amount, type, notes, category_source
+            FROM transactions_import_staging
+        '''))
+
+        balance_result = db.session.execute(text('''
+            UPDATE accounts a
+            SET balance = a.balance + d.delta, updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT account_id,
+                       SUM(CASE WHEN type = 'expense' THEN -amount ELSE amount END) AS delta
+                FROM transactions_import_staging
+                GROUP BY account_id
+            ) d
+            WHERE a.id = d.account_id
+            RETURNING a.id, d.delta
+        '''))
+        balance_changes = {row[0]: float(row[1]) for row in balance_result}
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    yield {
+        'stage': 'done',
+        'processed': total,
+        'total': total,
+        'imported': total,
+        'balance_changes': balance_changes
+    }
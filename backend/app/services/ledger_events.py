@@ -0,0 +1,226 @@
+"""
+帳本變動推播
+交易、預算、目標寫入 commit 後，只針對受影響的分類、預算與目標重新查詢，
+組成精簡的差異事件推送給所有 SSE 連線；
+開著的分頁與其他裝置不需重新呼叫 /api/dashboard 等彙總 API
+
+事件中心在行程內：只有同一個行程的寫入會推送給該行程的 SSE 連線，
+部署時需以單一行程（可多執行緒）執行 Flask；事件編號帶有行程啟動時的 epoch，
+重新啟動或連到另一個行程時，前端帶著舊編號重連會收到 resync
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+
+from app.services.budget_service import load_budgets
+from app.services.dashboard_service import _as_date, build_budget_status, build_goals, load_goals
+
+
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def month_category_totals(db, changes: Iterable[Tuple[int, date]]) -> Tuple[List[Dict], List[Dict]]:
+    """
+    受影響分類在受影響月份的累計金額，以及這些月份的總收支
+    changes 為 (category_id, 交易日期)；回傳 (categories, months)
+    """
+    keys = {(category_id, _month_start(day)) for category_id, day in changes}
+    if not keys:
+        return [], []
+    months = sorted({month for _, month in keys})
+    start, end = months[0], _next_month(months[-1])
+
+    totals = {key: {'income': 0.0, 'expense': 0.0, 'count': 0} for key in keys}
+    month_totals = {month: {'income': 0.0, 'expense': 0.0} for month in months}
+    result = db.session.execute(text('''
+        SELECT category_id, type, date_trunc('month', date)::date AS month,
+               SUM(total), SUM(transaction_count)
+        FROM daily_category_totals
+        WHERE date >= :start AND date < :end
+        GROUP BY category_id, type, month
+    '''), {'start': start, 'end': end})
+    for category_id, tx_type, month, total, count in result:
+        if month in month_totals and tx_type in ('income', 'expense'):
+            month_totals[month][tx_type] += float(total or 0)
+        entry = totals.get((category_id, month))
+        if entry is not None and tx_type in ('income', 'expense'):
+            entry[tx_type] += float(total or 0)
+            entry['count'] += int(count or 0)
+
+    # 附上分類名稱與圖示，前端可直接加入原本沒有的分類
+    category_ids = tuple({category_id for category_id, _ in keys if category_id is not None})
+    names = {row[0]: row[1:] for row in db.session.execute(text(
+        'SELECT id, name, icon, color FROM categories WHERE id IN :ids'
+    ), {'ids': category_ids})} if category_ids else {}
+
+    categories = []
+    for (category_id, month), entry in sorted(totals.items(), key=lambda item: (item[0][1], item[0][0] or 0)):
+        name, icon, color = names.get(category_id, (None, None, None))
+        categories.append({
+            'category_id': category_id,
+            'category': name,
+            'icon': icon,
+            'color': color,
+            'month': month.strftime('%Y-%m'),
+            'income': round(entry['income'], 2),
+            'expense': round(entry['expense'], 2),
+            'transaction_count': entry['count']
+        })
+    month_rows = [{
+        'month': month.strftime('%Y-%m'),
+        'income': round(values['income'], 2),
+        'expense': round(values['expense'], 2),
+        'net': round(values['income'] - values['expense'], 2)
+    } for month, values in month_totals.items()]
+    return categories, month_rows
+
+
+class LedgerSubscription:
+    """單一連線的訂閱（佇列滿時標記需要重新同步，而不是無限累積）"""
+
+    def __init__(self, max_pending: int = 100):
+        self.queue: "queue.Queue[Dict]" = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+
+    def push(self, event: Dict):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+    def get(self, timeout: float) -> Optional[Dict]:
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class LedgerEventBus:
+    """
+    行程內的帳本事件中心
+    保留最近的事件，斷線重連（Last-Event-ID）時補送漏掉的事件；
+    漏掉的事件已不在保留範圍內、或編號來自其他 epoch（重新啟動、其他行程）時，要求前端重新載入
+    事件編號格式為「epoch-序號」
+    """
+
+    def __init__(self, history: int = 200, epoch: Optional[str] = None):
+        self.epoch = epoch or f'{time.time_ns():x}{os.getpid():x}'
+        self._subscriptions = set()
+        self._recent: deque = deque(maxlen=history)
+        self._ids = itertools.count(1)
+        self._last_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def last_event_id(self) -> str:
+        return f'{self.epoch}-{self._last_id}'
+
+    def _sequence(self, event_id: str) -> Optional[int]:
+        """取出本 epoch 的事件序號；格式不符或來自其他 epoch 時回傳 None"""
+        epoch, _, sequence = event_id.rpartition('-')
+        return int(sequence) if epoch == self.epoch and sequence.isdigit() else None
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Tuple[LedgerSubscription, Optional[List[Dict]]]:
+        """
+        訂閱事件；回傳 (訂閱, 需補送的事件)
+        需補送的事件為 None 表示無法補齊，前端應重新載入
+        """
+        subscription = LedgerSubscription()
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if not last_event_id:
+                return subscription, []
+            sequence = self._sequence(last_event_id)
+            if sequence is None or sequence > self._last_id:
+                return subscription, None
+            if sequence == self._last_id:
+                return subscription, []
+            missed = [event for event in self._recent if event['sequence'] > sequence]
+            if not missed or missed[0]['sequence'] != sequence + 1:
+                return subscription, None
+            return subscription, missed
+
+    def unsubscribe(self, subscription: LedgerSubscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def listening(self) -> bool:
+        return bool(self._subscriptions)
+
+    def _skip(self):
+        """沒有連線時不組事件，但仍推進事件編號，之後帶舊編號重連的前端會收到重新同步"""
+        with self._lock:
+            self._last_id = next(self._ids)
+            self._recent.clear()
+
+    def publish(self, event: Dict) -> Dict:
+        with self._lock:
+            self._last_id = next(self._ids)
+            event = {'id': self.last_event_id, 'sequence': self._last_id, **event}
+            self._recent.append(event)
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.push(event)
+        return event
+
+    def publish_changes(self, db, reason: str,
+                        transactions: Iterable[Tuple[Optional[int], object]] = (),
+                        budget_categories: Iterable[int] = (),
+                        deleted_budgets: Iterable[int] = (),
+                        goals: Iterable[int] = ()):
+        """
+        寫入 commit 後呼叫：查詢受影響的分類金額、預算使用率與目標進度並推送
+        transactions 為 (category_id, 交易日期)；沒有連線時不查詢
+        推送失敗不影響已完成的寫入
+        """
+        if not self.listening:
+            self._skip()
+            return None
+        try:
+            today = datetime.now().date()
+            changes = [(category_id, _as_date(day) or today) for category_id, day in transactions]
+            categories, months = month_category_totals(db, changes)
+
+            category_ids = {category_id for category_id, _ in changes if category_id is not None}
+            category_ids.update(budget_categories)
+            budgets = build_budget_status(load_budgets(db, category_ids)) if category_ids else []
+
+            goal_ids = set(goals)
+            event = {
+                'reason': reason,
+                'at': datetime.now().isoformat(),
+                'categories': categories,
+                'months': months,
+                'budgets': budgets,
+                'deleted_budgets': list(deleted_budgets),
+                'goals': build_goals(load_goals(db, ids=goal_ids), today) if goal_ids else []
+            }
+            return self.publish(event)
+        except Exception as e:
+            db.session.rollback()
+            print(f'帳本事件推送錯誤: {e}')
+            return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'connections': len(self._subscriptions),
+                'last_event_id': self.last_event_id
+            }
+
+
+# 建立事件中心實例
+ledger_events = LedgerEventBus()
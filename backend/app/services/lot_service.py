@@ -0,0 +1,128 @@
+"""
+持倉批次（tax lot）帳本
+- 每次買入新增一個批次；賣出時依持倉的成本計算方式扣除批次
+  fifo：先買先賣；average：各批次依比例扣除（平均成本法）
+- 買賣當下以增量方式更新 holdings 的持股、平均成本與累計已實現損益，
+  摘要與月統計直接讀取，不需重播 investment_transactions
+"""
+from typing import Dict, Optional
+
+from sqlalchemy import text
+
+
+COST_METHODS = ('average', 'fifo')
+
+
+def record_buy(db, holding_id: int, quantity: float, price: float, fee: float = 0,
+               acquired_date=None, transaction_id: Optional[int] = None) -> Dict:
+    """記錄買入：新增批次並更新持股與平均成本（不 commit）"""
+    quantity = float(quantity)
+    cost = quantity * float(price) + float(fee or 0)
+    if quantity <= 0:
+        raise ValueError('買入數量必須大於 0')
+
+    db.session.execute(text('''
+        INSERT INTO holding_lots
+            (holding_id, transaction_id, acquired_date, quantity, remaining_quantity, cost_per_share)
+        VALUES (:holding_id, :transaction_id, COALESCE(:acquired_date, CURRENT_DATE), :quantity, :quantity, :cost_per_share)
+    '''), {
+        'holding_id': holding_id,
+        'transaction_id': transaction_id,
+        'acquired_date': acquired_date,
+        'quantity': quantity,
+        'cost_per_share': cost / quantity
+    })
+
+    row = db.session.execute(text('''
+        UPDATE holdings
+        SET average_cost = (quantity * COALESCE(average_cost, 0) + :cost) / (quantity + :quantity),
+            quantity = quantity + :quantity,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = :id
+        RETURNING quantity, average_cost
+    '''), {'id': holding_id, 'quantity': quantity, 'cost': cost}).fetchone()
+
+    return {'quantity': float(row[0]), 'average_cost': float(row[1])}
+
+
+def record_sell(db, holding_id: int, quantity: float, price: float, fee: float = 0, tax: float = 0,
+                transaction_id: Optional[int] = None) -> Dict:
+    """
+    記錄賣出：依成本計算方式扣除批次，更新持股、平均成本與已實現損益（不 commit）
+    回傳 {'realized_pnl', 'cost_removed', 'remaining_quantity', 'average_cost'}
+    """
+    quantity = float(quantity)
+    holding = db.session.execute(text('''
+        SELECT quantity, COALESCE(average_cost, 0), COALESCE(cost_method, 'average')
+        FROM holdings WHERE id = :id FOR UPDATE
+    '''), {'id': holding_id}).fetchone()
+    if holding is None:
+        raise LookupError('持倉不存在')
+
+    held, average_cost, method = float(holding[0]), float(holding[1]), holding[2]
+    if quantity <= 0 or quantity > held:
+        raise ValueError('賣出數量超過持有數量')
+
+    lots = [(lot_id, float(remaining), float(cost_per_share))
+            for lot_id, remaining, cost_per_share in db.session.execute(text('''
+                SELECT id, remaining_quantity, cost_per_share
+                FROM holding_lots
+                WHERE holding_id = :id AND remaining_quantity > 0
+                ORDER BY acquired_date, id
+                FOR UPDATE
+            '''), {'id': holding_id})]
+    lot_quantity = sum(remaining for _, remaining, _ in lots)
+
+    updates = []
+    if lot_quantity < quantity:
+        # 批次資料不完整（例如批次帳本建立前的持倉），以平均成本計算
+        cost_removed = average_cost * quantity
+        updates = [{'id': lot_id, 'remaining': 0} for lot_id, _, _ in lots]
+    elif method == 'fifo':
+        cost_removed = 0.0
+        left = quantity
+        for lot_id, remaining, cost_per_share in lots:
+            if left <= 0:
+                break
+            used = min(remaining, left)
+            cost_removed += used * cost_per_share
+            left -= used
+            updates.append({'id': lot_id, 'remaining': remaining - used})
+    else:
+        lot_cost = sum(remaining * cost_per_share for _, remaining, cost_per_share in lots)
+        cost_removed = lot_cost * quantity / lot_quantity
+        ratio = 1 - quantity / lot_quantity
+        updates = [{'id': lot_id, 'remaining': round(remaining * ratio, 4)} for lot_id, remaining, _ in lots]
+        # 各批次四捨五入的尾差併入剩餘最多的批次，批次合計與 holdings.quantity 一致
+        target = round(lot_quantity - quantity, 4)
+        largest = max(updates, key=lambda update: update['remaining'])
+        largest['remaining'] = round(target - sum(u['remaining'] for u in updates if u is not largest), 4)
+
+    if updates:
+        db.session.execute(text(
+            'UPDATE holding_lots SET remaining_quantity = :remaining WHERE id = :id'
+        ), updates)
+
+    realized = quantity * float(price) - float(fee or 0) - float(tax or 0) - cost_removed
+    remaining_quantity = held - quantity
+    new_average = (held * average_cost - cost_removed) / remaining_quantity if remaining_quantity > 0 else average_cost
+
+    db.session.execute(text('''
+        UPDATE holdings
+        SET quantity = :quantity, average_cost = :average_cost,
+            realized_pnl = COALESCE(realized_pnl, 0) + :realized,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = :id
+    '''), {'id': holding_id, 'quantity': remaining_quantity, 'average_cost': new_average, 'realized': realized})
+
+    if transaction_id:
+        db.session.execute(text(
+            'UPDATE investment_transactions SET realized_pnl = :realized WHERE id = :id'
+        ), {'id': transaction_id, 'realized': realized})
+
+    return {
+        'realized_pnl': round(realized, 2),
+        'cost_removed': round(cost_removed, 2),
+        'remaining_quantity': remaining_quantity,
+        'average_cost': round(new_average, 4)
+    }
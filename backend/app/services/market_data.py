@@ -0,0 +1,343 @@
+"""
+行情客戶端
+- 直接查詢 TWSE 基本市況報導（MIS）getStockInfo.jsp，回傳格式與 twstock.realtime.get 相同
+- market_data：aiohttp 非同步客戶端，所有查詢在同一個背景 event loop 上多工執行；
+  同步介面（get / get_many）讓 Flask 執行緒只需等待結果，不必各自佔用一個阻塞的 HTTP 請求
+- market_http：requests 連線池（未安裝 aiohttp 時使用）
+- 兩者都保持連線（keep-alive）、每個請求都有連線與總逾時；
+  預設驗證憑證；CA bundle 設定只作用在行情連線，不修改全域的 ssl / requests 設定
+"""
+import asyncio
+import atexit
+import os
+import ssl
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from typing import Dict, List, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from app.services.stock_registry import stock_registry
+
+
+MIS_BASE_URL = 'https://mis.twse.com.tw/stock'
+MIS_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)',
+    'Accept': 'application/json',
+    'Referer': f'{MIS_BASE_URL}/index.jsp'
+}
+
+
+def _channel(symbol: str) -> str:
+    """MIS 查詢代碼：上櫃為 otc_，其餘為 tse_"""
+    info = stock_registry.get(symbol) or {}
+    market = 'otc' if '櫃' in (info.get('market') or '') else 'tse'
+    return f'{market}_{symbol}.tw'
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _mis_params(symbols: List[str]) -> Dict[str, str]:
+    return {
+        'ex_ch': '|'.join(_channel(symbol) for symbol in symbols),
+        'json': '1',
+        'delay': '0',
+        '_': str(int(time.time() * 1000))
+    }
+
+
+def format_stock_info(item: Dict) -> Dict:
+    """將 MIS msgArray 的一筆資料轉為 twstock.realtime 的格式"""
+    previous_close = _number(item.get('y'))
+    best_bid = (item.get('b') or '').split('_')[0]
+    # 本次揭示沒有成交（'-'）時以最佳買價、再以昨收代替
+    price = _number(item.get('z'))
+    if price is None:
+        price = _number(best_bid) or previous_close
+    timestamp = int(item.get('tlong') or 0) / 1000
+
+    return {
+        'timestamp': timestamp,
+        'info': {
+            'code': item.get('c'),
+            'channel': item.get('ch'),
+            'name': item.get('n', ''),
+            'fullname': item.get('nf', ''),
+            'time': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else ''
+        },
+        'realtime': {
+            'latest_trade_price': price,
+            'change': round(price - previous_close, 2) if price is not None and previous_close else 0,
+            'accumulate_trade_volume': item.get('v'),
+            'open': _number(item.get('o')),
+            'high': _number(item.get('h')),
+            'low': _number(item.get('l'))
+        },
+        'success': True
+    }
+
+
+def parse_stock_info(data: Dict) -> Dict:
+    """解析 getStockInfo.jsp 回應，回傳 {symbol: twstock 格式資料, 'success': bool}"""
+    if data.get('rtcode') not in (None, '0000') or 'msgArray' not in data:
+        raise RuntimeError(f"MIS 回應錯誤 {data.get('rtcode')}: {data.get('rtmessage')}")
+    result = {item['c']: format_stock_info(item) for item in data['msgArray'] if item.get('c')}
+    result['success'] = bool(result)
+    return result
+
+
+class MarketDataSession(requests.Session):
+    """行情專用的 requests Session：連線池、預設逾時與憑證設定只作用在這個 Session"""
+
+    def __init__(self, timeout: float = 5, connect_timeout: float = 2, pool_size: int = 8,
+                 verify_ssl: Union[bool, str] = True):
+        super().__init__()
+        self.timeout = (connect_timeout, timeout)
+        self.pool_size = pool_size
+        self.verify = verify_ssl
+        self.headers.update(MIS_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+class MisHttpClient:
+    """MIS 的同步客戶端（requests 連線池，可由多個執行緒同時使用）"""
+
+    def __init__(self, session: MarketDataSession, base_url: str = MIS_BASE_URL):
+        self.session = session
+        self.base_url = base_url
+        self.pool_size = session.pool_size
+        self._warmed = False
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+
+    def _warm_up(self):
+        # MIS 需要先取得 session cookie（之後由 Session 沿用）
+        if self._warmed:
+            return
+        with self._lock:
+            if not self._warmed:
+                self.session.get(f'{self.base_url}/index.jsp').raise_for_status()
+                self._warmed = True
+
+    def fetch(self, symbols: List[str]) -> Dict:
+        """查詢一批股票（格式同 twstock.realtime.get）"""
+        self.requests += 1
+        try:
+            self._warm_up()
+            response = self.session.get(f'{self.base_url}/api/getStockInfo.jsp', params=_mis_params(symbols))
+            response.raise_for_status()
+            return parse_stock_info(response.json())
+        except Exception:
+            self.errors += 1
+            # cookie 可能已失效，下次重新取得
+            self._warmed = False
+            raise
+
+    def stats(self) -> Dict:
+        return {
+            'backend': 'requests',
+            'requests': self.requests,
+            'errors': self.errors,
+            'pool_size': self.pool_size
+        }
+
+
+class AsyncMarketDataClient:
+    """MIS 行程共用的 aiohttp 連線池（只能在背景 event loop 中使用）"""
+
+    def __init__(self, base_url: str = MIS_BASE_URL, timeout: float = 5, connect_timeout: float = 2,
+                 pool_size: int = 8, keepalive: float = 30, verify_ssl: Union[bool, str] = True):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        # verify_ssl 為 CA bundle 路徑時以該檔案建立驗證用的 SSLContext
+        self.ssl = ssl.create_default_context(cafile=verify_ssl) if isinstance(verify_ssl, str) else verify_ssl
+        self._session = None
+        self._session_lock = None
+        self.requests = 0
+        self.errors = 0
+
+    async def _get_session(self):
+        if self._session is not None and not self._session.closed:
+            return self._session
+        if self._session_lock is None:
+            self._session_lock = asyncio.Lock()
+        async with self._session_lock:
+            if self._session is None or self._session.closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(
+                        limit=self.pool_size,
+                        limit_per_host=self.pool_size,
+                        keepalive_timeout=self.keepalive,
+                        ssl=self.ssl
+                    ),
+                    headers=MIS_HEADERS,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+                )
+                try:
+                    # MIS 需要先取得 session cookie（之後由 cookie jar 沿用）
+                    async with session.get(f'{self.base_url}/index.jsp') as response:
+                        await response.read()
+                except Exception:
+                    await session.close()
+                    raise
+                self._session = session
+        return self._session
+
+    async def fetch(self, symbols: List[str]) -> Dict:
+        """查詢一批股票，回傳 {symbol: twstock 格式資料, 'success': bool}"""
+        self.requests += 1
+        try:
+            session = await self._get_session()
+            async with session.get(f'{self.base_url}/api/getStockInfo.jsp', params=_mis_params(symbols)) as response:
+                response.raise_for_status()
+                return parse_stock_info(await response.json(content_type=None))
+        except Exception:
+            self.errors += 1
+            raise
+
+    async def fetch_many(self, chunks: List[List[str]],
+                         chunk_timeout: Optional[float] = None) -> List[Union[Dict, BaseException]]:
+        """
+        並行查詢多批股票，回傳與 chunks 對應的結果或例外
+        每個批次各自計算逾時（取得連線名額後才開始計時），一個批次逾時不影響其他批次
+        """
+        chunk_timeout = chunk_timeout or self.timeout
+        slots = asyncio.Semaphore(self.pool_size)
+
+        async def fetch_chunk(chunk: List[str]) -> Dict:
+            async with slots:
+                try:
+                    return await asyncio.wait_for(self.fetch(chunk), chunk_timeout)
+                except asyncio.TimeoutError:
+                    raise TimeoutError('行情查詢逾時')
+
+        return await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        # 連線鎖綁定目前的 event loop，關閉後重新建立
+        self._session_lock = None
+
+
+class MarketDataClient:
+    """AsyncMarketDataClient 的同步介面：在專屬執行緒的 event loop 上執行查詢"""
+
+    def __init__(self, client: AsyncMarketDataClient):
+        self.client = client
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name='market-data', daemon=True)
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    def _run(self, coroutine, timeout: Optional[float]):
+        # 代號表第一次載入會讀檔，先在呼叫端執行緒載入，避免阻塞 event loop
+        stock_registry.load()
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise TimeoutError('行情查詢逾時')
+
+    def get(self, symbols: List[str], timeout: Optional[float] = None) -> Dict:
+        """查詢一批股票（格式同 twstock.realtime.get）"""
+        return self._run(self.client.fetch(list(symbols)), timeout or self.client.timeout)
+
+    def get_many(self, chunks: List[List[str]],
+                 chunk_timeout: Optional[float] = None) -> List[Union[Dict, BaseException]]:
+        """
+        並行查詢多批股票，回傳與 chunks 對應的結果或例外（逾時的批次為 TimeoutError，其他批次照常回傳）
+        chunk_timeout 為每個批次的逾時；整體等待時間依連線數排隊的輪數放寬
+        """
+        if not chunks:
+            return []
+        chunk_timeout = chunk_timeout or self.client.timeout
+        rounds = -(-len(chunks) // self.client.pool_size)
+        return self._run(self.client.fetch_many(chunks, chunk_timeout), chunk_timeout * rounds + 1)
+
+    def close(self):
+        if self._loop is None:
+            return
+        try:
+            self._run(self.client.close(), 5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        if not self._loop.is_running():
+            self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            'backend': 'aiohttp',
+            'running': self._loop is not None,
+            'requests': self.client.requests,
+            'errors': self.client.errors,
+            'pool_size': self.client.pool_size
+        }
+
+
+def _settings() -> Dict:
+    # 指定 CA bundle 時以該檔案驗證憑證；否則依 MARKET_DATA_VERIFY_SSL（預設驗證）
+    ca_bundle = os.getenv('MARKET_DATA_CA_BUNDLE')
+    return {
+        'timeout': float(os.getenv('QUOTE_CHUNK_TIMEOUT', 5)),
+        'connect_timeout': float(os.getenv('MARKET_DATA_CONNECT_TIMEOUT', 2)),
+        'pool_size': int(os.getenv('MARKET_DATA_POOL_SIZE', 8)),
+        'verify_ssl': ca_bundle or os.getenv('MARKET_DATA_VERIFY_SSL', 'true').lower() == 'true'
+    }
+
+
+def _create_client() -> Optional[MarketDataClient]:
+    if aiohttp is None or os.getenv('MARKET_DATA_BACKEND', 'aiohttp') != 'aiohttp':
+        return None
+    client = MarketDataClient(AsyncMarketDataClient(
+        base_url=os.getenv('MARKET_DATA_URL', MIS_BASE_URL), **_settings()
+    ))
+    atexit.register(client.close)
+    return client
+
+
+def _create_http_client() -> MisHttpClient:
+    return MisHttpClient(MarketDataSession(**_settings()), base_url=os.getenv('MARKET_DATA_URL', MIS_BASE_URL))
+
+
+# 建立行情客戶端實例（未安裝 aiohttp 時 market_data 為 None，改用 market_http）
+market_data = _create_client()
+market_http = _create_http_client()
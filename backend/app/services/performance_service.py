@@ -0,0 +1,121 @@
+"""
+投資績效服務
+以持倉 × 日期矩陣（portfolio_history.build_matrices）一次算出
+每個持倉、每個帳戶與整體投資組合的 XIRR（資金加權）與 TWR（時間加權）報酬率
+
+重播交易與建立矩陣的結果依資料表版本號與日期快取；
+每次請求只以即時市值重算最後一天（TWR 最後一期與 XIRR 期末現金流）
+"""
+import threading
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.services.cache_service import get_table_versions
+from app.services.portfolio_history import build_matrices, load_investment_transactions
+from app.services.stock_service import PerformanceCalculator
+
+
+PERFORMANCE_TABLES = ('investment_transactions', 'holdings', 'investment_accounts', 'price_history')
+
+_cache = {'key': None, 'base': None}
+_cache_lock = threading.Lock()
+
+
+def _percent(value) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value) * 100, 2)
+
+
+def _build_base(db, today) -> Optional[Dict]:
+    """重播交易，整理出與即時報價無關的部分"""
+    transactions = load_investment_transactions(db)
+    if not transactions:
+        return None
+
+    matrices = build_matrices(transactions, transactions[0]['date'], today)
+    values = matrices['market_value']
+    flows = matrices['flows']
+
+    # 持倉、帳戶（以歸屬矩陣加總）、投資組合三層一起計算
+    accounts = sorted(set(matrices['accounts']))
+    membership = (np.array(accounts)[:, None] == np.array(matrices['accounts'])[None, :]).astype(float)
+    group_values = np.vstack([values, membership @ values, values.sum(axis=0, keepdims=True)])
+    group_flows = np.vstack([flows, membership @ flows, flows.sum(axis=0, keepdims=True)])
+
+    # TWR：最後一天以前的各期報酬先連乘好
+    twr_prefix = PerformanceCalculator.twr_batch(group_values[:, :-1], group_flows[:, :-1]) + 1 \
+        if group_values.shape[1] > 1 else np.ones(len(group_values))
+
+    # XIRR 的現金流：投入為負、取回為正，只保留有現金流的日子與最後一天（期末市值）
+    days = group_flows.shape[1]
+    active = np.union1d(np.flatnonzero(np.any(group_flows != 0, axis=0)), [days - 1])
+    years = (matrices['grid'][active] - matrices['grid'][0]).astype(float) / 365
+
+    return {
+        'holdings': matrices['holdings'],
+        'accounts': accounts,
+        'membership': membership,
+        'last_values': values[:, -1].copy(),
+        'previous_values': group_values[:, -2] if days > 1 else np.zeros(len(group_values)),
+        'last_flows': group_flows[:, -1],
+        'twr_prefix': twr_prefix,
+        'cash_flows': -group_flows[:, active],
+        'years': years,
+        'invested': np.where(group_flows > 0, group_flows, 0).sum(axis=1)
+    }
+
+
+def _get_base(db, today) -> Optional[Dict]:
+    key = (tuple(sorted(get_table_versions(db, PERFORMANCE_TABLES).items())), today)
+    with _cache_lock:
+        if _cache['key'] == key:
+            return _cache['base']
+    base = _build_base(db, today)
+    with _cache_lock:
+        _cache['key'], _cache['base'] = key, base
+    return base
+
+
+def portfolio_performance(db, current_values: Optional[Dict[int, float]] = None, today=None) -> Dict:
+    """
+    計算績效，回傳 {'portfolio': {...}, 'accounts': {id: {...}}, 'holdings': {id: {...}}}
+    current_values 為 {holding_id: 目前市值}（即時報價），用來取代最後一天以收盤價計算的市值
+    """
+    today = today or date.today()
+    base = _get_base(db, today)
+    if base is None:
+        return {'portfolio': None, 'accounts': {}, 'holdings': {}}
+
+    last = base['last_values'].copy()
+    for row, holding_id in enumerate(base['holdings']):
+        if current_values and holding_id in current_values:
+            last[row] = current_values[holding_id]
+    group_last = np.concatenate([last, base['membership'] @ last, [last.sum()]])
+
+    # TWR 最後一期：投入視為期初、取回視為期末
+    inflows = np.clip(base['last_flows'], 0, None)
+    outflows = np.clip(-base['last_flows'], 0, None)
+    opening = base['previous_values'] + inflows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        growth = np.where(opening > 0, (group_last + outflows) / opening, 1.0)
+    twr = base['twr_prefix'] * growth - 1
+
+    cash_flows = base['cash_flows'].copy()
+    cash_flows[:, -1] += group_last
+    xirr = PerformanceCalculator.xirr_batch(cash_flows, base['years'])
+
+    def metrics(index: int) -> Dict:
+        return {
+            'xirr': _percent(xirr[index]),
+            'twr': _percent(twr[index]),
+            'invested': round(float(base['invested'][index]), 2),
+            'market_value': round(float(group_last[index]), 2)
+        }
+
+    holding_count = len(base['holdings'])
+    return {
+        'portfolio': metrics(len(group_last) - 1),
+        'accounts': {account_id: metrics(holding_count + i) for i, account_id in enumerate(base['accounts'])},
+        'holdings': {holding_id: metrics(i) for i, holding_id in enumerate(base['holdings'])}
+    }
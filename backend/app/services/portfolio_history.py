@@ -0,0 +1,203 @@
+"""
+投資組合歷史市值
+重播 investment_transactions 得到「持倉 × 日期」的持股矩陣，
+與歷史收盤價矩陣（price_history 欄式快取）相乘，一次算出每日市值、成本與損益
+"""
+from collections import deque
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from app.services.price_history import price_history
+
+
+def load_investment_transactions(db, account_id: Optional[int] = None) -> List[Dict]:
+    """載入有效帳戶的投資交易（依日期排序）"""
+    query = '''
+        SELECT h.id, h.account_id, h.symbol, h.asset_type, it.transaction_type, it.quantity, it.price,
+               COALESCE(it.fee, 0), COALESCE(it.tax, 0), it.transaction_date,
+               COALESCE(h.cost_method, 'average')
+        FROM investment_transactions it
+        JOIN holdings h ON it.holding_id = h.id
+        JOIN investment_accounts ia ON h.account_id = ia.id
+        WHERE ia.is_active = TRUE
+    '''
+    params = {}
+    if account_id:
+        query += ' AND h.account_id = :account_id'
+        params['account_id'] = account_id
+    query += ' ORDER BY it.transaction_date, it.id'
+
+    return [{
+        'holding_id': row[0],
+        'account_id': row[1],
+        'symbol': row[2],
+        'asset_type': row[3],
+        'type': row[4],
+        'quantity': float(row[5] or 0),
+        'price': float(row[6] or 0),
+        'fee': float(row[7]),
+        'tax': float(row[8]),
+        'date': row[9].date() if isinstance(row[9], datetime) else row[9],
+        'cost_method': row[10]
+    } for row in db.session.execute(text(query), params)]
+
+
+def _price_matrix(symbols: List[str], cash: np.ndarray, grid: np.ndarray):
+    """
+    建立「持倉 × 日期」收盤價矩陣（非交易日沿用前一個收盤價），
+    沒有歷史股價的位置為 NaN；回傳 (矩陣, 缺少歷史股價的股票)
+    """
+    prices = np.full((len(symbols), len(grid)), np.nan)
+    missing = []
+    loaded = {}
+    for index, symbol in enumerate(symbols):
+        if cash[index]:
+            prices[index] = 1.0
+            continue
+        if symbol not in loaded:
+            try:
+                loaded[symbol] = price_history.columns(symbol)
+            except (ValueError, OSError):
+                # 代號無效，或快取版本在讀取中被切換移除：視為缺少歷史股價
+                loaded[symbol] = None
+        columns = loaded[symbol]
+        if columns is None or not len(columns['date']):
+            if symbol not in missing:
+                missing.append(symbol)
+            continue
+        position = np.searchsorted(columns['date'], grid, 'right') - 1
+        valid = position >= 0
+        prices[index, valid] = columns['close'][position[valid]]
+    return prices, missing
+
+
+def _fifo_cost(lots: deque, quantity: float) -> float:
+    """由最早的批次扣除 quantity 股，回傳扣除的成本"""
+    removed = 0.0
+    while quantity > 1e-9 and lots:
+        lot = lots[0]
+        used = min(lot[0], quantity)
+        removed += used * lot[1]
+        quantity -= used
+        lot[0] -= used
+        if lot[0] <= 1e-9:
+            lots.popleft()
+    return removed
+
+
+def build_matrices(transactions: List[Dict], start, end) -> Dict:
+    """
+    重播交易，建立「持倉 × 日期」矩陣：
+    positions 持股、cost_basis 成本（依持倉的成本計算方式：平均成本或先進先出）、realized 累計已實現損益、
+    flows 當日投入該持倉的淨金額（買入為正，賣出與股息為負）、market_value 市值
+    沒有歷史股價的日子以成本計算市值
+    """
+    grid = np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+    days = len(grid)
+    holdings = sorted({tx['holding_id'] for tx in transactions})
+    row_of = {holding_id: row for row, holding_id in enumerate(holdings)}
+    symbols = [''] * len(holdings)
+    accounts = [None] * len(holdings)
+    cash = np.zeros(len(holdings), dtype=bool)
+
+    # 逐筆交易（而非逐日）計算持股、成本、已實現損益與現金流的變動量
+    count = len(transactions)
+    rows = np.empty(count, dtype=np.int64)
+    quantity_delta = np.zeros(count)
+    cost_delta = np.zeros(count)
+    realized_delta = np.zeros(count)
+    flow_delta = np.zeros(count)
+
+    held = np.zeros(len(holdings))
+    cost = np.zeros(len(holdings))
+    # fifo 持倉重播買入批次 [剩餘數量, 每股成本]，與 lot_service 的扣除順序相同
+    lots = {row_of[tx['holding_id']]: deque() for tx in transactions if tx.get('cost_method') == 'fifo'}
+    tx_days = np.array([tx['date'] for tx in transactions], dtype='datetime64[D]')
+    # 起始日前的交易累計到第一天，結束日後的交易不列入
+    cols = np.clip((tx_days - grid[0]).astype(np.int64), 0, None)
+
+    for i, tx in enumerate(transactions):
+        row = rows[i] = row_of[tx['holding_id']]
+        symbols[row] = tx['symbol']
+        accounts[row] = tx['account_id']
+        cash[row] = tx['asset_type'] == 'cash'
+        qty, price = tx['quantity'], tx['price']
+
+        if tx['type'] == 'buy':
+            quantity_delta[i] = qty
+            cost_delta[i] = flow_delta[i] = qty * price + tx['fee']
+            if row in lots and qty > 0:
+                lots[row].append([qty, cost_delta[i] / qty])
+        elif tx['type'] == 'sell':
+            sold = min(qty, held[row])
+            removed = _fifo_cost(lots[row], sold) if row in lots \
+                else cost[row] * sold / held[row] if held[row] else 0
+            proceeds = sold * price - tx['fee'] - tx['tax']
+            quantity_delta[i] = -sold
+            cost_delta[i] = -removed
+            realized_delta[i] = proceeds - removed
+            flow_delta[i] = -proceeds
+        elif tx['type'] == 'dividend':
+            realized_delta[i] = qty * price - tx['tax']
+            flow_delta[i] = -realized_delta[i]
+
+        held[row] += quantity_delta[i]
+        cost[row] += cost_delta[i]
+
+    in_range = cols < days
+    rows, cols = rows[in_range], cols[in_range]
+
+    def scatter(delta: np.ndarray) -> np.ndarray:
+        matrix = np.zeros((len(holdings), days))
+        np.add.at(matrix, (rows, cols), delta[in_range])
+        return matrix
+
+    positions = np.cumsum(scatter(quantity_delta), axis=1)
+    cost_basis = np.cumsum(scatter(cost_delta), axis=1)
+    prices, missing = _price_matrix(symbols, cash, grid)
+
+    return {
+        'grid': grid,
+        'holdings': holdings,
+        'symbols': symbols,
+        'accounts': accounts,
+        'positions': positions,
+        'cost_basis': cost_basis,
+        'realized': np.cumsum(scatter(realized_delta), axis=1),
+        'flows': scatter(flow_delta),
+        'market_value': np.where(np.isnan(prices), cost_basis, positions * np.nan_to_num(prices)),
+        'missing': missing
+    }
+
+
+def portfolio_history(db, start=None, end=None, account_id: Optional[int] = None) -> Dict:
+    """每日投資組合市值、成本與損益"""
+    transactions = load_investment_transactions(db, account_id)
+    end = end or date.today()
+    start = start or (transactions[0]['date'] if transactions else end)
+    if not transactions or start > end:
+        return {'dates': [], 'market_value': [], 'cost_basis': [], 'unrealized_pnl': [],
+                'realized_pnl': [], 'total_pnl': [], 'symbols': [], 'missing_prices': []}
+
+    matrices = build_matrices(transactions, start, end)
+    market_value = matrices['market_value'].sum(axis=0)
+    total_cost = matrices['cost_basis'].sum(axis=0)
+    realized = matrices['realized'].sum(axis=0)
+    unrealized = market_value - total_cost
+
+    def series(values: np.ndarray) -> List[float]:
+        return np.round(values, 2).tolist()
+
+    return {
+        'dates': [str(day) for day in matrices['grid']],
+        'market_value': series(market_value),
+        'cost_basis': series(total_cost),
+        'unrealized_pnl': series(unrealized),
+        'realized_pnl': series(realized),
+        'total_pnl': series(unrealized + realized),
+        'symbols': sorted(set(matrices['symbols'])),
+        'missing_prices': matrices['missing']
+    }
@@ -0,0 +1,355 @@
+"""
+歷史股價服務
+- 日線資料（開高低收量）保存在 price_history 資料表
+- 每檔股票另存一份欄式快取（每個欄位一個 .npy 檔），以 memory map 開啟，
+  圖表與分析讀取日期區間時直接切片，不需查詢資料庫
+- 資料來源可替換（預設 TwstockHistoryProvider）
+- API 的回補要求交由 history_backfill 背景工作執行（逐月查詢 TWSE 可能需要數分鐘）
+"""
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+
+CACHE_DIR = os.getenv(
+    'PRICE_CACHE_DIR',
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'price_cache')
+)
+FIELD_DTYPES = {
+    'date': 'datetime64[D]',
+    'open': 'float64',
+    'high': 'float64',
+    'low': 'float64',
+    'close': 'float64',
+    'volume': 'int64'
+}
+# 股票代號會成為快取目錄名稱，只接受英數字
+SYMBOL_PATTERN = re.compile(r'^[0-9A-Za-z]{1,12}$')
+# 沒有任何歷史資料時的預設回補天數
+DEFAULT_BACKFILL_DAYS = 365
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    return value
+
+
+class TwstockHistoryProvider:
+    """以 twstock.Stock 逐月取得 TWSE 日線資料"""
+
+    def __init__(self, request_interval: float = 0.5):
+        # TWSE 對連續請求有頻率限制
+        self.request_interval = request_interval
+
+    def fetch(self, symbol: str, start: date, end: date) -> List[Dict]:
+        """取得 [start, end] 之間的日線，回傳 [{date, open, high, low, close, volume}]"""
+        import twstock
+
+        stock = twstock.Stock(symbol, initial_fetch=False)
+        bars = []
+        year, month = start.year, start.month
+        while (year, month) <= (end.year, end.month):
+            for row in stock.fetch(year, month):
+                day = _as_date(row.date)
+                if start <= day <= end and row.close is not None:
+                    bars.append({
+                        'date': day,
+                        'open': row.open,
+                        'high': row.high,
+                        'low': row.low,
+                        'close': row.close,
+                        'volume': row.capacity
+                    })
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+            time.sleep(self.request_interval)
+        return bars
+
+
+class PriceHistoryService:
+    """
+    歷史股價服務
+    寫入路徑：provider → price_history → 重建該股票的欄式快取
+    讀取路徑：欄式快取（memory map）→ 依日期二分搜尋後切片
+    """
+
+    def __init__(self, provider=None, cache_dir: str = CACHE_DIR):
+        self.provider = provider or TwstockHistoryProvider()
+        self.cache_dir = os.path.abspath(cache_dir)
+        self._columns: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def set_provider(self, provider):
+        """替換資料來源（需提供 fetch(symbol, start, end)）"""
+        self.provider = provider
+
+    # ----- 資料表 -----
+
+    @staticmethod
+    def last_date(db, symbol: str) -> Optional[date]:
+        return db.session.execute(text(
+            'SELECT MAX(date) FROM price_history WHERE symbol = :symbol'
+        ), {'symbol': symbol}).scalar()
+
+    @staticmethod
+    def save_bars(db, symbol: str, bars: Iterable[Dict]) -> int:
+        """寫入日線（同日資料覆蓋），回傳筆數"""
+        params = [{
+            'symbol': symbol,
+            'date': bar['date'],
+            'open': bar.get('open'),
+            'high': bar.get('high'),
+            'low': bar.get('low'),
+            'close': bar['close'],
+            'volume': bar.get('volume')
+        } for bar in bars]
+        if not params:
+            return 0
+        db.session.execute(text('''
+            INSERT INTO price_history (symbol, date, open, high, low, close, volume)
+            VALUES (:symbol, :date, :open, :high, :low, :close, :volume)
+            ON CONFLICT (symbol, date) DO UPDATE
+            SET open = EXCLUDED.open, high = EXCLUDED.high, low = EXCLUDED.low,
+                close = EXCLUDED.close, volume = EXCLUDED.volume
+        '''), params)
+        db.session.commit()
+        return len(params)
+
+    def backfill(self, db, symbol: str, start: Optional[date] = None, end: Optional[date] = None) -> int:
+        """
+        回補日線：從資料表最後一天（或 start）補到 end，並重建欄式快取
+        回傳新寫入的筆數
+        """
+        self._symbol_dir(symbol)
+        end = _as_date(end) if end else date.today()
+        last = self.last_date(db, symbol)
+        if start:
+            start = _as_date(start)
+            if last and start <= last:
+                start = last + timedelta(days=1)
+        else:
+            start = last + timedelta(days=1) if last else end - timedelta(days=DEFAULT_BACKFILL_DAYS)
+
+        count = 0
+        if start <= end:
+            count = self.save_bars(db, symbol, self.provider.fetch(symbol, start, end))
+        if count or not self._has_cache(symbol):
+            self.rebuild_cache(db, symbol)
+        return count
+
+    # ----- 欄式快取 -----
+
+    def _symbol_dir(self, symbol: str) -> str:
+        if not SYMBOL_PATTERN.match(symbol or ''):
+            raise ValueError(f'無效的股票代號: {symbol}')
+        return os.path.join(self.cache_dir, symbol)
+
+    def _pointer(self, symbol: str) -> str:
+        return os.path.join(self._symbol_dir(symbol), 'current')
+
+    def _has_cache(self, symbol: str) -> bool:
+        return os.path.exists(self._pointer(symbol))
+
+    def rebuild_cache(self, db, symbol: str) -> int:
+        """
+        由 price_history 重建單一股票的欄式快取，回傳筆數
+        寫入新版本目錄後才切換 current 指標，讀取端不會看到寫到一半的檔案；
+        切換前的版本保留到下一次切換，剛讀到舊指標的讀取端仍可開啟舊版本
+        """
+        rows = db.session.execute(text('''
+            SELECT date, open, high, low, close, volume
+            FROM price_history
+            WHERE symbol = :symbol
+            ORDER BY date
+        '''), {'symbol': symbol}).fetchall()
+
+        columns = {
+            'date': np.array([row[0] for row in rows], dtype=FIELD_DTYPES['date']),
+            'open': np.array([row[1] if row[1] is not None else np.nan for row in rows], dtype='float64'),
+            'high': np.array([row[2] if row[2] is not None else np.nan for row in rows], dtype='float64'),
+            'low': np.array([row[3] if row[3] is not None else np.nan for row in rows], dtype='float64'),
+            'close': np.array([row[4] for row in rows], dtype='float64'),
+            'volume': np.array([row[5] or 0 for row in rows], dtype='int64')
+        }
+
+        symbol_dir = self._symbol_dir(symbol)
+        version = f'v{time.time_ns()}'
+        version_dir = os.path.join(symbol_dir, version)
+        os.makedirs(version_dir, exist_ok=True)
+        for field, values in columns.items():
+            np.save(os.path.join(version_dir, f'{field}.npy'), values)
+
+        pointer = self._pointer(symbol)
+        try:
+            with open(pointer) as f:
+                previous = f.read().strip()
+        except FileNotFoundError:
+            previous = None
+        with open(f'{pointer}.tmp', 'w') as f:
+            f.write(version)
+        os.replace(f'{pointer}.tmp', pointer)
+
+        # 移除更早的版本（已開啟的 memory map 在 Linux 上仍可繼續讀取）
+        for name in os.listdir(symbol_dir):
+            if name.startswith('v') and name not in (version, previous):
+                shutil.rmtree(os.path.join(symbol_dir, name), ignore_errors=True)
+        with self._lock:
+            self._columns.pop(symbol, None)
+        return len(rows)
+
+    def columns(self, symbol: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        取得單一股票的完整欄位（唯讀 memory map），沒有快取時回傳 None
+        版本在讀取期間被連續切換而移除時拋出 OSError
+        """
+        try:
+            with open(self._pointer(symbol)) as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+
+        cached = self._columns.get(symbol)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        version_dir = os.path.join(self._symbol_dir(symbol), version)
+        columns = {
+            field: np.load(os.path.join(version_dir, f'{field}.npy'), mmap_mode='r')
+            for field in FIELD_DTYPES
+        }
+        with self._lock:
+            self._columns[symbol] = (version, columns)
+        return columns
+
+    def history(self, symbol: str, start=None, end=None) -> Optional[Dict[str, np.ndarray]]:
+        """
+        取得日期區間 [start, end] 的欄位切片（不複製資料）
+        沒有快取時回傳 None
+        """
+        columns = self.columns(symbol)
+        if columns is None:
+            return None
+        dates = columns['date']
+        lo = np.searchsorted(dates, np.datetime64(_as_date(start), 'D'), 'left') if start else 0
+        hi = np.searchsorted(dates, np.datetime64(_as_date(end), 'D'), 'right') if end else len(dates)
+        return {field: values[lo:hi] for field, values in columns.items()}
+
+    @staticmethod
+    def to_bars(columns: Dict[str, np.ndarray]) -> List[Dict]:
+        """將欄位切片轉為 JSON 用的日線列表（缺值為 None）"""
+        def number(value):
+            return None if np.isnan(value) else float(value)
+
+        return [{
+            'date': str(day),
+            'open': number(o),
+            'high': number(h),
+            'low': number(l),
+            'close': float(c),
+            'volume': int(v)
+        } for day, o, h, l, c, v in zip(columns['date'], columns['open'], columns['high'],
+                                        columns['low'], columns['close'], columns['volume'])]
+
+
+class HistoryBackfillWorker:
+    """
+    歷史日線回補背景工作
+    API 以 request_backfill() 排入要回補的股票後立即回應，背景執行緒依序回補；
+    同一檔股票等待中時再次要求只更新日期範圍
+    """
+
+    def __init__(self, service: PriceHistoryService):
+        self.service = service
+        self._jobs: Dict[str, Dict] = {}
+        self._pending: Dict[str, Dict] = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._app = None
+        self._db = None
+
+    def start(self, app, db):
+        """啟動背景執行緒（重複呼叫不會重複啟動）"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._db = db
+            self._thread = threading.Thread(target=self._run, name='history-backfill', daemon=True)
+            self._thread.start()
+
+    def request_backfill(self, symbol: str, start=None, end=None) -> Dict:
+        """排入回補，回傳該股票的工作狀態；股票代號無效時拋出 ValueError"""
+        self.service._symbol_dir(symbol)
+        start = _as_date(start) if start else None
+        end = _as_date(end) if end else None
+        with self._lock:
+            self._pending[symbol] = {'start': start, 'end': end}
+            self._jobs[symbol] = {
+                'symbol': symbol,
+                'status': 'queued',
+                'start': start.isoformat() if start else None,
+                'end': end.isoformat() if end else None,
+                'requested_at': datetime.now().isoformat()
+            }
+            job = dict(self._jobs[symbol])
+        self._wake.set()
+        return job
+
+    def status(self, symbol: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(symbol)
+            return dict(job) if job else None
+
+    def _next(self):
+        with self._lock:
+            if not self._pending:
+                return None
+            symbol = next(iter(self._pending))
+            self._jobs[symbol]['status'] = 'running'
+            return symbol, self._pending.pop(symbol)
+
+    def _finish(self, symbol: str, **result):
+        with self._lock:
+            job = self._jobs[symbol]
+            # 執行期間又被排入時保留 queued 狀態
+            if symbol not in self._pending:
+                job.update(result, finished_at=datetime.now().isoformat())
+
+    def run_pending(self):
+        """依序回補等待中的股票"""
+        while True:
+            item = self._next()
+            if item is None:
+                return
+            symbol, job = item
+            with self._app.app_context():
+                try:
+                    count = self.service.backfill(self._db, symbol, job['start'], job['end'])
+                    self._finish(symbol, status='done', imported=count, error=None)
+                except Exception as e:
+                    self._db.session.rollback()
+                    self._finish(symbol, status='error', error=str(e))
+                    print(f'回補歷史股價錯誤 {symbol}: {e}')
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.run_pending()
+
+
+# 建立服務實例
+price_history = PriceHistoryService()
+history_backfill = HistoryBackfillWorker(price_history)
@@ -0,0 +1,180 @@
+"""
+即時報價快取
+- 依台股交易時段調整 TTL：盤中短（預設 5 秒），盤後快取到下一次開盤
+- 同一檔股票同時未命中時只向上游發出一次請求（singleflight），其他請求共用結果
+- 上游逾時或失敗時回傳最後一次取得的報價，並標記 stale
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from datetime import time as dt_time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+# 台灣沒有日光節約時間，固定 UTC+8
+MARKET_TZ = timezone(timedelta(hours=8))
+MARKET_OPEN = dt_time(9, 0)
+MARKET_CLOSE = dt_time(13, 30)
+
+
+def market_now() -> datetime:
+    return datetime.now(MARKET_TZ)
+
+
+def is_market_open(now: Optional[datetime] = None) -> bool:
+    """是否為台股交易時段（週一至週五 09:00–13:30，不含國定假日）"""
+    now = now or market_now()
+    return now.weekday() < 5 and MARKET_OPEN <= now.time() <= MARKET_CLOSE
+
+
+def seconds_until_market_open(now: Optional[datetime] = None) -> float:
+    """距離下一次開盤的秒數（盤中回傳 0）"""
+    now = now or market_now()
+    if is_market_open(now):
+        return 0
+    candidate = now.replace(hour=MARKET_OPEN.hour, minute=MARKET_OPEN.minute, second=0, microsecond=0)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    while candidate.weekday() >= 5:
+        candidate += timedelta(days=1)
+    return (candidate - now).total_seconds()
+
+
+class QuoteCache:
+    """
+    報價快取
+    fetch_many(symbols) 由呼叫端提供，回傳 {symbol: quote}，quote['success'] 為 True 才寫入快取
+    """
+
+    def __init__(self, open_ttl: float = 5, closed_ttl: float = 1800,
+                 fetch_timeout: float = 3.0, max_workers: int = 4):
+        self.open_ttl = open_ttl
+        self.closed_ttl = closed_ttl
+        self.fetch_timeout = fetch_timeout
+        self._entries: Dict[str, Dict] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='quote-fetch')
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.stale_served = 0
+
+    def ttl(self, now: Optional[datetime] = None) -> float:
+        """目前的快取秒數：盤中 open_ttl；盤後最多 closed_ttl，且不超過下一次開盤"""
+        now = now or market_now()
+        if is_market_open(now):
+            return self.open_ttl
+        return max(self.open_ttl, min(self.closed_ttl, seconds_until_market_open(now)))
+
+    def peek(self, symbol: str) -> Optional[Dict]:
+        """讀取快取中的報價（不論是否過期），沒有時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            return entry['quote'] if entry else None
+
+    def snapshot(self, symbols: Iterable[str]) -> Dict[str, Dict]:
+        """讀取多檔快取報價（不呼叫上游），已過期的標記 stale；沒有報價的股票不列入"""
+        now = time.monotonic()
+        quotes = {}
+        with self._lock:
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+                if entry is None:
+                    continue
+                quotes[symbol] = entry['quote'] if entry['expires_at'] > now else \
+                    {**entry['quote'], 'stale': True, 'fetched_at': entry['fetched_at']}
+        return quotes
+
+    def put(self, symbol: str, quote: Dict, ttl: Optional[float] = None):
+        """直接寫入一筆報價"""
+        ttl = self.ttl() if ttl is None else ttl
+        with self._lock:
+            self._entries[symbol] = {
+                'quote': quote,
+                'expires_at': time.monotonic() + ttl,
+                'fetched_at': datetime.now().isoformat()
+            }
+
+    def _stale(self, symbol: str, error: str) -> Dict:
+        """上游失敗時的回應：有舊報價則回傳並標記 stale，否則回傳失敗"""
+        entry = self._entries.get(symbol)
+        if entry is None:
+            return {'symbol': symbol, 'success': False, 'error': error}
+        self.stale_served += 1
+        return {**entry['quote'], 'stale': True, 'fetched_at': entry['fetched_at']}
+
+    def _fetch(self, symbols: List[str], fetch_many: Callable[[List[str]], Dict[str, Dict]]):
+        try:
+            fetched = fetch_many(symbols) or {}
+            error = '無法取得數據'
+        except Exception as e:
+            fetched = {}
+            error = str(e)
+
+        expires_at = time.monotonic() + self.ttl()
+        fetched_at = datetime.now().isoformat()
+        resolved = []
+        with self._lock:
+            for symbol in symbols:
+                quote = fetched.get(symbol)
+                if quote and quote.get('success'):
+                    quote = {**quote, 'stale': False}
+                    self._entries[symbol] = {'quote': quote, 'expires_at': expires_at, 'fetched_at': fetched_at}
+                else:
+                    quote = self._stale(symbol, (quote or {}).get('error', error))
+                resolved.append((self._inflight.pop(symbol), quote))
+
+        for future, quote in resolved:
+            future.set_result(quote)
+
+    def get_many(self, symbols: Iterable[str],
+                 fetch_many: Callable[[List[str]], Dict[str, Dict]]) -> Dict[str, Dict]:
+        """取得多檔報價，回傳 {symbol: quote}；未命中的部分合併成一次上游請求"""
+        results: Dict[str, Dict] = {}
+        waiting: Dict[str, Future] = {}
+        leading: List[str] = []
+
+        now = time.monotonic()
+        with self._lock:
+            for symbol in dict.fromkeys(symbols):
+                entry = self._entries.get(symbol)
+                if entry is not None and entry['expires_at'] > now:
+                    self.hits += 1
+                    results[symbol] = entry['quote']
+                    continue
+                self.misses += 1
+                future = self._inflight.get(symbol)
+                if future is None:
+                    future = self._inflight[symbol] = Future()
+                    leading.append(symbol)
+                else:
+                    self.coalesced += 1
+                waiting[symbol] = future
+
+        if leading:
+            # 在背景執行緒向上游取得；即使本次請求逾時，結果仍會寫回快取
+            self._executor.submit(self._fetch, leading, fetch_many)
+
+        deadline = time.monotonic() + self.fetch_timeout
+        for symbol, future in waiting.items():
+            try:
+                results[symbol] = future.result(timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                with self._lock:
+                    results[symbol] = self._stale(symbol, '報價來源逾時')
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'inflight': len(self._inflight),
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'stale_served': self.stale_served,
+                'ttl_seconds': self.ttl(),
+                'market_open': is_market_open()
+            }
@@ -0,0 +1,76 @@
+"""
+即時報價推播
+報價背景輪詢每取得一批新報價就 publish 一次，所有 SSE 連線各自訂閱需要的股票；
+一次上游請求即可推送給所有連線，連線數增加不會增加對 TWSE 的請求
+"""
+import queue
+import threading
+from typing import Dict, Iterable, Set
+
+
+class QuoteSubscription:
+    """單一連線的訂閱（佇列滿時丟棄最舊的一批，慢速連線不會拖累推播）"""
+
+    def __init__(self, symbols: Iterable[str], max_pending: int = 20):
+        self.symbols: Set[str] = set(symbols)
+        self.queue: "queue.Queue[Dict[str, Dict]]" = queue.Queue(maxsize=max_pending)
+
+    def push(self, quotes: Dict[str, Dict]):
+        while True:
+            try:
+                self.queue.put_nowait(quotes)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout: float):
+        """等待下一批報價，逾時回傳 None"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class QuoteFeed:
+    """行程內的報價推播中心"""
+
+    def __init__(self):
+        self._subscriptions: Set[QuoteSubscription] = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, symbols: Iterable[str]) -> QuoteSubscription:
+        subscription = QuoteSubscription(symbols)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: QuoteSubscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def symbols(self) -> Set[str]:
+        """目前所有連線訂閱的股票（報價輪詢會一併更新）"""
+        with self._lock:
+            return set().union(*(subscription.symbols for subscription in self._subscriptions))
+
+    def publish(self, quotes: Dict[str, Dict]):
+        """推送一批新報價給訂閱了其中股票的連線"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            matched = {symbol: quotes[symbol] for symbol in subscription.symbols if symbol in quotes}
+            if matched:
+                subscription.push(matched)
+        self.published += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'connections': len(self._subscriptions), 'published': self.published}
+
+
+# 建立推播實例
+quote_feed = QuoteFeed()
@@ -0,0 +1,186 @@
+"""
+即時報價背景輪詢
+盤中依固定間隔更新所有持倉與關注清單股票的報價，寫入 stock_service 的報價快取，
+並以每批新報價評估關注清單價格提醒、推送給 SSE 訂閱者；
+投資組合與關注清單 API 只讀取快取，不在請求中等待 TWSE；
+快取沒有的股票以 request_symbols() 排入補抓，只查詢這些股票、有頻率限制，
+查不到報價的代號（錯誤或已下市）依退避時間暫停補抓
+"""
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import text
+
+from app.services.alert_service import alert_engine
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.quote_feed import quote_feed
+from app.services.quote_cache import is_market_open, seconds_until_market_open
+
+
+def tracked_symbols(db) -> List[str]:
+    """需要追蹤報價的股票：有效帳戶中的持倉與關注清單"""
+    result = db.session.execute(text('''
+        SELECT h.symbol
+        FROM holdings h
+        JOIN investment_accounts ia ON h.account_id = ia.id
+        WHERE h.quantity > 0 AND ia.is_active = TRUE AND h.asset_type != 'cash'
+        UNION
+        SELECT symbol FROM watchlist
+    '''))
+    return [row[0] for row in result if row[0]]
+
+
+class QuotePoller:
+    """
+    報價輪詢背景工作
+    啟動時執行一次；盤中每 interval 秒執行，收盤後再更新一次收盤價，之後休眠到下一次開盤。
+    快取缺少報價時以 request_symbols() 補抓缺少的股票（兩次補抓至少間隔 interval 秒）；
+    補抓後仍查不到的股票，下一次補抓的等待時間由 miss_backoff 起加倍，最多 miss_backoff_max
+    """
+
+    def __init__(self, interval: float = 5.0, miss_backoff: float = 60, miss_backoff_max: float = 3600):
+        self.interval = interval
+        self.miss_backoff = miss_backoff
+        self.miss_backoff_max = miss_backoff_max
+        self.last_run: Optional[datetime] = None
+        self.last_count = 0
+        self.last_error: Optional[str] = None
+        self.on_demand_runs = 0
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pending: Set[str] = set()
+        self._misses: Dict[str, Dict] = {}
+        self._last_on_demand = 0.0
+        self._thread = None
+        self._app = None
+        self._db = None
+
+    def start(self, app, db):
+        """啟動背景執行緒（重複呼叫不會重複啟動）"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._app = app
+            self._db = db
+            self._thread = threading.Thread(target=self._run, name='quote-poller', daemon=True)
+            self._thread.start()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def request_symbols(self, symbols: Iterable[str]):
+        """快取沒有報價的股票排入背景補抓；仍在退避時間內的股票略過"""
+        now = time.monotonic()
+        added = False
+        with self._lock:
+            for symbol in symbols:
+                miss = self._misses.get(symbol)
+                if not symbol or symbol in self._pending or (miss is not None and miss['retry_at'] > now):
+                    continue
+                self._pending.add(symbol)
+                added = True
+        if added:
+            self._wake.set()
+
+    def _take_pending(self) -> Set[str]:
+        with self._lock:
+            pending, self._pending = self._pending, set()
+            return pending
+
+    def _record_results(self, symbols: Iterable[str], quotes: Dict[str, Dict]):
+        """記錄查不到報價的股票與下一次可補抓的時間；查到的清除紀錄"""
+        now = time.monotonic()
+        with self._lock:
+            for symbol in symbols:
+                if symbol in quotes:
+                    self._misses.pop(symbol, None)
+                    continue
+                failures = self._misses.get(symbol, {}).get('failures', 0) + 1
+                backoff = min(self.miss_backoff * 2 ** (failures - 1), self.miss_backoff_max)
+                self._misses[symbol] = {'failures': failures, 'retry_at': now + backoff}
+
+    def refresh(self, symbols: Optional[Iterable[str]] = None):
+        """
+        立即更新一次報價
+        symbols 為 None 時更新所有追蹤中的股票（含等待補抓的股票），否則只更新指定的股票
+        """
+        from app.services.stock_service import stock_service
+
+        full = symbols is None
+        with self._app.app_context():
+            try:
+                if full:
+                    # SSE 連線訂閱的股票不一定在持倉或關注清單中，一併更新
+                    symbols = set(tracked_symbols(self._db)) | quote_feed.symbols() | self._take_pending()
+                symbols = sorted(symbols)
+                # 快取至少保留到下一次輪詢之後，避免兩次輪詢之間讀不到報價
+                ttl = max(self.interval * 3, stock_service.quote_cache.ttl())
+                quotes = stock_service.refresh_quotes(symbols, ttl=ttl) if symbols else {}
+                # 斷路器開啟時沒有實際查詢，不算查不到
+                if stock_service.breaker.state != CircuitBreaker.OPEN:
+                    self._record_results(symbols, quotes)
+                if full:
+                    self.last_count = len(quotes)
+                    self.last_run = datetime.now()
+                else:
+                    self.on_demand_runs += 1
+                self.last_error = None
+                if quotes:
+                    quote_feed.publish(quotes)
+                    alert_engine.evaluate(self._db, quotes)
+            except Exception as e:
+                self._db.session.rollback()
+                self.last_error = str(e)
+                print(f'報價輪詢錯誤: {e}')
+
+    def _idle_seconds(self) -> float:
+        return self.interval if is_market_open() else seconds_until_market_open()
+
+    def _run(self):
+        self.refresh()
+        next_full = time.monotonic() + self._idle_seconds()
+        while True:
+            wait = next_full
+            if self._pending:
+                wait = min(wait, self._last_on_demand + self.interval)
+            wait -= time.monotonic()
+            if wait > 0 and self._wake.wait(wait):
+                # 有新的補抓要求：重新計算等待時間（補抓有頻率限制）
+                self._wake.clear()
+                continue
+
+            if time.monotonic() >= next_full:
+                self.refresh()
+                next_full = time.monotonic() + self._idle_seconds()
+            elif self._pending:
+                self._last_on_demand = time.monotonic()
+                self.refresh(self._take_pending())
+
+    def status(self) -> dict:
+        with self._lock:
+            pending, misses = len(self._pending), len(self._misses)
+        return {
+            'running': self.running,
+            'interval_seconds': self.interval,
+            'market_open': is_market_open(),
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'last_count': self.last_count,
+            'last_error': self.last_error,
+            'on_demand_runs': self.on_demand_runs,
+            'pending_symbols': pending,
+            'missing_symbols': misses
+        }
+
+
+# 建立背景工作實例
+quote_poller = QuotePoller(
+    interval=float(os.getenv('QUOTE_POLL_INTERVAL', 5)),
+    miss_backoff=float(os.getenv('QUOTE_MISS_BACKOFF', 60)),
+    miss_backoff_max=float(os.getenv('QUOTE_MISS_BACKOFF_MAX', 3600))
+)
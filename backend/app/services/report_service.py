@@ -0,0 +1,117 @@
+"""
+報表查詢服務
+所有收支彙總都讀取 daily_category_totals（每日分類彙總表），
+查詢成本與日期範圍的天數相關，與交易筆數無關
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+
+def _date_filter(start, end, end_exclusive: bool = False, column: str = 'd.date') -> str:
+    condition = f'{column} >= :start'
+    if end is not None:
+        condition += f' AND {column} < :end' if end_exclusive else f' AND {column} <= :end'
+    return condition
+
+
+def category_totals(db, start, end=None, tx_type: str = 'expense',
+                    end_exclusive: bool = False, limit: Optional[int] = None) -> List[Dict]:
+    """期間內各分類總額（依金額由大到小）"""
+    query = f'''
+        SELECT c.id, c.name, c.icon, c.color, SUM(d.total) AS total
+        FROM daily_category_totals d
+        JOIN categories c ON d.category_id = c.id
+        WHERE d.type = :type AND {_date_filter(start, end, end_exclusive)}
+        GROUP BY c.id, c.name, c.icon, c.color
+        HAVING SUM(d.transaction_count) > 0
+        ORDER BY total DESC
+    '''
+    params = {'type': tx_type, 'start': start, 'end': end}
+    if limit:
+        query += ' LIMIT :limit'
+        params['limit'] = limit
+
+    return [{
+        'category_id': row[0],
+        'name': row[1],
+        'icon': row[2],
+        'color': row[3],
+        'amount': float(row[4])
+    } for row in db.session.execute(text(query), params)]
+
+
+def daily_totals(db, start, end=None, tx_type: str = 'expense', end_exclusive: bool = False) -> List[Dict]:
+    """期間內每日總額"""
+    result = db.session.execute(text(f'''
+        SELECT d.date, SUM(d.total) AS total
+        FROM daily_category_totals d
+        WHERE d.type = :type AND {_date_filter(start, end, end_exclusive)}
+        GROUP BY d.date
+        HAVING SUM(d.transaction_count) > 0
+        ORDER BY d.date
+    '''), {'type': tx_type, 'start': start, 'end': end})
+
+    return [{'date': str(row[0]), 'amount': float(row[1])} for row in result]
+
+
+def ledger_rows(db, start, end=None) -> List[Dict]:
+    """
+    期間內每日 × 收支類型 × 分類的彙總列（含分類名稱、圖示、顏色）
+    一次查詢即可在記憶體中推導出今日、期間與各分類統計
+    """
+    query = '''
+        SELECT d.date, d.type, c.id, c.name, c.icon, c.color,
+               SUM(d.total) AS total, SUM(d.transaction_count) AS count
+        FROM daily_category_totals d
+        LEFT JOIN categories c ON d.category_id = c.id
+        WHERE d.date >= :start
+    '''
+    params = {'start': start}
+    if end is not None:
+        query += ' AND d.date <= :end'
+        params['end'] = end
+    query += ' GROUP BY d.date, d.type, c.id, c.name, c.icon, c.color'
+
+    return [{
+        'date': row[0],
+        'type': row[1],
+        'category_id': row[2],
+        'name': row[3],
+        'icon': row[4],
+        'color': row[5],
+        'amount': float(row[6]),
+        'count': int(row[7])
+    } for row in db.session.execute(text(query), params)]
+
+
+def _in_range(row: Dict, start=None, end=None) -> bool:
+    return (start is None or row['date'] >= start) and (end is None or row['date'] <= end)
+
+
+def sum_rows(rows: List[Dict], tx_type: str, start=None, end=None) -> float:
+    """加總彙總列中指定類型、日期範圍內的金額"""
+    return sum(row['amount'] for row in rows if row['type'] == tx_type and _in_range(row, start, end))
+
+
+def category_rows(rows: List[Dict], tx_type: str = 'expense', start=None, end=None) -> List[Dict]:
+    """將彙總列依分類合併（依金額由大到小），未分類的交易不列入"""
+    merged: Dict[int, Dict] = {}
+    for row in rows:
+        if row['type'] != tx_type or row['category_id'] is None or not _in_range(row, start, end):
+            continue
+        item = merged.get(row['category_id'])
+        if item is None:
+            item = merged[row['category_id']] = {
+                'category_id': row['category_id'],
+                'name': row['name'],
+                'icon': row['icon'],
+                'color': row['color'],
+                'amount': 0.0,
+                'count': 0
+            }
+        item['amount'] += row['amount']
+        item['count'] += row['count']
+
+    return sorted((item for item in merged.values() if item['count'] > 0),
+                  key=lambda item: item['amount'], reverse=True)
@@ -0,0 +1,290 @@
+"""
+資料表結構維護
+啟動時以 IF NOT EXISTS 建立程式所需的索引與輔助資料表
+只使用 PostgreSQL 11 以上都支援的語法；觸發器查詢 pg_trigger，只在尚未建立時建立
+"""
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+SCHEMA_STATEMENTS = [
+    # 交易列表以 (date, id) 做 keyset 分頁
+    '''
+    CREATE INDEX IF NOT EXISTS idx_transactions_date_id
+        ON transactions (date DESC, id DESC)
+    ''',
+
+    # 交易的分類來源（user / keyword / memory / amount / default），商家記憶只由 user、keyword 學習
+    '''
+    DO $$
+    BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'transactions' AND column_name = 'category_source'
+        ) THEN
+            ALTER TABLE transactions ADD COLUMN category_source VARCHAR(20);
+        END IF;
+    END;
+    $$
+    ''',
+
+    # 每日分類彙總表：由 transactions 的觸發器以增量方式維護
+    '''
+    CREATE TABLE IF NOT EXISTS daily_category_totals (
+        date DATE NOT NULL,
+        category_id INTEGER,
+        account_id INTEGER NOT NULL,
+        type VARCHAR(50) NOT NULL,
+        total NUMERIC(18, 2) NOT NULL DEFAULT 0,
+        transaction_count INTEGER NOT NULL DEFAULT 0
+    )
+    ''',
+    # 未分類（category_id 為 NULL）也要合併成同一列，唯一索引以 COALESCE 比對
+    '''
+    CREATE UNIQUE INDEX IF NOT EXISTS uq_daily_category_totals_key
+        ON daily_category_totals (date, (COALESCE(category_id, 0)), account_id, type)
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_daily_category_totals_type_date
+        ON daily_category_totals (type, date)
+    ''',
+    # 預算已使用金額：依分類聯結日期範圍
+    '''
+    CREATE INDEX IF NOT EXISTS idx_daily_category_totals_category_date
+        ON daily_category_totals (category_id, type, date)
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION apply_daily_category_totals() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO daily_category_totals AS d
+                (date, category_id, account_id, type, total, transaction_count)
+            SELECT date, category_id, account_id, type, -SUM(amount), -COUNT(*)
+            FROM old_rows
+            GROUP BY date, category_id, account_id, type
+            ON CONFLICT (date, (COALESCE(category_id, 0)), account_id, type) DO UPDATE
+            SET total = d.total + EXCLUDED.total,
+                transaction_count = d.transaction_count + EXCLUDED.transaction_count;
+        END IF;
+
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO daily_category_totals AS d
+                (date, category_id, account_id, type, total, transaction_count)
+            SELECT date, category_id, account_id, type, SUM(amount), COUNT(*)
+            FROM new_rows
+            GROUP BY date, category_id, account_id, type
+            ON CONFLICT (date, (COALESCE(category_id, 0)), account_id, type) DO UPDATE
+            SET total = d.total + EXCLUDED.total,
+                transaction_count = d.transaction_count + EXCLUDED.transaction_count;
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            DELETE FROM daily_category_totals
+            WHERE transaction_count = 0
+              AND date IN (SELECT DISTINCT date FROM old_rows);
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    # 舊版以 UNIQUE NULLS NOT DISTINCT 建立的限制（需 PostgreSQL 15），改用上面的唯一索引
+    '''
+    ALTER TABLE daily_category_totals DROP CONSTRAINT IF EXISTS uq_daily_category_totals
+    ''',
+    # 彙總觸發器只在尚未建立時建立（不在每次啟動時重建，避免對 transactions 取得排他鎖）；
+    # 建立觸發器與由既有交易回填在同一交易中完成，並鎖住 transactions 的寫入，
+    # 期間不會有寫入漏算，多個行程同時啟動時也只有一個會回填
+    '''
+    DO $$
+    BEGIN
+        IF (SELECT COUNT(*) FROM pg_trigger
+            WHERE tgrelid = 'transactions'::regclass
+              AND tgname IN ('trg_transactions_totals_insert', 'trg_transactions_totals_update',
+                             'trg_transactions_totals_delete')) = 3 THEN
+            RETURN;
+        END IF;
+
+        LOCK TABLE transactions IN SHARE ROW EXCLUSIVE MODE;
+        -- 取得鎖之後再確認一次（另一個行程可能已完成）
+        IF (SELECT COUNT(*) FROM pg_trigger
+            WHERE tgrelid = 'transactions'::regclass
+              AND tgname IN ('trg_transactions_totals_insert', 'trg_transactions_totals_update',
+                             'trg_transactions_totals_delete')) = 3 THEN
+            RETURN;
+        END IF;
+
+        DROP TRIGGER IF EXISTS trg_transactions_totals_insert ON transactions;
+        DROP TRIGGER IF EXISTS trg_transactions_totals_update ON transactions;
+        DROP TRIGGER IF EXISTS trg_transactions_totals_delete ON transactions;
+        CREATE TRIGGER trg_transactions_totals_insert
+            AFTER INSERT ON transactions
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION apply_daily_category_totals();
+        CREATE TRIGGER trg_transactions_totals_update
+            AFTER UPDATE ON transactions
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION apply_daily_category_totals();
+        CREATE TRIGGER trg_transactions_totals_delete
+            AFTER DELETE ON transactions
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION apply_daily_category_totals();
+
+        -- 觸發器不完整時彙總表並未持續維護，整張重新計算
+        DELETE FROM daily_category_totals;
+        INSERT INTO daily_category_totals (date, category_id, account_id, type, total, transaction_count)
+        SELECT date, category_id, account_id, type, SUM(amount), COUNT(*)
+        FROM transactions
+        GROUP BY date, category_id, account_id, type;
+    END;
+    $$
+    ''',
+    # 歷史日線（欄式快取由 price_history 服務另外維護）
+    '''
+    CREATE TABLE IF NOT EXISTS price_history (
+        symbol VARCHAR(20) NOT NULL,
+        date DATE NOT NULL,
+        open NUMERIC(18, 4),
+        high NUMERIC(18, 4),
+        low NUMERIC(18, 4),
+        close NUMERIC(18, 4) NOT NULL,
+        volume BIGINT,
+        PRIMARY KEY (symbol, date)
+    )
+    ''',
+    # 持倉批次帳本（買入批次與剩餘數量）
+    '''
+    CREATE TABLE IF NOT EXISTS holding_lots (
+        id SERIAL PRIMARY KEY,
+        holding_id INTEGER NOT NULL,
+        transaction_id INTEGER,
+        acquired_date DATE NOT NULL,
+        quantity NUMERIC(18, 4) NOT NULL,
+        remaining_quantity NUMERIC(18, 4) NOT NULL,
+        cost_per_share NUMERIC(18, 6) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_holding_lots_open
+        ON holding_lots (holding_id, acquired_date, id) WHERE remaining_quantity > 0
+    ''',
+    # 持倉與交易的損益欄位；既有持倉以目前持股與平均成本建立期初批次
+    '''
+    DO $$
+    BEGIN
+        IF to_regclass('holdings') IS NOT NULL THEN
+            ALTER TABLE holdings ADD COLUMN IF NOT EXISTS realized_pnl NUMERIC(18, 2) NOT NULL DEFAULT 0;
+            ALTER TABLE holdings ADD COLUMN IF NOT EXISTS cost_method VARCHAR(10) NOT NULL DEFAULT 'average';
+
+            INSERT INTO holding_lots (holding_id, acquired_date, quantity, remaining_quantity, cost_per_share)
+            SELECT h.id, COALESCE(h.created_at::date, CURRENT_DATE), h.quantity, h.quantity, COALESCE(h.average_cost, 0)
+            FROM holdings h
+            WHERE h.quantity > 0
+              AND NOT EXISTS (SELECT 1 FROM holding_lots l WHERE l.holding_id = h.id);
+        END IF;
+
+        IF to_regclass('investment_transactions') IS NOT NULL THEN
+            ALTER TABLE investment_transactions ADD COLUMN IF NOT EXISTS realized_pnl NUMERIC(18, 2);
+        END IF;
+    END;
+    $$
+    ''',
+    # 關注清單價格提醒紀錄
+    '''
+    CREATE TABLE IF NOT EXISTS price_alerts (
+        id SERIAL PRIMARY KEY,
+        watchlist_id INTEGER NOT NULL,
+        symbol VARCHAR(20) NOT NULL,
+        alert_type VARCHAR(20) NOT NULL,
+        threshold NUMERIC(18, 4) NOT NULL,
+        price NUMERIC(18, 4) NOT NULL,
+        change_percent NUMERIC(9, 2),
+        is_read BOOLEAN NOT NULL DEFAULT FALSE,
+        triggered_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_price_alerts_rule
+        ON price_alerts (watchlist_id, alert_type, triggered_at DESC)
+    ''',
+    # 資料表版本號：每次寫入（任一寫入路徑）都由觸發器遞增，作為 ETag 的依據
+    '''
+    CREATE TABLE IF NOT EXISTS table_versions (
+        table_name VARCHAR(100) PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION bump_table_version() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO table_versions (table_name, version) VALUES (TG_TABLE_NAME, 1)
+        ON CONFLICT (table_name) DO UPDATE SET version = table_versions.version + 1;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+    ''',
+    '''
+    DO $$
+    DECLARE
+        tbl TEXT;
+    BEGIN
+        FOREACH tbl IN ARRAY ARRAY[
+            'accounts', 'categories', 'transactions', 'budgets', 'financial_goals',
+            'investment_accounts', 'holdings', 'investment_transactions', 'watchlist',
+            'price_history', 'price_alerts'
+        ] LOOP
+            IF to_regclass(tbl) IS NOT NULL AND NOT EXISTS (
+                SELECT 1 FROM pg_trigger
+                WHERE tgrelid = to_regclass(tbl) AND tgname = format('trg_%s_version', tbl)
+            ) THEN
+                EXECUTE format(
+                    'CREATE TRIGGER trg_%s_version '
+                    'AFTER INSERT OR UPDATE OR DELETE ON %I '
+                    'FOR EACH STATEMENT EXECUTE FUNCTION bump_table_version()',
+                    tbl, tbl
+                );
+            END IF;
+        END LOOP;
+    END;
+    $$
+    ''',
+]
+
+
+def ensure_schema(db):
+    """
+    建立缺少的索引與資料表（可重複執行），回傳是否全部成功
+    每個語句各自 commit，一個失敗不會連帶回復其他語句；資料庫無法連線時略過
+    """
+    ok = True
+    for statement in SCHEMA_STATEMENTS:
+        try:
+            db.session.execute(text(statement))
+            db.session.commit()
+        except OperationalError as e:
+            db.session.rollback()
+            print(f'初始化資料表結構錯誤（資料庫無法連線）: {e}')
+            return False
+        except Exception as e:
+            db.session.rollback()
+            print(f"初始化資料表結構錯誤: {' '.join(statement.split())[:80]}: {e}")
+            ok = False
+    return ok
+
+
+def rebuild_daily_category_totals(db):
+    """由 transactions 重新計算整張每日分類彙總表"""
+    try:
+        db.session.execute(text('LOCK TABLE transactions IN SHARE MODE'))
+        db.session.execute(text('DELETE FROM daily_category_totals'))
+        db.session.execute(text('''
+            INSERT INTO daily_category_totals (date, category_id, account_id, type, total, transaction_count)
+            SELECT date, category_id, account_id, type, SUM(amount), COUNT(*)
+            FROM transactions
+            GROUP BY date, category_id, account_id, type
+        '''))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
@@ -0,0 +1,126 @@
+"""
+股票代號表
+- 由本機快照檔（JSON，含版本）延遲載入，啟動與請求過程都不連網
+- 快照不存在時改用 twstock 套件內附的代號表
+- 以 `flask --app run refresh-stock-codes` 另行下載最新代號表並寫入新版快照，
+  執行中的服務最多 60 秒內偵測到快照更新並重新載入
+"""
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+SNAPSHOT_PATH = os.getenv(
+    'STOCK_CODES_SNAPSHOT',
+    os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'stock_codes.json')
+)
+SNAPSHOT_FIELDS = ('symbol', 'name', 'type', 'market', 'group', 'start_date')
+SNAPSHOT_CHECK_INTERVAL = 60
+
+
+class StockRegistry:
+    """股票代號表（第一次使用時才載入）"""
+
+    def __init__(self, path: str = SNAPSHOT_PATH):
+        self.path = os.path.abspath(path)
+        self.version: Optional[str] = None
+        self.source: Optional[str] = None
+        self._codes: Optional[Dict[str, Dict]] = None
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def _snapshot_mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def _snapshot_changed(self) -> bool:
+        """快照檔是否在載入後被更新（最多每 SNAPSHOT_CHECK_INTERVAL 秒檢查一次）"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        self._next_check = now + SNAPSHOT_CHECK_INTERVAL
+        return self._snapshot_mtime() != self._mtime
+
+    @staticmethod
+    def _from_twstock() -> List[Tuple]:
+        """讀取 twstock 目前的代號表"""
+        import twstock
+
+        return [(code, info.name, info.type, info.market, info.group, info.start)
+                for code, info in twstock.codes.items()]
+
+    def load(self) -> Dict[str, Dict]:
+        """載入代號表（已載入時直接回傳）"""
+        if self._codes is not None and not self._snapshot_changed():
+            return self._codes
+        with self._lock:
+            if self._codes is not None and self._snapshot_mtime() == self._mtime:
+                return self._codes
+            self._mtime = self._snapshot_mtime()
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    snapshot = json.load(f)
+                rows = snapshot['codes']
+                self.version = snapshot['version']
+                self.source = 'snapshot'
+            except FileNotFoundError:
+                rows = self._from_twstock()
+                self.version = f'twstock-{len(rows)}'
+                self.source = 'twstock'
+            except Exception as e:
+                print(f'讀取股票代號快照錯誤: {e}')
+                rows = self._from_twstock()
+                self.version = f'twstock-{len(rows)}'
+                self.source = 'twstock'
+            self._codes = {row[0]: dict(zip(SNAPSHOT_FIELDS, row)) for row in rows}
+            return self._codes
+
+    def get(self, symbol: str) -> Optional[Dict]:
+        """取得單一股票資訊"""
+        info = self.load().get(symbol)
+        return dict(info) if info else None
+
+    def items(self) -> Iterator[Dict]:
+        return iter(self.load().values())
+
+    def refresh(self) -> Dict:
+        """
+        下載最新代號表並寫入新版快照（由命令列或排程執行，不在請求中呼叫）
+        回傳新快照的版本與筆數
+        """
+        import twstock
+
+        # 以字串取得，避免在類別內呼叫時被 Python 名稱改寫
+        getattr(twstock, '__update_codes')()
+        rows = self._from_twstock()
+        snapshot = {
+            'version': datetime.now().strftime('%Y%m%d%H%M%S'),
+            'count': len(rows),
+            'fields': list(SNAPSHOT_FIELDS),
+            'codes': rows
+        }
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+        # 下次使用時重新載入
+        with self._lock:
+            self._codes = None
+        return {'version': snapshot['version'], 'count': snapshot['count'], 'path': self.path}
+
+    def status(self) -> Dict:
+        codes = self.load()
+        return {'version': self.version, 'source': self.source, 'count': len(codes), 'path': self.path}
+
+
+# 建立代號表實例
+stock_registry = StockRegistry()
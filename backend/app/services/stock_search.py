@@ -0,0 +1,127 @@
+"""
+股票搜尋索引
+- 代號與名稱各一棵前綴 trie，每個節點保存排序後的前 N 筆
+- 代號與名稱的 n-gram 倒排索引（單字與雙字）
+查詢排序：完全相符 → 前綴相符 → 包含關鍵字；同一層中代號較短者優先（一般股票優先於權證）
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class StockSearchIndex:
+    """
+    股票搜尋索引
+    build() 建立一次後，每次查詢只需走訪 trie 與最短的倒排清單，不再掃描整個代號表
+    """
+
+    # 每個 trie 節點保留的候選數（前綴相符層的上限）
+    PREFIX_CANDIDATES = 50
+
+    def __init__(self):
+        self.version = None
+        self._index = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _grams(text: str) -> List[str]:
+        """單字與雙字 n-gram"""
+        return list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+
+    def _build_trie(self, keys: List[str], order: List[int]) -> Dict:
+        root: Dict = {'': []}
+        for entry_id in order:
+            node = root
+            for char in keys[entry_id]:
+                node = node.setdefault(char, {'': []})
+                if len(node['']) < self.PREFIX_CANDIDATES:
+                    node[''].append(entry_id)
+        return root
+
+    def build(self, entries: Iterable[Tuple[str, str, str, str]], version=None):
+        """由 (代號, 名稱, 類型, 市場) 建立索引"""
+        items = [{'symbol': code, 'name': name or '', 'type': kind, 'market': market}
+                 for code, name, kind, market in entries]
+        codes = [item['symbol'].casefold() for item in items]
+        names = [item['name'].casefold() for item in items]
+
+        order = sorted(range(len(items)), key=lambda i: (len(codes[i]), codes[i]))
+
+        exact: Dict[str, List[int]] = {}
+        for entry_id in order:
+            exact.setdefault(codes[entry_id], []).append(entry_id)
+        for entry_id in order:
+            if names[entry_id]:
+                exact.setdefault(names[entry_id], []).append(entry_id)
+
+        postings: Dict[str, List[int]] = {}
+        for entry_id in order:
+            for gram in set(self._grams(codes[entry_id]) + self._grams(names[entry_id])):
+                postings.setdefault(gram, []).append(entry_id)
+
+        index = {
+            'items': items,
+            'codes': codes,
+            'names': names,
+            'exact': exact,
+            'code_trie': self._build_trie(codes, order),
+            'name_trie': self._build_trie(names, order),
+            'postings': postings
+        }
+        # 一次替換，查詢端不會看到建到一半的索引
+        with self._lock:
+            self._index = index
+            self.version = version
+
+    def ensure(self, version, entries_factory):
+        """版本不同時才重建索引；entries_factory() 回傳建立用的資料"""
+        if self._index is None or self.version != version:
+            self.build(entries_factory(), version)
+
+    @staticmethod
+    def _walk(trie: Dict, keyword: str) -> List[int]:
+        node = trie
+        for char in keyword:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node['']
+
+    def search(self, keyword: str, limit: int = 20) -> List[Dict]:
+        """依相關性排序搜尋股票"""
+        index = self._index
+        keyword = (keyword or '').strip().casefold()
+        if index is None or not keyword or limit <= 0:
+            return []
+
+        found: List[int] = []
+        seen = set()
+
+        def collect(entry_ids: Iterable[int], predicate=None) -> bool:
+            for entry_id in entry_ids:
+                if entry_id in seen or (predicate and not predicate(entry_id)):
+                    continue
+                seen.add(entry_id)
+                found.append(entry_id)
+                if len(found) >= limit:
+                    return True
+            return False
+
+        codes, names = index['codes'], index['names']
+        done = (
+            collect(index['exact'].get(keyword, ()))
+            or collect(self._walk(index['code_trie'], keyword))
+            or collect(self._walk(index['name_trie'], keyword))
+        )
+        if not done:
+            # 取最短的倒排清單逐筆驗證，清單本身已依代號長度排序
+            grams = [keyword] if len(keyword) <= 2 else self._grams(keyword)[len(keyword):]
+            lists: List[Optional[List[int]]] = [index['postings'].get(gram) for gram in grams]
+            if all(lists):
+                candidates = min(lists, key=len)
+                collect(candidates, lambda i: keyword in codes[i] or keyword in names[i])
+
+        items = index['items']
+        return [dict(items[entry_id]) for entry_id in found]
+
+    def __len__(self):
+        return len(self._index['items']) if self._index else 0
@@ -1,124 +1,195 @@
 """
 台股數據服務
-使用 twstock 套件取得台灣股市數據
+即時報價直接查詢 TWSE MIS（market_data / market_http 連線池），代號表與歷史日線使用 twstock
 """
-import ssl
 import os
-
-# 修復 SSL 憑證問題
-os.environ['PYTHONHTTPSVERIFY'] = '0'
-ssl._create_default_https_context = ssl._create_unverified_context
-
-# 讓 requests 也忽略 SSL
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-import requests
-old_request = requests.Session.request
-def new_request(self, *args, **kwargs):
-    kwargs['verify'] = False
-    return old_request(self, *args, **kwargs)
-requests.Session.request = new_request
-
-import twstock
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 
+from app.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+from app.services.market_data import market_data, market_http
+from app.services.quote_cache import QuoteCache
+from app.services.stock_registry import stock_registry
+from app.services.stock_search import StockSearchIndex
+
 
 class StockService:
     """台股數據服務類"""
     
     def __init__(self):
         """初始化服務"""
-        try:
-            twstock.__update_codes()
-        except:
-            pass
+        self.quote_cache = QuoteCache(
+            open_ttl=float(os.getenv('QUOTE_CACHE_TTL', 5)),
+            closed_ttl=float(os.getenv('QUOTE_CACHE_CLOSED_TTL', 1800)),
+            fetch_timeout=float(os.getenv('QUOTE_FETCH_TIMEOUT', 3))
+        )
+        self.chunk_size = int(os.getenv('QUOTE_CHUNK_SIZE', 20))
+        self.chunk_timeout = float(os.getenv('QUOTE_CHUNK_TIMEOUT', 5))
+        self.chunk_retries = int(os.getenv('QUOTE_CHUNK_RETRIES', 1))
+        self.fetch_workers = int(os.getenv('QUOTE_FETCH_WORKERS', 4))
+        self._fetch_pool = ThreadPoolExecutor(max_workers=self.fetch_workers, thread_name_prefix='twse')
+        # 上游連續失敗時暫停呼叫，報價快取直接回傳最後一次報價（stale）
+        self.breaker = CircuitBreaker(
+            'TWSE 報價',
+            failure_threshold=int(os.getenv('QUOTE_BREAKER_FAILURES', 3)),
+            reset_timeout=float(os.getenv('QUOTE_BREAKER_RESET', 30))
+        )
+        self.search_index = StockSearchIndex()
+    
+    @staticmethod
+    def _parse_quote(symbol: str, data: Dict) -> Dict:
+        """將 twstock 即時資料轉為報價格式"""
+        if not data or not data.get('success'):
+            return {'symbol': symbol, 'success': False, 'error': '無法取得數據'}
+        
+        realtime = data['realtime']
+        info = data['info']
+        return {
+            'symbol': symbol,
+            'name': info.get('name', ''),
+            'price': float(realtime.get('latest_trade_price', 0) or 0),
+            'change': float(realtime.get('change', 0) or 0),
+            'volume': int(realtime.get('accumulate_trade_volume', 0) or 0),
+            'high': float(realtime.get('high', 0) or 0),
+            'low': float(realtime.get('low', 0) or 0),
+            'open': float(realtime.get('open', 0) or 0),
+            'time': info.get('time', ''),
+            'success': True
+        }
+    
+    def _fetch_chunk(self, symbols: List[str]) -> Dict[str, Dict]:
+        """向 TWSE 取得一批即時資料（未安裝 aiohttp 時使用 requests 連線池）"""
+        data = market_http.fetch(list(symbols))
+        return {symbol: self._parse_quote(symbol, data.get(symbol)) for symbol in symbols}
+    
+    def _fetch_wave(self, chunks: List[List[str]]) -> List:
+        """
+        並行取得多個批次，回傳與 chunks 對應的報價或例外
+        有非同步行情客戶端時所有批次在同一個 event loop 上多工，否則交給執行緒池；
+        每個批次各自逾時，慢的批次不會拖累同一輪其他批次的結果
+        """
+        if market_data is not None:
+            try:
+                results = market_data.get_many(chunks, chunk_timeout=self.chunk_timeout)
+            except Exception as e:
+                return [e] * len(chunks)
+            return [
+                result if isinstance(result, BaseException)
+                else {symbol: self._parse_quote(symbol, result.get(symbol)) for symbol in chunk}
+                for chunk, result in zip(chunks, results)
+            ]
+        
+        # 批次數超過執行緒數時會排隊，逾時依輪數放寬
+        waves = -(-len(chunks) // self.fetch_workers)
+        deadline = time.monotonic() + self.chunk_timeout * waves
+        futures = [self._fetch_pool.submit(self._fetch_chunk, chunk) for chunk in chunks]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+            except Exception as e:
+                results.append(e)
+        return results
+    
+    def _fetch_rounds(self, chunks: List[List[str]], attempts: int, quotes: Dict[str, Dict]) -> List[List[str]]:
+        """
+        並行取得各批次，成功的結果合併到 quotes；
+        逾時或發生錯誤的批次重試 attempts 次，回傳仍然失敗的批次
+        """
+        pending = chunks
+        for _ in range(attempts):
+            if not pending:
+                break
+            results = self._fetch_wave(pending)
+            failed = []
+            for chunk, result in zip(pending, results):
+                if isinstance(result, BaseException):
+                    print(f'取得即時股價錯誤 ({",".join(chunk)}): {str(result) or type(result).__name__}')
+                    failed.append(chunk)
+                else:
+                    quotes.update(result)
+            pending = failed
+        return pending
+    
+    def _fetch_quotes(self, symbols: List[str]) -> Dict[str, Dict]:
+        """
+        向 TWSE 取得多檔即時資料（快取未命中或背景輪詢時呼叫）
+        拆成多個批次並行取得；部分批次失敗時改為逐檔取得，單一股票錯誤不影響其他股票
+        所有批次都失敗時記錄到斷路器；斷路器開啟時直接拋出 CircuitOpenError，不呼叫上游
+        """
+        self.breaker.check()
+        symbols = list(dict.fromkeys(symbols))
+        size = self.chunk_size
+        chunks = [symbols[i:i + size] for i in range(0, len(symbols), size)]
+        
+        quotes: Dict[str, Dict] = {}
+        failed = self._fetch_rounds(chunks, 1 + self.chunk_retries, quotes)
+        if chunks and len(failed) == len(chunks):
+            # 沒有任何批次成功：視為上游故障，不再逐檔重試
+            self.breaker.record_failure(f'{len(chunks)} 個批次全部失敗')
+            raise RuntimeError('報價來源無回應')
+        self.breaker.record_success()
+        
+        singles = [[symbol] for chunk in failed if len(chunk) > 1 for symbol in chunk]
+        if singles:
+            self._fetch_rounds(singles, 1, quotes)
+        
+        for symbol in symbols:
+            quotes.setdefault(symbol, {'symbol': symbol, 'success': False, 'error': '無法取得數據'})
+        return quotes
     
     def get_realtime_price(self, symbol: str) -> Optional[Dict]:
         """取得即時股價"""
-        try:
-            data = twstock.realtime.get(symbol)
-            
-            if data['success']:
-                realtime = data['realtime']
-                info = data['info']
-                
-                return {
-                    'symbol': symbol,
-                    'name': info.get('name', ''),
-                    'price': float(realtime.get('latest_trade_price', 0) or 0),
-                    'change': float(realtime.get('change', 0) or 0),
-                    'volume': int(realtime.get('accumulate_trade_volume', 0) or 0),
-                    'high': float(realtime.get('high', 0) or 0),
-                    'low': float(realtime.get('low', 0) or 0),
-                    'open': float(realtime.get('open', 0) or 0),
-                    'time': info.get('time', ''),
-                    'success': True
-                }
-            return {'symbol': symbol, 'success': False, 'error': '無法取得數據'}
-        except Exception as e:
-            return {'symbol': symbol, 'success': False, 'error': str(e)}
+        return self.quote_cache.get_many([symbol], self._fetch_quotes)[symbol]
     
     def get_realtime_prices(self, symbols: List[str]) -> List[Dict]:
         """批量取得即時股價"""
+        quotes = self.quote_cache.get_many(symbols, self._fetch_quotes)
+        return [quotes[symbol] for symbol in symbols]
+    
+    def refresh_quotes(self, symbols: List[str], ttl: Optional[float] = None) -> Dict[str, Dict]:
+        """由上游更新報價並寫入快取（背景輪詢使用），回傳成功取得的報價"""
+        fresh = {}
         try:
-            data = twstock.realtime.get(symbols)
-            results = []
-            
-            for symbol in symbols:
-                if symbol in data and data[symbol]['success']:
-                    realtime = data[symbol]['realtime']
-                    info = data[symbol]['info']
-                    
-                    results.append({
-                        'symbol': symbol,
-                        'name': info.get('name', ''),
-                        'price': float(realtime.get('latest_trade_price', 0) or 0),
-                        'change': float(realtime.get('change', 0) or 0),
-                        'volume': int(realtime.get('accumulate_trade_volume', 0) or 0),
-                        'success': True
-                    })
-                else:
-                    results.append({'symbol': symbol, 'success': False})
-            
-            return results
-        except Exception as e:
-            return [{'symbol': s, 'success': False, 'error': str(e)} for s in symbols]
+            fetched = self._fetch_quotes(symbols)
+        except CircuitOpenError:
+            return fresh
+        for symbol, quote in fetched.items():
+            if quote.get('success'):
+                fresh[symbol] = {**quote, 'stale': False}
+                self.quote_cache.put(symbol, fresh[symbol], ttl)
+        return fresh
+    
+    def get_cached_quotes(self, symbols: List[str]) -> Dict[str, Dict]:
+        """只讀取報價快取（不呼叫上游），回傳 {symbol: quote}，沒有報價的股票不列入"""
+        quotes = {}
+        for symbol in symbols:
+            quote = self.quote_cache.peek(symbol)
+            if quote is not None:
+                quotes[symbol] = quote
+        return quotes
     
     def get_stock_info(self, symbol: str) -> Optional[Dict]:
-        """取得股票基本資訊"""
+        """取得股票基本資訊（讀取本機代號表）"""
         try:
-            if symbol in twstock.codes:
-                info = twstock.codes[symbol]
-                return {
-                    'symbol': symbol,
-                    'name': info.name,
-                    'type': info.type,
-                    'market': info.market,
-                    'group': info.group,
-                    'start_date': info.start
-                }
-            return None
-        except:
+            return stock_registry.get(symbol)
+        except Exception:
             return None
     
     def search_stocks(self, keyword: str, limit: int = 20) -> List[Dict]:
-        """搜尋股票"""
-        results = []
+        """搜尋股票（依相關性排序：代號完全相符、前綴相符、包含關鍵字）"""
         try:
-            for code, info in twstock.codes.items():
-                if keyword.upper() in code or keyword in info.name:
-                    results.append({
-                        'symbol': code,
-                        'name': info.name,
-                        'type': info.type,
-                        'market': info.market
-                    })
-                    if len(results) >= limit:
-                        break
-            return results
-        except:
+            stock_registry.load()
+            self.search_index.ensure(
+                stock_registry.version,
+                lambda: ((item['symbol'], item['name'], item['type'], item['market'])
+                         for item in stock_registry.items())
+            )
+            return self.search_index.search(keyword, limit)
+        except Exception:
             return []
 
 
@@ -140,6 +211,87 @@ class PerformanceCalculator:
         total_return = current_value / cost
         annualized = (total_return ** (365 / holding_days)) - 1
         return round(annualized * 100, 2)
+    
+    @staticmethod
+    def xirr_batch(amounts: np.ndarray, years: np.ndarray,
+                   tolerance: float = 1e-7, max_iterations: int = 50) -> np.ndarray:
+        """
+        批次計算 XIRR（資金加權報酬率）
+        amounts 為 N × M 現金流矩陣（投入為負、取回為正，沒有現金流填 0），
+        years 為距第一筆現金流的年數（M 或 N × M）；回傳 N 個年化報酬率（無解為 NaN）
+        先以向量化牛頓法求解，未收斂者再以向量化二分法求解
+        """
+        amounts = np.atleast_2d(np.asarray(amounts, dtype=float))
+        years = np.broadcast_to(np.asarray(years, dtype=float), amounts.shape)
+        scale = np.abs(amounts).sum(axis=1)
+        solvable = (amounts > 0).any(axis=1) & (amounts < 0).any(axis=1)
+        
+        def npv(rate: np.ndarray) -> np.ndarray:
+            return (amounts * (1 + rate[:, None]) ** -years).sum(axis=1)
+        
+        rate = np.full(len(amounts), 0.1)
+        with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+            for _ in range(max_iterations):
+                discount = (1 + rate[:, None]) ** -years
+                value = (amounts * discount).sum(axis=1)
+                slope = (-years * amounts * discount / (1 + rate[:, None])).sum(axis=1)
+                step = np.where(slope != 0, value / slope, 0)
+                rate = np.clip(rate - step, -0.9999, 1e6)
+                if np.all(np.abs(step[solvable]) < tolerance):
+                    break
+            converged = solvable & np.isfinite(rate) & (np.abs(npv(rate)) <= tolerance * np.maximum(scale, 1))
+            
+            # 二分法備援（NPV 在 -99.99% 與 +10000% 之間變號才有解）
+            retry = solvable & ~converged
+            if retry.any():
+                low = np.full(len(amounts), -0.9999)
+                high = np.full(len(amounts), 100.0)
+                low_value = npv(low)
+                bracketed = retry & (np.sign(low_value) != np.sign(npv(high)))
+                for _ in range(200):
+                    middle = (low + high) / 2
+                    middle_value = npv(middle)
+                    same_side = np.sign(middle_value) == np.sign(low_value)
+                    low = np.where(same_side, middle, low)
+                    low_value = np.where(same_side, middle_value, low_value)
+                    high = np.where(same_side, high, middle)
+                rate = np.where(bracketed, (low + high) / 2, rate)
+                converged |= bracketed
+        
+        return np.where(converged, rate, np.nan)
+    
+    @classmethod
+    def calculate_xirr(cls, cash_flows: List[tuple]) -> Optional[float]:
+        """計算 XIRR（%）；cash_flows 為 [(日期, 金額)]，投入為負、取回為正"""
+        if not cash_flows:
+            return None
+        first = min(day for day, _ in cash_flows)
+        years = np.array([(day - first).days / 365 for day, _ in cash_flows])
+        rate = cls.xirr_batch(np.array([[amount for _, amount in cash_flows]]), years)[0]
+        return None if np.isnan(rate) else round(float(rate) * 100, 2)
+    
+    @staticmethod
+    def twr_batch(values: np.ndarray, flows: np.ndarray) -> np.ndarray:
+        """
+        批次計算 TWR（時間加權報酬率）
+        values 為 N × T 每期期末市值，flows 為 N × T 每期的淨現金流（投入為正、取回為負）；
+        投入視為期初、取回視為期末發生：
+        每期報酬 = (期末市值 + 本期取回) / (前期市值 + 本期投入)，各期連乘後減 1
+        """
+        values = np.atleast_2d(np.asarray(values, dtype=float))
+        flows = np.atleast_2d(np.asarray(flows, dtype=float))
+        previous = np.concatenate([np.zeros((len(values), 1)), values[:, :-1]], axis=1)
+        inflows = np.clip(flows, 0, None)
+        outflows = np.clip(-flows, 0, None)
+        base = previous + inflows
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.where(base > 0, (values + outflows) / base, 1.0)
+        return np.prod(growth, axis=1) - 1
+    
+    @classmethod
+    def calculate_twr(cls, values: List[float], flows: List[float]) -> float:
+        """計算 TWR（%）"""
+        return round(float(cls.twr_batch(np.array([values]), np.array([flows]))[0]) * 100, 2)
 
 
 class RiskAssessment:
@@ -42,6 +42,9 @@ def handle_preflight():
         response.headers.add("Access-Control-Allow-Headers", "Content-Type, Authorization")
         return response
     
+import base64
+import binascii
+import json
 import os
 import sys
 from datetime import datetime, timedelta
@@ -51,13 +54,22 @@ from decimal import Decimal
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
-from flask import Flask, jsonify, request
+import click
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy import func, text
 
+from app.services.categorizer import LEARNABLE_SOURCES, KeywordMatcher, MerchantMemory
+from app.services import budget_service, dashboard_service
+from app.services.cache_service import conditional_get, response_cache
+from app.services.ledger_events import ledger_events
+from app.services.price_history import history_backfill
+from app.services.quote_poller import quote_poller
+from app.services.report_service import category_totals, daily_totals
+
 # 載入環境變數
 load_dotenv()
 
@@ -134,28 +146,98 @@ AMOUNT_CATEGORY_RULES = [
     (15, 50, 2),      # 15-50 元 → 交通（捷運、公車）
 ]
 
+# 關鍵字自動機：啟動時建立一次，關鍵字變更時透過 set_keyword_rules 重建
+keyword_matcher = KeywordMatcher(KEYWORD_CATEGORY_MAP)
+
+def set_keyword_rules(keyword_map):
+    """更新關鍵字分類對照表並重建自動機"""
+    KEYWORD_CATEGORY_MAP.clear()
+    KEYWORD_CATEGORY_MAP.update(keyword_map)
+    keyword_matcher.build(KEYWORD_CATEGORY_MAP)
+
+# 預設分類：其他支出(8) 或 其他收入(12)，不作為商家記憶的學習來源
+DEFAULT_EXPENSE_CATEGORY_ID = 8
+DEFAULT_INCOME_CATEGORY_ID = 12
+
+# 商家記憶：啟動時由 transactions 載入，寫入交易時即時更新
+merchant_memory = MerchantMemory(
+    capacity=int(os.getenv('MERCHANT_MEMORY_SIZE', 20000)),
+    ignore_categories=(DEFAULT_EXPENSE_CATEGORY_ID, DEFAULT_INCOME_CATEGORY_ID)
+)
+
 def auto_categorize(description, amount=None):
     """
     自動分類功能 (參考 Firefly III Rules Engine)
     分類邏輯優先順序：
-    1. 關鍵字比對
-    2. 金額區間判斷
-    3. 歷史紀錄相似度（TODO: 需要 app context）
+    1. 歷史紀錄（同一商家過去最常使用的分類，記憶體查詢）
+    2. 關鍵字比對（多個命中時取最長的關鍵字）
+    3. 金額區間判斷
+    回傳 (category_id, 分類來源 memory / keyword / amount)，無法分類時回傳 (None, None)
     """
-    description_lower = description.lower()
+    # 1. 歷史紀錄
+    category_id = merchant_memory.lookup(description)
+    if category_id is not None:
+        return category_id, 'memory'
     
-    # 1. 關鍵字比對
-    for keyword, category_id in KEYWORD_CATEGORY_MAP.items():
-        if keyword in description_lower:
-            return category_id
+    # 2. 關鍵字比對
+    category_id = keyword_matcher.match(description)
+    if category_id is not None:
+        return category_id, 'keyword'
     
-    # 2. 金額區間判斷
+    # 3. 金額區間判斷
     if amount is not None:
         for min_amt, max_amt, category_id in AMOUNT_CATEGORY_RULES:
             if min_amt <= amount <= max_amt:
-                return category_id
+                return category_id, 'amount'
     
-    return None  # 無法自動分類
+    return None, None  # 無法自動分類
+
+def categorize_many(items):
+    """
+    批次自動分類
+    items: [(description, amount), ...]，回傳對應的 (分類 ID, 分類來源) 列表（無法分類為 (None, None)）
+    """
+    return [auto_categorize(description, amount) for description, amount in items]
+
+def learn_imported(rows):
+    """匯入完成後，只由使用者指定或關鍵字命中的分類學習商家記憶"""
+    merchant_memory.learn_many(
+        row for row in rows if row.get('category_source') in LEARNABLE_SOURCES
+    )
+
+# ========================================
+# 交易列表分頁 (keyset pagination)
+# ========================================
+TRANSACTION_PAGE_DEFAULT = 100
+TRANSACTION_PAGE_MAX = 1000
+TRANSACTION_STREAM_BATCH_SIZE = 1000
+
+def encode_transaction_cursor(date_value, transaction_id):
+    """將 (date, id) 編碼成不透明的分頁游標"""
+    raw = f'{date_value}|{transaction_id}'
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_transaction_cursor(cursor):
+    """解析分頁游標，格式錯誤時拋出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        date_str, transaction_id = raw.split('|', 1)
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(transaction_id)
+    except (UnicodeError, ValueError, binascii.Error) as e:
+        raise ValueError(f'invalid cursor: {cursor}') from e
+
+def transaction_row_to_dict(row):
+    """交易列 (id, account_id, category_id, date, description, amount, type, notes) 轉字典"""
+    return {
+        'id': row[0],
+        'account_id': row[1],
+        'category_id': row[2],
+        'date': str(row[3]) if row[3] else None,
+        'description': row[4],
+        'amount': float(row[5]) if row[5] else 0,
+        'type': row[6],
+        'notes': row[7]
+    }
 
 # ========================================
 # 建立 Flask App
@@ -175,6 +257,25 @@ def create_app():
     # 初始化資料庫
     db.init_app(app)
     
+    # 建立所需索引與輔助資料表（失敗時只記錄錯誤，與商家記憶相同，不中止啟動與 CLI 指令）
+    from app.services.schema import ensure_schema
+    with app.app_context():
+        ensure_schema(db)
+        
+        # 載入商家記憶（資料庫無法連線時略過，之後寫入時再逐步累積）
+        try:
+            merchant_memory.warm(db)
+        except Exception as e:
+            db.session.rollback()
+            print(f'載入商家記憶錯誤: {e}')
+    
+    
+    # 背景工作：於第一個請求時啟動（避免 debug reloader 監控程序與 CLI 指令重複執行）
+    @app.before_request
+    def start_background_jobs():
+        budget_service.budget_sweeper.start(app, db)
+        quote_poller.start(app, db)
+        history_backfill.start(app, db)
     
     # 首頁路由
     
@@ -205,12 +306,14 @@ def create_app():
                 'budgets': '/api/budgets',
                 'goals': '/api/goals',
                 'reports': '/api/reports',
-                'suggestions': '/api/suggestions'
+                'suggestions': '/api/suggestions',
+                'dashboard': '/api/dashboard'
             }
         })
     
     
     @app.route('/api/accounts', methods=['GET'])
+    @conditional_get('accounts')
     def get_accounts():
         """取得所有帳戶"""
         result = db.session.execute(text('SELECT * FROM accounts WHERE is_active = true'))
@@ -282,6 +385,7 @@ def create_app():
     # 分類管理 API (參考 Firefly III Categories)
     
     @app.route('/api/categories', methods=['GET'])
+    @conditional_get('categories')
     def get_categories():
         """取得所有分類"""
         category_type = request.args.get('type')
@@ -324,18 +428,25 @@ def create_app():
             'description': data.get('description', '')
         })
         db.session.commit()
+        response_cache.invalidate('categories')
         
         return jsonify({'message': '分類建立成功'}), 201
     
     # 交易記錄 API - 日常支出管理 參考 Firefly III Transactions
 
     @app.route('/api/transactions', methods=['GET'])
+    @conditional_get('transactions')
     def get_transactions():
         """
         取得所有交易記錄
         支援篩選：type, account_id, category_id, start_date, end_date
+        分頁：limit + after（keyset 游標，依 date DESC, id DESC）
+        串流：stream=ndjson 以伺服器端游標逐批輸出，每行一筆 JSON
         """
-        query = 'SELECT * FROM transactions WHERE 1=1'
+        query = (
+            'SELECT id, account_id, category_id, date, description, amount, type, notes '
+            'FROM transactions WHERE 1=1'
+        )
         params = {}
         
         if request.args.get('type'):
@@ -358,53 +469,94 @@ def create_app():
             query += ' AND date <= :end_date'
             params['end_date'] = request.args.get('end_date')
         
+        # keyset 游標：從上一頁最後一筆之後接續
+        after = request.args.get('after')
+        if after:
+            try:
+                params['after_date'], params['after_id'] = decode_transaction_cursor(after)
+            except ValueError:
+                return jsonify({'error': '無效的分頁游標'}), 400
+            query += ' AND (date, id) < (:after_date, :after_id)'
+        
         query += ' ORDER BY date DESC, id DESC'
         
-        result = db.session.execute(text(query), params)
-        transactions = []
-        for row in result:
-            transactions.append({
-                'id': row[0],
-                'account_id': row[1],
-                'category_id': row[2],
-                'date': str(row[3]) if row[3] else None,
-                'description': row[4],
-                'amount': float(row[5]) if row[5] else 0,
-                'type': row[6],
-                'notes': row[7]
-            })
-        return jsonify(transactions)
+        # 串流模式：記憶體用量與資料範圍大小無關
+        if request.args.get('stream') == 'ndjson':
+            statement = text(query).execution_options(yield_per=TRANSACTION_STREAM_BATCH_SIZE)
+            
+            def generate():
+                result = db.session.execute(statement, params)
+                for row in result:
+                    yield json.dumps(transaction_row_to_dict(row), ensure_ascii=False) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        limit = request.args.get('limit')
+        if limit is None and not after:
+            result = db.session.execute(text(query), params)
+            return jsonify([transaction_row_to_dict(row) for row in result])
+        
+        # 分頁模式：多取一筆判斷是否還有下一頁
+        try:
+            limit = int(limit) if limit is not None else TRANSACTION_PAGE_DEFAULT
+        except ValueError:
+            return jsonify({'error': 'limit 必須是整數'}), 400
+        limit = max(1, min(limit, TRANSACTION_PAGE_MAX))
+        
+        query += ' LIMIT :limit'
+        params['limit'] = limit + 1
+        
+        rows = db.session.execute(text(query), params).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        
+        next_cursor = None
+        if has_more:
+            last = rows[-1]
+            next_cursor = encode_transaction_cursor(last[3], last[0])
+        
+        return jsonify({
+            'transactions': [transaction_row_to_dict(row) for row in rows],
+            'next_cursor': next_cursor,
+            'has_more': has_more
+        })
     
     @app.route('/api/transactions', methods=['POST'])
     def create_transaction():
         """
         建立新交易記錄
         功能：透過使用者自行輸入支出項目來記錄消費
-        自動分類：透過關鍵字進行分類
+        自動分類：透過歷史紀錄（商家記憶）與關鍵字進行分類
         """
         data = request.get_json()
         
         # 自動分類功能
         category_id = data.get('category_id')
+        category_source = 'user' if category_id else None
         if not category_id:
-            category_id = auto_categorize(data['description'], data.get('amount'))
+            category_id, category_source = auto_categorize(data['description'], data.get('amount'))
             if not category_id:
                 # 預設分類：其他支出(8) 或 其他收入(12)
-                category_id = 8 if data['type'] == 'expense' else 12
+                category_id = DEFAULT_EXPENSE_CATEGORY_ID if data['type'] == 'expense' else DEFAULT_INCOME_CATEGORY_ID
+                category_source = 'default'
+        transaction_date = data.get('date', datetime.now().strftime('%Y-%m-%d'))
         
         db.session.execute(text('''
-            INSERT INTO transactions (account_id, category_id, date, description, amount, type, notes)
-            VALUES (:account_id, :category_id, :date, :description, :amount, :type, :notes)
+            INSERT INTO transactions (account_id, category_id, date, description, amount, type, notes, category_source)
+            VALUES (:account_id, :category_id, :date, :description, :amount, :type, :notes, :category_source)
         '''), {
             'account_id': data['account_id'],
             'category_id': category_id,
-            'date': data.get('date', datetime.now().strftime('%Y-%m-%d')),
+            'date': transaction_date,
             'description': data['description'],
             'amount': data['amount'],
             'type': data['type'],
-            'notes': data.get('notes', '')
+            'notes': data.get('notes', ''),
+            'category_source': category_source
         })
         db.session.commit()
+        if category_source in LEARNABLE_SOURCES:
+            merchant_memory.learn(data['description'], category_id)
         
         # 更新帳戶餘額
         if data['type'] == 'expense':
@@ -418,251 +570,151 @@ def create_app():
                 WHERE id = :account_id
             '''), {'amount': data['amount'], 'account_id': data['account_id']})
         db.session.commit()
+        response_cache.invalidate('transactions')
+        budget_service.budget_sweeper.request_sweep()
+        ledger_events.publish_changes(db, 'transaction_created', transactions=[(category_id, transaction_date)])
         
         return jsonify({
             'message': '交易記錄建立成功',
             'auto_category_id': category_id
         }), 201
     
+    @app.route('/api/transactions/import', methods=['POST'])
+    def import_transactions():
+        """
+        批次匯入交易（銀行 CSV / OFX 對帳單）
+        表單欄位：file, account_id, format（選填：csv / ofx）
+        stream=ndjson 時逐行回傳匯入進度
+        """
+        from app.services.import_service import (
+            MAX_REPORTED_ERRORS, ImportAccountError, StatementFormatError,
+            check_import_accounts, iter_import_transactions, parse_statement
+        )
+        
+        upload = request.files.get('file')
+        account_id = request.form.get('account_id', type=int)
+        if not upload or not account_id:
+            return jsonify({'error': '請提供 file 與 account_id'}), 400
+        
+        account = db.session.execute(text(
+            'SELECT id FROM accounts WHERE id = :id AND is_active = true'
+        ), {'id': account_id}).fetchone()
+        if not account:
+            return jsonify({'error': '帳戶不存在'}), 404
+        
+        try:
+            content = upload.read().decode('utf-8-sig')
+            rows, errors = parse_statement(content, request.form.get('format'), upload.filename or '')
+            # CSV 的 account_id 欄位會覆寫表單帳戶，寫入前一併確認
+            check_import_accounts(db, rows, account_id)
+        except (UnicodeDecodeError, StatementFormatError, ImportAccountError) as e:
+            return jsonify({'error': str(e)}), 400
+        
+        def finish(summary):
+            summary['skipped'] = len(errors)
+            summary['errors'] = errors[:MAX_REPORTED_ERRORS]
+            return summary
+        
+        if request.args.get('stream') == 'ndjson':
+            def generate():
+                # 回應已開始串流，錯誤改以最後一行 error 事件回報
+                try:
+                    for event in iter_import_transactions(db, rows, account_id, categorize_many):
+                        if event['stage'] == 'done':
+                            learn_imported(rows)
+                            response_cache.invalidate('transactions')
+                            budget_service.budget_sweeper.request_sweep()
+                            ledger_events.publish_changes(db, 'transactions_imported', transactions=[
+                                (row['category_id'], row['date']) for row in rows
+                            ])
+                            event = finish(event)
+                        yield json.dumps(event, ensure_ascii=False) + '\n'
+                except Exception as e:
+                    db.session.rollback()
+                    print(f'匯入交易錯誤: {e}')
+                    yield json.dumps({'stage': 'error', 'error': str(e)}, ensure_ascii=False) + '\n'
+            
+            return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        
+        try:
+            summary = None
+            for event in iter_import_transactions(db, rows, account_id, categorize_many):
+                summary = event
+        except Exception as e:
+            print(f'匯入交易錯誤: {e}')
+            return jsonify({'error': str(e)}), 500
+        
+        learn_imported(rows)
+        response_cache.invalidate('transactions')
+        budget_service.budget_sweeper.request_sweep()
+        ledger_events.publish_changes(db, 'transactions_imported', transactions=[
+            (row['category_id'], row['date']) for row in rows
+        ])
+        
+        return jsonify(finish(summary)), 201
+    
     @app.route('/api/transactions/<int:id>', methods=['DELETE'])
     def delete_transaction(id):
         """刪除交易記錄"""
-        db.session.execute(text('DELETE FROM transactions WHERE id = :id'), {'id': id})
+        deleted = db.session.execute(text(
+            'DELETE FROM transactions WHERE id = :id RETURNING category_id, date, description, category_source'
+        ), {'id': id}).fetchall()
         db.session.commit()
+        # 撤銷這筆交易對商家記憶的貢獻，錯誤的分類不會一直留在記憶中
+        for row in deleted:
+            if row[3] in LEARNABLE_SOURCES:
+                merchant_memory.forget(row[2], row[0])
+        response_cache.invalidate('transactions')
+        budget_service.budget_sweeper.request_sweep()
+        ledger_events.publish_changes(db, 'transaction_deleted', transactions=[(row[0], row[1]) for row in deleted])
         return jsonify({'message': '交易記錄已刪除'})
     
     @app.route('/api/transactions/summary', methods=['GET'])
+    @conditional_get('transactions', 'categories', 'budgets', daily=True)
+    @response_cache.cached('transactions', 'categories', 'budgets')
     def get_transaction_summary():
         """
         取得交易摘要
         功能：即時更新數據，顯示每日、每月的消費情況
         包含：各類別累計、占比、預算剩餘
         """
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        # 取得時間範圍（預設本月）
-        start_date = request.args.get('start_date', 
-            (datetime.now().replace(day=1)).strftime('%Y-%m-%d'))
-        end_date = request.args.get('end_date', today)
-        
-        # === 今日統計 ===
-        today_expense_result = db.session.execute(text('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE type = 'expense' AND date = :today
-        '''), {'today': today})
-        today_expense = float(today_expense_result.scalar())
-        
-        today_income_result = db.session.execute(text('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE type = 'income' AND date = :today
-        '''), {'today': today})
-        today_income = float(today_income_result.scalar())
-        
-        # === 期間統計（本月） ===
-        # 總收入
-        income_result = db.session.execute(text('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE type = 'income' AND date BETWEEN :start AND :end
-        '''), {'start': start_date, 'end': end_date})
-        total_income = float(income_result.scalar())
-        
-        # 總支出
-        expense_result = db.session.execute(text('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE type = 'expense' AND date BETWEEN :start AND :end
-        '''), {'start': start_date, 'end': end_date})
-        total_expense = float(expense_result.scalar())
-        
-        # === 各類別支出統計 + 占比 ===
-        category_result = db.session.execute(text('''
-            SELECT c.id, c.name, c.icon, c.color, COALESCE(SUM(t.amount), 0) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.type = 'expense' AND t.date BETWEEN :start AND :end
-            GROUP BY c.id, c.name, c.icon, c.color
-            ORDER BY total DESC
-        '''), {'start': start_date, 'end': end_date})
-        
-        categories_breakdown = []
-        for row in category_result:
-            amount = float(row[4])
-            percentage = (amount / total_expense * 100) if total_expense > 0 else 0
-            categories_breakdown.append({
-                'category_id': row[0],
-                'category': row[1],
-                'icon': row[2],
-                'color': row[3],
-                'amount': amount,
-                'percentage': round(percentage, 1)
-            })
-        
-        # === 預算使用狀況 ===
-        budget_result = db.session.execute(text('''
-            SELECT b.id, b.name, b.amount, c.name as category_name, c.icon,
-                   COALESCE((
-                       SELECT SUM(t.amount) FROM transactions t 
-                       WHERE t.category_id = b.category_id 
-                       AND t.type = 'expense'
-                       AND t.date >= b.start_date
-                       AND (b.end_date IS NULL OR t.date <= b.end_date)
-                   ), 0) as spent
-            FROM budgets b
-            JOIN categories c ON b.category_id = c.id
-            WHERE b.is_active = true
-        '''))
-        
-        budget_status = []
-        for row in budget_result:
-            budget_amount = float(row[2])
-            spent = float(row[5])
-            remaining = budget_amount - spent
-            usage_percent = (spent / budget_amount * 100) if budget_amount > 0 else 0
-            
-            budget_status.append({
-                'budget_id': row[0],
-                'name': row[1],
-                'category_name': row[3],
-                'icon': row[4],
-                'budget_amount': budget_amount,
-                'spent': spent,
-                'remaining': remaining,
-                'usage_percent': round(usage_percent, 1),
-                'status': 'over' if remaining < 0 else 'warning' if usage_percent > 80 else 'ok'
-            })
-        
-        return jsonify({
-            'today': {
-                'date': today,
-                'income': today_income,
-                'expense': today_expense,
-                'net': today_income - today_expense
-            },
-            'period': {
-                'start': start_date,
-                'end': end_date
-            },
-            'total_income': total_income,
-            'total_expense': total_expense,
-            'net': total_income - total_expense,
-            'savings_rate': round((total_income - total_expense) / total_income * 100, 1) if total_income > 0 else 0,
-            'categories_breakdown': categories_breakdown,
-            'budget_status': budget_status
-        })
+        return jsonify(dashboard_service.get_transaction_summary(
+            db, request.args.get('start_date'), request.args.get('end_date')
+        ))
     
 
     # 預算管理 API (參考 Firefly III Budgets)
     
     @app.route('/api/budgets', methods=['GET'])
+    @conditional_get('budgets', 'transactions', 'categories', daily=True)
     def get_budgets():
         """
-        取得所有預算及使用狀態
-        功能：自動處理過期與達標狀態
+        取得所有預算及使用狀態（唯讀）
+        過期與達標狀態的寫入由 budget_sweeper 背景工作處理
         """
         try:
-            today = datetime.now().date()
-            
-            # 查詢所有 active 預算
-            result = db.session.execute(text('''
-                SELECT b.id, b.category_id, b.name, b.amount, b.period, 
-                       b.start_date, b.end_date, b.is_active, b.status,
-                       c.name as category_name, c.icon as category_icon,
-                       COALESCE((
-                           SELECT SUM(t.amount) 
-                           FROM transactions t 
-                           WHERE t.category_id = b.category_id 
-                           AND t.type = 'expense'
-                           AND t.date >= b.start_date
-                           AND (b.end_date IS NULL OR t.date <= b.end_date)
-                       ), 0) as spent
-                FROM budgets b
-                JOIN categories c ON b.category_id = c.id
-                WHERE b.is_active = true
-                ORDER BY 
-                    CASE WHEN b.end_date IS NULL THEN 1 ELSE 0 END,
-                    b.end_date ASC
-            '''))
-            
-            budgets = []
-            ids_to_delete = []  # 過期未達標，要刪除的
-            ids_to_complete = []  # 達標的
-            
-            for row in result:
-                budget_id = row[0]
-                budget_amount = float(row[3]) if row[3] else 0
-                spent = float(row[11]) if row[11] else 0
-                remaining = budget_amount - spent
-                usage_percent = (spent / budget_amount * 100) if budget_amount > 0 else 0
-                end_date = row[6]
-                
-                # 計算剩餘天數
-                days_remaining = None
-                is_expired = False
-                if end_date:
-                    if isinstance(end_date, str):
-                        end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
-                    days_remaining = (end_date - today).days
-                    is_expired = days_remaining < 0
-                
-                # 判斷狀態
-                is_completed = usage_percent >= 100 or spent >= budget_amount
-                
-                if is_expired and not is_completed:
-                    # 過期未達標 → 加入刪除清單
-                    ids_to_delete.append(budget_id)
-                    continue  # 不加入回傳列表
-                
-                if is_completed:
-                    # 達標 → 標記為 completed
-                    ids_to_complete.append(budget_id)
-                    status = 'completed'
-                elif is_expired:
-                    status = 'expired'
-                elif usage_percent > 80:
-                    status = 'warning'
-                else:
-                    status = 'ok'
-                
-                budgets.append({
-                    'id': budget_id,
-                    'category_id': row[1],
-                    'name': row[2],
-                    'amount': budget_amount,
-                    'period': row[4],
-                    'start_date': str(row[5]) if row[5] else None,
-                    'end_date': str(row[6]) if row[6] else None,
-                    'category_name': row[9],
-                    'category_icon': row[10],
-                    'spent': spent,
-                    'remaining': remaining,
-                    'usage_percent': round(usage_percent, 2),
-                    'days_remaining': days_remaining,
-                    'status': status
-                })
-            
-            # 刪除過期未達標的預算
-            if ids_to_delete:
-                db.session.execute(text(
-                    'DELETE FROM budgets WHERE id IN :ids'
-                ), {'ids': tuple(ids_to_delete)})
-                db.session.commit()
-            
-            # 更新達標預算的狀態
-            if ids_to_complete:
-                db.session.execute(text(
-                    'UPDATE budgets SET status = :status WHERE id IN :ids'
-                ), {'status': 'completed', 'ids': tuple(ids_to_complete)})
-                db.session.commit()
-            
+            budgets = dashboard_service.build_budgets(
+                budget_service.load_budgets(db), datetime.now().date()
+            )
             return jsonify(budgets)
         except Exception as e:
             print(f'取得預算錯誤: {e}')
             return jsonify({'error': str(e)}), 500
+    
     @app.route('/api/budgets/<int:id>', methods=['DELETE'])
     def delete_budget(id):
         """刪除預算"""
         try:
-            db.session.execute(text('DELETE FROM budgets WHERE id = :id'), {'id': id})
+            deleted = db.session.execute(text(
+                'DELETE FROM budgets WHERE id = :id RETURNING category_id'
+            ), {'id': id}).fetchall()
             db.session.commit()
+            response_cache.invalidate('budgets')
+            ledger_events.publish_changes(
+                db, 'budget_deleted',
+                budget_categories=[row[0] for row in deleted],
+                deleted_budgets=[id] if deleted else []
+            )
             return jsonify({'message': '預算已刪除'})
         except Exception as e:
             print(f'刪除預算錯誤: {e}')
@@ -687,6 +739,9 @@ def create_app():
                 'end_date': data.get('end_date')
             })
             db.session.commit()
+            response_cache.invalidate('budgets')
+            budget_service.budget_sweeper.request_sweep()
+            ledger_events.publish_changes(db, 'budget_created', budget_categories=[data['category_id']])
             
             return jsonify({'message': '預算建立成功'}), 201
         except Exception as e:
@@ -696,105 +751,15 @@ def create_app():
     # 財務目標 API - 目標追蹤與儲蓄管理(參考 Firefly III Piggy Banks)
     
     @app.route('/api/goals', methods=['GET'])
+    @conditional_get('financial_goals', daily=True)
     def get_goals():
         """
         取得所有財務目標
         功能：管理使用者的短期與中期財務目標
         包含：落後/如期/超前判斷
         """
-        status_filter = request.args.get('status')
-        
-        if status_filter:
-            result = db.session.execute(text(
-                'SELECT * FROM financial_goals WHERE status = :status ORDER BY priority DESC'
-            ), {'status': status_filter})
-        else:
-            result = db.session.execute(text(
-                'SELECT * FROM financial_goals ORDER BY priority DESC'
-            ))
-        
-        goals = []
-        today = datetime.now().date()
-        
-        for row in result:
-            target = float(row[2]) if row[2] else 0
-            current = float(row[3]) if row[3] else 0
-            progress = (current / target * 100) if target > 0 else 0
-            
-            # 計算剩餘天數與預期進度
-            days_remaining = None
-            expected_progress = 0
-            progress_status = 'on_track'  # 預設如期
-            
-            if row[4] and row[6] == 'in_progress':  # deadline exists and in progress
-                deadline = row[4]
-                if isinstance(deadline, str):
-                    deadline = datetime.strptime(deadline, '%Y-%m-%d').date()
-                
-                # 取得建立日期（假設是 row[8] created_at）
-                created_at = row[8] if len(row) > 8 and row[8] else None
-                if created_at:
-                    if isinstance(created_at, str):
-                        created_at = datetime.strptime(created_at[:10], '%Y-%m-%d').date()
-                    else:
-                        created_at = created_at.date() if hasattr(created_at, 'date') else created_at
-                else:
-                    # 如果沒有建立日期，假設從目標開始到現在的一半時間
-                    created_at = today - timedelta(days=30)
-                
-                days_remaining = (deadline - today).days
-                total_days = (deadline - created_at).days
-                days_passed = (today - created_at).days
-                
-                # 計算預期進度（根據時間比例）
-                if total_days > 0:
-                    expected_progress = (days_passed / total_days) * 100
-                
-                # 判斷進度狀態
-                if progress > 0 and expected_progress > 0:
-                    ratio = progress / expected_progress
-                    if ratio < 0.8:
-                        progress_status = 'behind'  # 落後
-                    elif ratio > 1.2:
-                        progress_status = 'ahead'   # 超前
-                    else:
-                        progress_status = 'on_track'  # 如期
-                elif days_remaining < 0:
-                    progress_status = 'overdue'  # 已過期
-            
-            # 計算每日/每週/每月需存金額
-            remaining_amount = target - current
-            daily_needed = 0
-            weekly_needed = 0
-            monthly_needed = 0
-            
-            if days_remaining and days_remaining > 0 and remaining_amount > 0:
-                daily_needed = remaining_amount / days_remaining
-                weekly_needed = daily_needed * 7
-                monthly_needed = daily_needed * 30
-            
-            goals.append({
-                'id': row[0],
-                'name': row[1],
-                'target_amount': target,
-                'current_amount': current,
-                'deadline': str(row[4]) if row[4] else None,
-                'priority': row[5],
-                'status': row[6],
-                'description': row[7],
-                'progress': round(progress, 2),
-                'expected_progress': round(expected_progress, 2),
-                'remaining_amount': remaining_amount,
-                'days_remaining': days_remaining,
-                'progress_status': progress_status,
-                'recommendations': {
-                    'daily_saving_needed': round(daily_needed, 0),
-                    'weekly_saving_needed': round(weekly_needed, 0),
-                    'monthly_saving_needed': round(monthly_needed, 0)
-                }
-            })
-        
-        return jsonify(goals)
+        goals = dashboard_service.load_goals(db, request.args.get('status'))
+        return jsonify(dashboard_service.build_goals(goals, datetime.now().date()))
     
     @app.route('/api/goals', methods=['POST'])
     def create_goal():
@@ -804,9 +769,10 @@ def create_app():
         """
         data = request.get_json()
         
-        db.session.execute(text('''
+        goal_id = db.session.execute(text('''
             INSERT INTO financial_goals (name, target_amount, current_amount, deadline, priority, description)
             VALUES (:name, :target_amount, :current_amount, :deadline, :priority, :description)
+            RETURNING id
         '''), {
             'name': data['name'],
             'target_amount': data['target_amount'],
@@ -814,8 +780,10 @@ def create_app():
             'deadline': data.get('deadline'),
             'priority': data.get('priority', 3),
             'description': data.get('description', '')
-        })
+        }).scalar()
         db.session.commit()
+        response_cache.invalidate('financial_goals')
+        ledger_events.publish_changes(db, 'goal_created', goals=[goal_id])
         
         return jsonify({'message': '財務目標建立成功'}), 201
     
@@ -855,6 +823,8 @@ def create_app():
             'description': data.get('description', '')
         })
         db.session.commit()
+        response_cache.invalidate('financial_goals')
+        ledger_events.publish_changes(db, 'goal_updated', goals=[id])
         
         return jsonify({'message': '財務目標更新成功', 'status': status})
     
@@ -888,10 +858,13 @@ def create_app():
             '''), {'id': id})
         
         db.session.commit()
+        response_cache.invalidate('financial_goals')
+        ledger_events.publish_changes(db, 'goal_deposit', goals=[id])
         
         return jsonify({'message': f'已新增 ${amount} 到目標'})
     
     @app.route('/api/goals/<int:id>/progress', methods=['GET'])
+    @conditional_get('financial_goals', daily=True)
     def get_goal_progress(id):
         """
         取得目標進度報告
@@ -946,53 +919,32 @@ def create_app():
     # 報表與分析 API
     
     @app.route('/api/reports/monthly', methods=['GET'])
+    @conditional_get('transactions', 'categories', daily=True)
     def get_monthly_report():
         """
         取得月度報表
         功能：記錄每月的消費情況
         """
-        year = request.args.get('year', datetime.now().year)
-        month = request.args.get('month', datetime.now().month)
+        year = request.args.get('year', datetime.now().year, type=int)
+        month = request.args.get('month', datetime.now().month, type=int)
         
         start_date = f'{year}-{month:02d}-01'
         if month == 12:
-            end_date = f'{int(year)+1}-01-01'
+            end_date = f'{year+1}-01-01'
         else:
-            end_date = f'{year}-{int(month)+1:02d}-01'
+            end_date = f'{year}-{month+1:02d}-01'
         
         # 每日支出
-        daily_result = db.session.execute(text('''
-            SELECT date, SUM(amount) as total
-            FROM transactions
-            WHERE type = 'expense' AND date >= :start AND date < :end
-            GROUP BY date
-            ORDER BY date
-        '''), {'start': start_date, 'end': end_date})
-        
-        daily_expenses = []
-        for row in daily_result:
-            daily_expenses.append({
-                'date': str(row[0]),
-                'amount': float(row[1])
-            })
+        daily_expenses = daily_totals(db, start_date, end_date, end_exclusive=True)
         
         # 類別統計
-        category_result = db.session.execute(text('''
-            SELECT c.name, c.icon, c.color, SUM(t.amount) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.type = 'expense' AND t.date >= :start AND t.date < :end
-            GROUP BY c.id, c.name, c.icon, c.color
-            ORDER BY total DESC
-        '''), {'start': start_date, 'end': end_date})
-        
         categories = []
-        for row in category_result:
+        for item in category_totals(db, start_date, end_date, end_exclusive=True):
             categories.append({
-                'name': row[0],
-                'icon': row[1],
-                'color': row[2],
-                'amount': float(row[3])
+                'name': item['name'],
+                'icon': item['icon'],
+                'color': item['color'],
+                'amount': item['amount']
             })
         
         return jsonify({
@@ -1006,260 +958,156 @@ def create_app():
     # 智慧建議 API
    
     @app.route('/api/suggestions', methods=['GET'])
+    @conditional_get('transactions', 'categories', 'budgets', 'financial_goals', daily=True)
+    @response_cache.cached('transactions', 'categories', 'budgets', 'financial_goals')
     def get_suggestions():
         """
         取得財務建議
         功能：根據使用者可支配金額與消費習慣生成可行策略，
               並提供動態調整建議（落後/如期/超前）
         """
-        suggestions = []
-        adjustment_plans = []
-        
-        # 1. 分析本月支出
-        today = datetime.now()
-        start_of_month = today.replace(day=1).strftime('%Y-%m-%d')
-        
-        # 本月總支出
-        expense_result = db.session.execute(text('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE type = 'expense' AND date >= :start
-        '''), {'start': start_of_month})
-        monthly_expense = float(expense_result.scalar())
-        
-        # 本月總收入
-        income_result = db.session.execute(text('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE type = 'income' AND date >= :start
-        '''), {'start': start_of_month})
-        monthly_income = float(income_result.scalar())
-        
-        # 計算可支配金額
-        disposable = monthly_income - monthly_expense
-        days_passed = today.day
-        days_in_month = 30
-        days_remaining = days_in_month - days_passed
-        daily_available = disposable / days_remaining if days_remaining > 0 else 0
-        weekly_available = daily_available * 7
-        
-        # 2. 分析各類別支出（找出最高支出類別）
-        category_result = db.session.execute(text('''
-            SELECT c.name, COALESCE(SUM(t.amount), 0) as total
-            FROM transactions t
-            JOIN categories c ON t.category_id = c.id
-            WHERE t.type = 'expense' AND t.date >= :start
-            GROUP BY c.id, c.name
-            ORDER BY total DESC
-            LIMIT 3
-        '''), {'start': start_of_month})
-        
-        top_categories = []
-        for row in category_result:
-            top_categories.append({
-                'name': row[0],
-                'amount': float(row[1])
-            })
-        
-        # 3. 分析預算狀態
-        budget_result = db.session.execute(text('''
-            SELECT b.name, b.amount, c.name as category_name,
-                   COALESCE((
-                       SELECT SUM(t.amount) FROM transactions t 
-                       WHERE t.category_id = b.category_id 
-                       AND t.type = 'expense'
-                       AND t.date >= b.start_date
-                   ), 0) as spent
-            FROM budgets b
-            JOIN categories c ON b.category_id = c.id
-            WHERE b.is_active = true
-        '''))
-        
-        for row in budget_result:
-            budget_amount = float(row[1])
-            spent = float(row[3])
-            usage = (spent / budget_amount * 100) if budget_amount > 0 else 0
-            remaining_budget = budget_amount - spent
-            
-            if usage > 100:
-                over_amount = spent - budget_amount
-                suggestions.append({
-                    'type': 'warning',
-                    'category': '預算超支',
-                    'message': f'「{row[2]}」預算已超支 ${over_amount:.0f}，建議本月減少此類支出',
-                    'action': f'建議每週減少 ${over_amount/4:.0f} 的{row[2]}支出'
-                })
-            elif usage > 80:
-                suggestions.append({
-                    'type': 'caution',
-                    'category': '預算警告',
-                    'message': f'「{row[2]}」預算已使用 {usage:.0f}%，剩餘 ${remaining_budget:.0f}',
-                    'action': f'建議每日{row[2]}支出控制在 ${remaining_budget/days_remaining:.0f} 以內'
-                })
-        
-        # 4. 分析儲蓄目標（含落後/如期/超前判斷）
-        goal_result = db.session.execute(text('''
-            SELECT id, name, target_amount, current_amount, deadline, created_at
-            FROM financial_goals
-            WHERE status = 'in_progress'
-        '''))
-        
-        for row in goal_result:
-            goal_id = row[0]
-            goal_name = row[1]
-            target = float(row[2])
-            current = float(row[3])
-            remaining = target - current
-            progress = (current / target * 100) if target > 0 else 0
-            
-            if row[4]:  # has deadline
-                deadline = row[4]
-                if isinstance(deadline, str):
-                    deadline = datetime.strptime(deadline, '%Y-%m-%d').date()
-                
-                created_at = row[5]
-                if created_at:
-                    if isinstance(created_at, str):
-                        created_at = datetime.strptime(created_at[:10], '%Y-%m-%d').date()
-                    elif hasattr(created_at, 'date'):
-                        created_at = created_at.date()
-                else:
-                    created_at = today.date() - timedelta(days=30)
-                
-                days_to_deadline = (deadline - today.date()).days
-                total_days = (deadline - created_at).days
-                days_passed_goal = (today.date() - created_at).days
-                
-                # 計算預期進度
-                expected_progress = (days_passed_goal / total_days * 100) if total_days > 0 else 0
-                
-                # 計算每日/每週/每月需存金額
-                daily_needed = remaining / days_to_deadline if days_to_deadline > 0 else 0
-                weekly_needed = daily_needed * 7
-                monthly_needed = daily_needed * 30
-                
-                # 判斷進度狀態並生成建議
-                if progress > 0 and expected_progress > 0:
-                    ratio = progress / expected_progress
-                    
-                    if ratio < 0.8:
-                        # === 落後 ===
-                        shortfall = (expected_progress - progress) / 100 * target
-                        extra_weekly = shortfall / (days_to_deadline / 7) if days_to_deadline > 7 else shortfall
-                        
-                        # 建議延長期限
-                        if daily_needed > daily_available and daily_available > 0:
-                            new_days_needed = int(remaining / daily_available)
-                            new_deadline = today.date() + timedelta(days=new_days_needed)
-                            new_deadline_str = new_deadline.strftime('%Y-%m-%d')
-                        else:
-                            new_deadline_str = None
-                        
-                        suggestions.append({
-                            'type': 'warning',
-                            'category': '目標進度落後',
-                            'message': f'「{goal_name}」進度落後！目前 {progress:.0f}%，預期應達 {expected_progress:.0f}%',
-                            'action': f'建議每週增加儲蓄 ${extra_weekly:.0f}'
-                        })
-                        
-                        adjustment_plans.append({
-                            'goal_id': goal_id,
-                            'goal_name': goal_name,
-                            'status': 'behind',
-                            'current_progress': round(progress, 1),
-                            'expected_progress': round(expected_progress, 1),
-                            'adjusted_weekly_saving': round(weekly_needed + extra_weekly, 0),
-                            'adjusted_monthly_saving': round((weekly_needed + extra_weekly) * 4, 0),
-                            'reduce_category': top_categories[0]['name'] if top_categories else None,
-                            'reduce_amount': round(extra_weekly, 0),
-                            'new_deadline': new_deadline_str,
-                            'message': f'需加速儲蓄或延長期限至 {new_deadline_str}' if new_deadline_str else '需加速儲蓄'
-                        })
-                        
-                    elif ratio > 1.2:
-                        # === 超前 ===
-                        surplus = (progress - expected_progress) / 100 * target
-                        days_ahead = int((progress - expected_progress) / 100 * total_days)
-                        early_finish = deadline - timedelta(days=days_ahead)
-                        
-                        suggestions.append({
-                            'type': 'success',
-                            'category': '目標進度超前',
-                            'message': f'🎉「{goal_name}」進度超前！目前 {progress:.0f}%，預期 {expected_progress:.0f}%',
-                            'action': f'可提前於 {early_finish.strftime("%Y-%m-%d")} 完成，或將多餘 ${surplus:.0f} 分配到其他目標'
-                        })
-                        
-                        adjustment_plans.append({
-                            'goal_id': goal_id,
-                            'goal_name': goal_name,
-                            'status': 'ahead',
-                            'current_progress': round(progress, 1),
-                            'expected_progress': round(expected_progress, 1),
-                            'early_finish_date': early_finish.strftime('%Y-%m-%d'),
-                            'surplus_amount': round(surplus, 0),
-                            'options': [
-                                f'提前完成：預計 {early_finish.strftime("%Y-%m-%d")}',
-                                f'分配多餘儲蓄 ${surplus:.0f} 到其他目標',
-                                f'本月可增加娛樂預算 ${surplus/4:.0f} 作為獎勵'
-                            ],
-                            'message': '表現優異！可選擇提前完成或獎勵自己'
-                        })
-                        
-                    else:
-                        # === 如期 ===
-                        suggestions.append({
-                            'type': 'info',
-                            'category': '目標進度正常',
-                            'message': f'「{goal_name}」進度正常，目前 {progress:.0f}%',
-                            'action': f'繼續保持每週存 ${weekly_needed:.0f} 即可達成'
-                        })
-                        
-                        adjustment_plans.append({
-                            'goal_id': goal_id,
-                            'goal_name': goal_name,
-                            'status': 'on_track',
-                            'current_progress': round(progress, 1),
-                            'expected_progress': round(expected_progress, 1),
-                            'weekly_saving': round(weekly_needed, 0),
-                            'monthly_saving': round(monthly_needed, 0),
-                            'message': '保持現有儲蓄策略即可'
-                        })
-        
-        # 5. 儲蓄率建議
-        if monthly_income > 0:
-            savings_rate = (disposable / monthly_income * 100) if disposable > 0 else 0
-            
-            if savings_rate < 10:
-                suggestions.append({
-                    'type': 'warning',
-                    'category': '儲蓄率偏低',
-                    'message': f'本月儲蓄率僅 {savings_rate:.1f}%',
-                    'action': '建議目標至少 20%，可從減少最高支出類別開始'
-                })
-            elif savings_rate >= 30:
-                suggestions.append({
-                    'type': 'success',
-                    'category': '儲蓄表現優異',
-                    'message': f'本月儲蓄率達 {savings_rate:.1f}%，表現優異！',
-                    'action': '可考慮增加投資或提高儲蓄目標'
-                })
-        
-        return jsonify({
-            'summary': {
-                'monthly_income': monthly_income,
-                'monthly_expense': monthly_expense,
-                'disposable': disposable,
-                'daily_available': round(daily_available, 0),
-                'weekly_available': round(weekly_available, 0),
-                'days_remaining': days_remaining,
-                'top_expense_categories': top_categories
-            },
-            'suggestions': suggestions,
-            'adjustment_plans': adjustment_plans
+        return jsonify(dashboard_service.get_suggestions(db))
+    
+    # 財務總覽 API：一次回傳摘要、預算、目標與建議
+    
+    @app.route('/api/dashboard', methods=['GET'])
+    @conditional_get('transactions', 'categories', 'budgets', 'financial_goals', daily=True)
+    @response_cache.cached('transactions', 'categories', 'budgets', 'financial_goals')
+    def get_dashboard():
+        """
+        取得財務總覽
+        功能：共用同一份資料計算交易摘要、預算、目標與建議，一次請求取得整個頁面
+        """
+        return jsonify(dashboard_service.get_dashboard(db))
+    
+    # 快取統計
+    @app.route('/api/cache/stats', methods=['GET'])
+    def get_cache_stats():
+        """伺服器端回應快取的命中/未命中統計"""
+        return jsonify(response_cache.stats())
+    
+    # 帳本變動推播
+    @app.route('/api/stream/ledger', methods=['GET'])
+    def stream_ledger():
+        """
+        帳本變動推播（Server-Sent Events）
+        每次交易、預算、目標寫入後送出 ledger 事件：受影響分類的當月金額、預算使用率與目標進度；
+        重連時依 Last-Event-ID 補送漏掉的事件，無法補齊（含伺服器重新啟動）時送出 resync 事件要求重新載入
+        """
+        last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        
+        def sse(event, data, event_id=None):
+            prefix = f'id: {event_id}\n' if event_id is not None else ''
+            return f"{prefix}event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+        
+        def generate():
+            subscription, missed = ledger_events.subscribe(last_event_id)
+            try:
+                yield 'retry: 5000\n\n'
+                if missed is None:
+                    yield sse('resync', {'reason': 'missed_events'}, ledger_events.stats()['last_event_id'])
+                for event in missed or []:
+                    yield sse('ledger', event, event['id'])
+                while True:
+                    event = subscription.get(timeout=15)
+                    if subscription.overflowed:
+                        # 連線太慢、事件累積過多：清空佇列改為要求重新載入
+                        subscription.overflowed = False
+                        while subscription.get(timeout=0) is not None:
+                            pass
+                        yield sse('resync', {'reason': 'overflow'}, ledger_events.stats()['last_event_id'])
+                        continue
+                    if event is None:
+                        yield ': keep-alive\n\n'
+                        continue
+                    yield sse('ledger', event, event['id'])
+            finally:
+                ledger_events.unsubscribe(subscription)
+        
+        return Response(generate(), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
         })
     
     # 健康檢查
     @app.route('/health')
     def health():
         return jsonify({'status': 'ok', 'database': 'connected'})
+    # 命令列：批次匯入交易
+    @app.cli.command('import-transactions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--account-id', type=int, required=True, help='匯入的帳戶 ID')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ofx']), default=None, help='檔案格式')
+    @click.option('--batch-size', type=int, default=None, help='每批處理筆數')
+    def import_transactions_command(path, account_id, fmt, batch_size):
+        """匯入銀行 CSV / OFX 對帳單"""
+        from app.services.import_service import (
+            IMPORT_BATCH_SIZE, ImportAccountError, check_import_accounts, iter_import_transactions, parse_statement
+        )
+        
+        with open(path, encoding='utf-8-sig') as f:
+            rows, errors = parse_statement(f.read(), fmt, path)
+        
+        try:
+            check_import_accounts(db, rows, account_id)
+        except ImportAccountError as e:
+            raise click.ClickException(str(e))
+        
+        for error in errors:
+            click.echo(f"略過第 {error['line']} 筆：{error['error']}", err=True)
+        
+        for event in iter_import_transactions(db, rows, account_id, categorize_many,
+                                              batch_size or IMPORT_BATCH_SIZE):
+            if event['stage'] == 'staged':
+                click.echo(f"已處理 {event['processed']}/{event['total']} 筆")
+            elif event['stage'] == 'done':
+                learn_imported(rows)
+                click.echo(f"匯入完成：{event['imported']} 筆，略過 {len(errors)} 筆")
+    
+    # 命令列：執行一次預算生命週期處理（可搭配 cron）
+    @app.cli.command('sweep-budgets')
+    def sweep_budgets_command():
+        """刪除過期未達標的預算、標記已達標的預算"""
+        result = budget_service.sweep_budget_lifecycle(db)
+        click.echo(f"刪除 {len(result['deleted'])} 筆，標記完成 {len(result['completed'])} 筆")
+    
+    # 命令列：重建每日分類彙總表
+    @app.cli.command('rebuild-daily-totals')
+    def rebuild_daily_totals_command():
+        """由 transactions 重新計算 daily_category_totals"""
+        from app.services.schema import rebuild_daily_category_totals
+        
+        rebuild_daily_category_totals(db)
+        click.echo('每日分類彙總表已重建')
+    
+    # 命令列：更新股票代號表快照（連網下載，於請求以外的時間執行）
+    @app.cli.command('refresh-stock-codes')
+    def refresh_stock_codes_command():
+        """下載最新股票代號表並寫入本機快照"""
+        from app.services.stock_registry import stock_registry
+        
+        result = stock_registry.refresh()
+        click.echo(f"股票代號表已更新：版本 {result['version']}，共 {result['count']} 筆（{result['path']}）")
+    
+    # 命令列：回補歷史日線並重建欄式快取（可搭配 cron 於收盤後執行）
+    @app.cli.command('backfill-prices')
+    @click.option('--symbol', 'symbols', multiple=True, help='股票代號（預設為所有持倉與關注清單）')
+    @click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='起始日期')
+    def backfill_prices_command(symbols, start):
+        """回補歷史日線"""
+        from app.services.price_history import price_history
+        from app.services.quote_poller import tracked_symbols
+        
+        symbols = symbols or tracked_symbols(db)
+        
+        for symbol in symbols:
+            try:
+                count = price_history.backfill(db, symbol, start.date() if start else None)
+                click.echo(f'{symbol}：新增 {count} 筆')
+            except Exception as e:
+                db.session.rollback()
+                click.echo(f'{symbol}：回補失敗 {e}', err=True)
+    
     # 載入投資組合路由
     from app.routes.portfolio_routes import portfolio_bp, init_portfolio_routes
     init_portfolio_routes(db)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 與 run.py 相同，讓測試可以 import app 套件
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
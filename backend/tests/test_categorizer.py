@@ -0,0 +1,67 @@
+"""自動分類：關鍵字最長命中與商家記憶的學習規則"""
+from app.services.categorizer import LEARNABLE_SOURCES, KeywordMatcher, MerchantMemory
+
+
+def test_keyword_matcher_prefers_longest_match():
+    matcher = KeywordMatcher({'書': 1, '書籍': 2, 'uber': 3, 'ubereats': 4, 'eat': 5})
+
+    assert matcher.match('博客來書籍') == 2
+    assert matcher.match('UberEats 晚餐') == 4
+    assert matcher.match('uber 計程車') == 3
+    assert matcher.match('便利商店') is None
+    # 長度相同時取較早出現者
+    assert KeywordMatcher({'ab': 1, 'cd': 2}).match('cd ab') == 2
+
+
+def test_merchant_memory_learn_and_forget():
+    memory = MerchantMemory(ignore_categories=[8])
+    memory.learn('全家 123 店', 3)
+    memory.learn('全家 456 店', 3)
+    memory.learn('全家 789 店', 5)
+    memory.learn('全家 1 店', 8)
+
+    assert memory.lookup('全家 000 店') == 3
+
+    memory.forget('全家 2 店', 3, count=2)
+    assert memory.lookup('全家 店') == 5
+    memory.forget('全家 店', 5)
+    assert memory.lookup('全家 店') is None and len(memory) == 0
+
+
+def test_merchant_memory_evicts_least_recent():
+    memory = MerchantMemory(capacity=2)
+    memory.learn('a', 1)
+    memory.learn('b', 1)
+    memory.lookup('a')
+    memory.learn('c', 1)
+
+    assert memory.lookup('b') is None and memory.lookup('a') == 1
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class _Db:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+        self.session = self
+
+    def execute(self, statement, params=None):
+        self.params = params
+        return _Result(self.rows)
+
+
+def test_warm_loads_only_learnable_sources():
+    db = _Db([('星巴克 ', 4, 3, None), ('  麥當勞', 6, 1, None)])
+    memory = MerchantMemory()
+
+    assert memory.warm(db) == 2
+    assert db.params['sources'] == LEARNABLE_SOURCES
+    assert 'amount' not in LEARNABLE_SOURCES and 'memory' not in LEARNABLE_SOURCES
+    assert memory.lookup('星巴克 12') == 4 and memory.lookup('麥當勞') == 6
@@ -0,0 +1,42 @@
+"""帳本事件：Last-Event-ID 重連補送與重新同步"""
+from app.services.ledger_events import LedgerEventBus
+
+
+def _bus(events: int = 3, history: int = 200) -> LedgerEventBus:
+    bus = LedgerEventBus(history=history, epoch='e1')
+    for index in range(events):
+        bus.publish({'type': 'ledger', 'index': index})
+    return bus
+
+
+def test_resume_sends_missed_events():
+    bus = _bus()
+    _, missed = bus.subscribe('e1-1')
+
+    assert [event['id'] for event in missed] == ['e1-2', 'e1-3']
+    assert bus.subscribe('e1-3')[1] == []
+    assert bus.subscribe(None)[1] == []
+
+
+def test_resync_when_events_cannot_be_replayed():
+    bus = _bus()
+
+    # 其他 epoch（重新啟動或其他行程）、格式不符、比伺服器新的編號
+    assert bus.subscribe('e0-2')[1] is None
+    assert bus.subscribe('2')[1] is None
+    assert bus.subscribe('e1-9')[1] is None
+
+
+def test_resync_when_history_was_dropped():
+    bus = _bus(events=5, history=2)
+
+    assert bus.subscribe('e1-1')[1] is None
+    assert [event['sequence'] for event in bus.subscribe('e1-3')[1]] == [4, 5]
+
+
+def test_skipped_events_force_resync():
+    bus = _bus()
+    bus._skip()
+
+    assert bus.subscribe('e1-3')[1] is None
+    assert bus.subscribe(bus.last_event_id)[1] == []
@@ -0,0 +1,62 @@
+"""lot_service 的批次扣除"""
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from app.services.lot_service import record_sell
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class _Session:
+    """依 SQL 內容回傳固定資料，並記錄批次更新"""
+
+    def __init__(self, holding, lots):
+        self.holding = holding
+        self.lots = lots
+        self.lot_updates = []
+
+    def execute(self, statement, params=None):
+        sql = str(statement)
+        if 'FROM holdings' in sql:
+            return _Result([self.holding])
+        if 'FROM holding_lots' in sql:
+            return _Result(self.lots)
+        if 'UPDATE holding_lots' in sql:
+            self.lot_updates = params
+        return _Result([])
+
+
+class _Db:
+    def __init__(self, session):
+        self.session = session
+
+
+def test_average_sell_keeps_lot_total_equal_to_holding():
+    lots = [(1, 1, 10.0), (2, 1, 11.0), (3, 1, 12.0)]
+    db = _Db(_Session((3, 11.0, 'average'), lots))
+
+    result = record_sell(db, 1, 1, 20)
+
+    remaining = [update['remaining'] for update in db.session.lot_updates]
+    assert sum(remaining) == pytest.approx(result['remaining_quantity'], abs=1e-9)
+    assert all(value >= 0 for value in remaining)
+
+
+def test_fifo_sell_uses_oldest_lots_first():
+    lots = [(1, 10, 10.0), (2, 10, 20.0)]
+    db = _Db(_Session((20, 15.0, 'fifo'), lots))
+
+    result = record_sell(db, 1, 15, 30)
+
+    assert [update['remaining'] for update in db.session.lot_updates] == [0, 5]
+    assert result['cost_removed'] == pytest.approx(200.0)
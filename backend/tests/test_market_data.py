@@ -0,0 +1,47 @@
+"""批次報價的逾時：慢的批次只影響自己"""
+import asyncio
+import time
+
+import pytest
+
+from app.services import stock_service as stock_module
+from app.services.market_data import AsyncMarketDataClient, MarketDataClient, stock_registry
+
+
+class _SlowClient(AsyncMarketDataClient):
+    """不連網；'SLOW' 批次永遠不回應，其他批次立即回傳"""
+
+    async def fetch(self, symbols):
+        if 'SLOW' in symbols:
+            await asyncio.sleep(60)
+        return {symbol: {'success': True, 'info': {'name': symbol}, 'realtime': {'latest_trade_price': 10}}
+                for symbol in symbols}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # 不讀取代號表快照
+    monkeypatch.setattr(stock_registry, 'load', lambda: {})
+    client = MarketDataClient(_SlowClient(pool_size=2))
+    yield client
+    client.close()
+
+
+def test_get_many_times_out_each_chunk_separately(client):
+    started = time.monotonic()
+    results = client.get_many([['2330'], ['SLOW'], ['0050']], chunk_timeout=0.2)
+
+    assert time.monotonic() - started < 2
+    assert isinstance(results[1], TimeoutError)
+    assert '2330' in results[0] and '0050' in results[2]
+
+
+def test_fetch_wave_returns_partial_results(client, monkeypatch):
+    monkeypatch.setattr(stock_module, 'market_data', client)
+    service = stock_module.StockService()
+    service.chunk_timeout = 0.2
+
+    results = service._fetch_wave([['2330', '2317'], ['SLOW']])
+
+    assert results[0]['2330']['success'] and results[0]['2317']['price'] == 10
+    assert isinstance(results[1], TimeoutError)
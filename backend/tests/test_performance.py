@@ -0,0 +1,32 @@
+"""PerformanceCalculator 的 TWR / XIRR 計算"""
+import numpy as np
+import pytest
+
+from app.services.stock_service import PerformanceCalculator
+
+
+def test_twr_without_flows_after_start():
+    assert PerformanceCalculator.calculate_twr([100, 110, 121], [100, 0, 0]) == pytest.approx(21.0)
+
+
+def test_twr_withdrawal_counts_at_end_of_period():
+    # 期初 100，第二期取回 99 後剩 0：實際虧損 1%
+    assert PerformanceCalculator.calculate_twr([100, 0], [100, -99]) == pytest.approx(-1.0)
+    # 取回 110 後剩 0：實際獲利 10%
+    assert PerformanceCalculator.calculate_twr([100, 0], [100, -110]) == pytest.approx(10.0)
+
+
+def test_twr_partial_sell_is_not_a_loss():
+    # 市值 100 → 120（+20%），賣出 60 後剩 60，之後持平
+    assert PerformanceCalculator.calculate_twr([100, 60, 60], [100, -60, 0]) == pytest.approx(20.0)
+
+
+def test_twr_batch_rows_are_independent():
+    values = np.array([[100, 0], [100, 110]])
+    flows = np.array([[100, -110], [100, 0]])
+    assert PerformanceCalculator.twr_batch(values, flows) == pytest.approx([0.1, 0.1])
+
+
+def test_xirr_one_year():
+    result = PerformanceCalculator.xirr_batch(np.array([[-100.0, 110.0]]), np.array([0.0, 1.0]))
+    assert result[0] == pytest.approx(0.1, abs=1e-6)
@@ -0,0 +1,30 @@
+"""portfolio_history.build_matrices 的成本計算"""
+from datetime import date
+
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from app.services.portfolio_history import build_matrices
+
+
+def _tx(type_, quantity, price, day, cost_method):
+    return {'holding_id': 1, 'account_id': 1, 'symbol': 'CASH', 'asset_type': 'cash',
+            'type': type_, 'quantity': quantity, 'price': price, 'fee': 0, 'tax': 0,
+            'date': day, 'cost_method': cost_method}
+
+
+@pytest.mark.parametrize('cost_method, cost_left, realized', [
+    ('fifo', 200.0, 250.0),
+    ('average', 150.0, 200.0),
+])
+def test_sell_uses_holding_cost_method(cost_method, cost_left, realized):
+    transactions = [
+        _tx('buy', 10, 10, date(2024, 1, 1), cost_method),
+        _tx('buy', 10, 20, date(2024, 1, 2), cost_method),
+        _tx('sell', 10, 35, date(2024, 1, 3), cost_method),
+    ]
+    matrices = build_matrices(transactions, date(2024, 1, 1), date(2024, 1, 3))
+
+    assert matrices['cost_basis'][0, -1] == pytest.approx(cost_left)
+    assert matrices['realized'][0, -1] == pytest.approx(realized)
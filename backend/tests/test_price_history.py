@@ -0,0 +1,82 @@
+"""歷史股價：回補背景工作與欄式快取版本切換"""
+import contextlib
+import os
+from datetime import date
+
+import pytest
+
+from app.services.price_history import HistoryBackfillWorker, PriceHistoryService
+
+
+class _Result:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class _Db:
+    """只回傳固定日線的假資料庫"""
+
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.session = self
+
+    def execute(self, statement, params=None):
+        return _Result(self.rows)
+
+    def rollback(self):
+        pass
+
+
+class _App:
+    def app_context(self):
+        return contextlib.nullcontext()
+
+
+class _Service(PriceHistoryService):
+    """不連網、不寫檔的回補"""
+
+    def __init__(self, cache_dir):
+        super().__init__(provider=object(), cache_dir=cache_dir)
+        self.calls = []
+
+    def backfill(self, db, symbol, start=None, end=None):
+        self.calls.append((symbol, start, end))
+        if symbol == 'FAIL':
+            raise RuntimeError('TWSE 無回應')
+        return 20
+
+
+def test_backfill_runs_in_worker(tmp_path):
+    service = _Service(str(tmp_path))
+    worker = HistoryBackfillWorker(service)
+    worker._app, worker._db = _App(), _Db()
+
+    job = worker.request_backfill('2330', '2024-01-01')
+    worker.request_backfill('FAIL')
+    assert job['status'] == 'queued' and service.calls == []
+    with pytest.raises(ValueError):
+        worker.request_backfill('../etc')
+
+    worker.run_pending()
+
+    assert service.calls == [('2330', date(2024, 1, 1), None), ('FAIL', None, None)]
+    assert worker.status('2330')['status'] == 'done' and worker.status('2330')['imported'] == 20
+    assert worker.status('FAIL')['status'] == 'error'
+
+
+def test_rebuild_keeps_previous_version(tmp_path):
+    service = PriceHistoryService(provider=object(), cache_dir=str(tmp_path))
+    db = _Db([(date(2024, 1, 2), 10, 11, 9, 10.5, 1000)])
+
+    versions = []
+    for _ in range(3):
+        service.rebuild_cache(db, '2330')
+        with open(service._pointer('2330')) as f:
+            versions.append(f.read().strip())
+
+    kept = sorted(name for name in os.listdir(tmp_path / '2330') if name.startswith('v'))
+    assert kept == sorted(versions[1:])
+    assert float(service.columns('2330')['close'][0]) == 10.5
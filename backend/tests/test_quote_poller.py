@@ -0,0 +1,70 @@
+"""報價補抓：只查詢快取缺少的股票，查不到的代號依退避時間暫停補抓"""
+import contextlib
+
+import pytest
+
+from app.services import quote_poller as poller_module
+from app.services.circuit_breaker import CircuitBreaker
+from app.services.stock_service import stock_service
+
+
+class _App:
+    def app_context(self):
+        return contextlib.nullcontext()
+
+
+class _Db:
+    class session:
+        @staticmethod
+        def rollback():
+            pass
+
+
+@pytest.fixture
+def poller(monkeypatch):
+    requested = []
+
+    def refresh_quotes(symbols, ttl=None):
+        requested.append(list(symbols))
+        return {symbol: {'success': True, 'price': 10} for symbol in symbols if symbol != 'BAD'}
+
+    monkeypatch.setattr(stock_service, 'refresh_quotes', refresh_quotes)
+    monkeypatch.setattr(stock_service.breaker, 'state', CircuitBreaker.CLOSED)
+    monkeypatch.setattr(poller_module.alert_engine, 'evaluate', lambda db, quotes: None)
+    poller = poller_module.QuotePoller(interval=5, miss_backoff=60, miss_backoff_max=100)
+    poller._app, poller._db = _App(), _Db()
+    poller.requested = requested
+    return poller
+
+
+def test_refresh_fetches_only_missing_symbols(poller):
+    poller.request_symbols(['2330', 'BAD', '2330', None])
+    poller.refresh(poller._take_pending())
+
+    assert poller.requested == [['2330', 'BAD']]
+    assert poller.on_demand_runs == 1 and poller.last_run is None
+    assert poller.status()['missing_symbols'] == 1
+
+
+def test_missing_symbols_back_off(poller, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(poller_module.time, 'monotonic', lambda: now[0])
+
+    poller.request_symbols(['BAD'])
+    poller.refresh(poller._take_pending())
+    poller._wake.clear()
+    poller.request_symbols(['BAD'])
+    assert not poller._pending and not poller._wake.is_set()
+
+    # 退避時間每次加倍，最多 miss_backoff_max
+    now[0] += 60
+    poller.request_symbols(['BAD'])
+    poller.refresh(poller._take_pending())
+    assert poller._misses['BAD'] == {'failures': 2, 'retry_at': now[0] + 100}
+
+
+def test_open_breaker_is_not_a_miss(poller, monkeypatch):
+    monkeypatch.setattr(stock_service.breaker, 'state', CircuitBreaker.OPEN)
+    poller.refresh(['BAD'])
+
+    assert poller._misses == {}
@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react';
-import { transactionsAPI, suggestionsAPI, goalsAPI } from '../services/api';
+import { dashboardAPI, ledgerStream } from '../services/api';
 import { PieChart, Pie, Cell, ResponsiveContainer, Tooltip } from 'recharts';
 
 const COLORS = ['#FF6B6B', '#4ECDC4', '#95E1D3', '#F38181', '#AA96DA', '#FCBAD3', '#A8D8EA', '#FFD93D'];
@@ -14,16 +14,74 @@ function Dashboard() {
     loadData();
   }, []);
 
+  // 其他分頁或裝置寫入後，依推播的差異更新本月收支、分類、預算與目標
+  useEffect(() => {
+    return ledgerStream.subscribe({
+      onResync: () => loadData(),
+      onLedger: (event) => {
+        setSummary(prev => {
+          if (!prev) return prev;
+          const month = prev.period.start.slice(0, 7);
+          const totals = event.months.find(m => m.month === month);
+          const changed = new Map(
+            event.categories.filter(c => c.month === month).map(c => [c.category_id, c])
+          );
+          const totalExpense = totals ? totals.expense : prev.total_expense;
+          const breakdown = prev.categories_breakdown
+            .filter(c => !changed.has(c.category_id))
+            .concat([...changed.values()].map(c => ({
+              category_id: c.category_id,
+              category: c.category,
+              icon: c.icon,
+              color: c.color,
+              amount: c.expense
+            })))
+            .filter(c => c.amount > 0)
+            .sort((a, b) => b.amount - a.amount)
+            .map(c => ({
+              ...c,
+              percentage: totalExpense > 0 ? Math.round(c.amount / totalExpense * 1000) / 10 : 0
+            }));
+          const updatedBudgets = new Map(event.budgets.map(b => [b.budget_id, b]));
+          const budgetStatus = prev.budget_status
+            .filter(b => !event.deleted_budgets.includes(b.budget_id))
+            .map(b => updatedBudgets.get(b.budget_id) || b);
+          event.budgets
+            .filter(b => !budgetStatus.some(existing => existing.budget_id === b.budget_id))
+            .forEach(b => budgetStatus.push(b));
+
+          return {
+            ...prev,
+            ...(totals && {
+              total_income: totals.income,
+              total_expense: totals.expense,
+              net: totals.net
+            }),
+            categories_breakdown: breakdown,
+            budget_status: budgetStatus
+          };
+        });
+
+        if (event.goals.length > 0) {
+          setGoals(prev => {
+            const updated = new Map(event.goals.map(g => [g.id, g]));
+            const merged = prev.map(g => updated.get(g.id) || g);
+            event.goals
+              .filter(g => !prev.some(existing => existing.id === g.id))
+              .forEach(g => merged.push(g));
+            return merged.filter(g => g.status === 'in_progress');
+          });
+        }
+      }
+    });
+  }, []);
+
   const loadData = async () => {
     try {
-      const [summaryRes, suggestionsRes, goalsRes] = await Promise.all([
-        transactionsAPI.getSummary(),
-        suggestionsAPI.get(),
-        goalsAPI.getAll()
-      ]);
-      setSummary(summaryRes.data);
-      setSuggestions(suggestionsRes.data.suggestions || []);
-      setGoals(goalsRes.data.filter(g => g.status === 'in_progress'));
+      const res = await dashboardAPI.get();
+      setSummary(res.data.summary);
+      setSuggestions(res.data.suggestions.suggestions || []);
+      setGoals(res.data.goals.filter(g => g.status === 'in_progress'));
     } catch (error) {
       console.error('載入資料失敗:', error);
     } finally {
@@ -37,6 +37,45 @@ function Portfolio() {
     loadData();
   }, []);
 
+  // 訂閱持倉與關注清單的即時報價（SSE），只更新有變動的價格
+  const streamSymbols = [...new Set([
+    ...holdings.filter(h => h.asset_type !== 'cash').map(h => h.symbol),
+    ...watchlist.map(w => w.symbol)
+  ])].sort().join(',');
+
+  useEffect(() => {
+    if (!streamSymbols) return;
+    const source = new EventSource(`${API_BASE}/stream/quotes?symbols=${streamSymbols}`);
+    const applyQuotes = (event) => {
+      const quotes = JSON.parse(event.data);
+      setHoldings(prev => prev.map(h => {
+        const price = quotes[h.symbol]?.price;
+        if (price == null) return h;
+        const marketValue = Math.round(h.quantity * price * 100) / 100;
+        const profit = Math.round((marketValue - h.cost_basis) * 100) / 100;
+        return {
+          ...h,
+          current_price: price,
+          market_value: marketValue,
+          profit,
+          profit_rate: h.cost_basis ? Math.round(profit / h.cost_basis * 10000) / 100 : 0
+        };
+      }));
+      setWatchlist(prev => prev.map(w => {
+        const quote = quotes[w.symbol];
+        if (!quote) return w;
+        return {
+          ...w,
+          current_price: quote.price ?? w.current_price,
+          change: quote.change ?? w.change
+        };
+      }));
+    };
+    source.addEventListener('snapshot', applyQuotes);
+    source.addEventListener('quotes', applyQuotes);
+    return () => source.close();
+  }, [streamSymbols]);
+
   const loadData = async () => {
     setLoading(true);
     try {
@@ -47,4 +47,19 @@ export const suggestionsAPI = {
   get: () => api.get('/suggestions'),
 };
 
+// 財務總覽 API（摘要、預算、目標、建議一次取得）
+export const dashboardAPI = {
+  get: () => api.get('/dashboard'),
+};
+
+// 帳本變動推播（SSE）：寫入後推送分類金額、預算使用率與目標進度的差異
+export const ledgerStream = {
+  subscribe: ({ onLedger, onResync }) => {
+    const source = new EventSource(`${API_BASE_URL}/stream/ledger`);
+    source.addEventListener('ledger', (event) => onLedger(JSON.parse(event.data)));
+    source.addEventListener('resync', () => onResync());
+    return () => source.close();
+  },
+};
+
 export default api;
\ No newline at end of file